@@ -3,10 +3,14 @@
 from __future__ import annotations
 
 import sys
+import time
 from pathlib import Path
 
 __version__ = "0.1.0"
 
+# パッケージの読み込み開始時刻（起動時間の計測の起点）
+IMPORT_STARTED = time.perf_counter()
+
 
 def _configure_pycache_prefix() -> bool:
     prefix = Path.home() / ".cache" / "mcp-brain" / "pycache"
@@ -0,0 +1,216 @@
+"""近似最近傍探索（ANN）バックエンド
+
+知識が数万件規模になると全件スコアリングは線形に遅くなるため、
+純NumPyの転置ファイル（IVF）インデックスで候補を絞り込んでから
+厳密なコサイン類似度で順位付けする。
+
+VectorStoreの行番号は削除後も安定なので、各行の所属リストを
+行と並んだint配列として保持し、追加・削除を逐次反映する。
+"""
+
+import logging
+import math
+from pathlib import Path
+from typing import Protocol
+
+import numpy as np
+
+from mcp_brain.vector_store import VectorStore, normalize, normalize_rows
+
+logger = logging.getLogger(__name__)
+
+
+class AnnIndex(Protocol):
+    """ANNバックエンドのインターフェース"""
+
+    def fit(self, store: VectorStore) -> None:
+        """ストア全体から構築"""
+        ...
+
+    def add(self, row: int, vector: np.ndarray) -> None:
+        """行を追加（上書き）"""
+        ...
+
+    def remove(self, row: int) -> None:
+        """行を削除"""
+        ...
+
+    def needs_refit(self, count: int) -> bool:
+        """件数の変化で再構築が必要か"""
+        ...
+
+    def top_k(
+        self,
+        store: VectorStore,
+        query: np.ndarray,
+        top_k: int,
+        mask: np.ndarray | None = None,
+    ) -> list[tuple[str, float]]:
+        """近似上位k件"""
+        ...
+
+    def save(self, path: Path, store: VectorStore) -> None:
+        """ファイルに保存"""
+        ...
+
+    def load(self, path: Path, store: VectorStore) -> bool:
+        """ファイルから復元（成功したらTrue）"""
+        ...
+
+
+class IVFIndex:
+    """球面k-meansによる転置ファイルインデックス
+
+    Args:
+        nprobe: 検索時に調べるリスト数
+        iterations: k-meansの反復回数
+        sample_size: 学習に使う最大ベクトル数
+        seed: 乱数シード
+    """
+
+    def __init__(
+        self,
+        nprobe: int = 8,
+        iterations: int = 10,
+        sample_size: int = 20000,
+        seed: int = 0,
+    ) -> None:
+        self.nprobe = nprobe
+        self.iterations = iterations
+        self.sample_size = sample_size
+        self.seed = seed
+        self.centroids = np.zeros((0, 0), dtype=np.float32)
+        # 行番号 -> 所属リスト（-1は未所属）
+        self.assignments = np.zeros(0, dtype=np.int32)
+        self.trained_count = 0
+
+    @property
+    def nlist(self) -> int:
+        return self.centroids.shape[0]
+
+    def fit(self, store: VectorStore) -> None:
+        """ストア全体でk-meansを学習して全行を割り当てる"""
+        rows = np.flatnonzero(store.valid)
+        if rows.size == 0:
+            self.centroids = np.zeros((0, store.dim), dtype=np.float32)
+            self.assignments = np.zeros(0, dtype=np.int32)
+            self.trained_count = 0
+            return
+
+        rng = np.random.default_rng(self.seed)
+        sample = rows
+        if rows.size > self.sample_size:
+            sample = rng.choice(rows, self.sample_size, replace=False)
+        data = store.matrix[sample]
+
+        nlist = max(1, min(int(math.sqrt(rows.size)), len(data)))
+        centroids = data[rng.choice(len(data), nlist, replace=False)]
+        for _ in range(self.iterations):
+            labels = np.argmax(data @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, data)
+            counts = np.bincount(labels, minlength=nlist)
+            # 空クラスタは元の重心を維持
+            empty = counts == 0
+            sums[empty] = centroids[empty]
+            centroids = normalize_rows(sums)
+
+        self.centroids = centroids
+        self.assignments = np.full(store.matrix.shape[0], -1, dtype=np.int32)
+        self.assignments[rows] = np.argmax(store.matrix[rows] @ centroids.T, axis=1)
+        self.trained_count = int(rows.size)
+        logger.info("IVF index trained: %d vectors, %d lists", rows.size, nlist)
+
+    def needs_refit(self, count: int) -> bool:
+        """学習時から件数が大きく変わったら再学習する"""
+        if self.nlist == 0:
+            return count > 0
+        return count > 4 * self.trained_count or count * 4 < self.trained_count
+
+    def add(self, row: int, vector: np.ndarray) -> None:
+        """最も近い重心のリストに割り当て"""
+        if self.nlist == 0:
+            return
+        if row >= self.assignments.shape[0]:
+            grown = np.full(max(row + 1, self.assignments.shape[0] * 2), -1, np.int32)
+            grown[: self.assignments.shape[0]] = self.assignments
+            self.assignments = grown
+        self.assignments[row] = int(np.argmax(self.centroids @ normalize(vector)))
+
+    def remove(self, row: int) -> None:
+        """リストから外す"""
+        if row < self.assignments.shape[0]:
+            self.assignments[row] = -1
+
+    def top_k(
+        self,
+        store: VectorStore,
+        query: np.ndarray,
+        top_k: int,
+        mask: np.ndarray | None = None,
+    ) -> list[tuple[str, float]]:
+        """近い重心のリストに属する行だけをスコアリング"""
+        if self.nlist == 0 or len(store) == 0 or top_k <= 0:
+            return []
+
+        q = normalize(query)
+        nprobe = min(self.nprobe, self.nlist)
+        probes = np.argpartition(-(self.centroids @ q), nprobe - 1)[:nprobe]
+        size = min(self.assignments.shape[0], store.matrix.shape[0])
+        candidate = np.isin(self.assignments[:size], probes) & store.valid[:size]
+        if mask is not None:
+            candidate &= mask[:size]
+        rows = np.flatnonzero(candidate)
+        if rows.size == 0:
+            return []
+
+        scores = store.matrix[rows] @ q
+        k = min(top_k, rows.size)
+        if k < rows.size:
+            idx = np.argpartition(-scores, k - 1)[:k]
+        else:
+            idx = np.arange(rows.size)
+        idx = idx[np.argsort(-scores[idx], kind="stable")]
+        return [(store.names[rows[i]], float(scores[i])) for i in idx]
+
+    def save(self, path: Path, store: VectorStore) -> None:
+        """重心と知識名ごとの所属リストを保存（アトミック書き込み）"""
+        rows = np.flatnonzero(store.valid[: self.assignments.shape[0]])
+        names = np.array([store.names[r] for r in rows], dtype=str)
+        tmp = path.with_suffix(".tmp")
+        with tmp.open("wb") as f:
+            np.savez(
+                f,
+                centroids=self.centroids,
+                names=names,
+                lists=self.assignments[rows],
+                trained_count=np.array(self.trained_count),
+            )
+        tmp.rename(path)
+
+    def load(self, path: Path, store: VectorStore) -> bool:
+        """保存済みの重心・割り当てを現在のストアの行に対応付けて復元"""
+        if not path.exists():
+            return False
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                centroids = data["centroids"]
+                names = data["names"]
+                lists = data["lists"]
+                trained_count = int(data["trained_count"])
+        except Exception:
+            return False
+        if centroids.ndim != 2 or centroids.shape[1] != store.dim:
+            return False
+
+        self.centroids = centroids.astype(np.float32)
+        self.trained_count = trained_count
+        self.assignments = np.full(store.matrix.shape[0], -1, dtype=np.int32)
+        saved = dict(zip(names.tolist(), lists.tolist(), strict=True))
+        for row in np.flatnonzero(store.valid):
+            name = store.names[row]
+            if name in saved:
+                self.assignments[row] = saved[name]
+            else:
+                self.add(int(row), store.matrix[row])
+        return True
@@ -0,0 +1,118 @@
+"""クエリエンコードのマイクロバッチ
+
+複数のエージェントやフックから同時に届いたsearchは、それぞれ1件ずつ
+model.encode を呼ぶとCPUを奪い合う。短い待ち時間（window）の間に届いた
+クエリを最大max_batch件までまとめて1回の順伝播でエンコードし、
+呼び出し元ごとのFutureに結果を返す。
+
+- 単発のクエリの待ち時間は最大windowだけ増える
+- エンコード中に届いたクエリは次のバッチにまとまる
+- 同じバッチ内の同一テキストは1回だけエンコードする
+"""
+
+import logging
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import Future
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class EncodeBatcher:
+    """同時に届いたエンコード要求をまとめて処理するワーカー
+
+    Args:
+        encode: テキストのリストをまとめてエンコードする関数（行ごとのベクトル）
+        max_batch: 1回にまとめる最大件数
+        window: 最初の要求からバッチを締め切るまでの秒数
+        idle_exit: 要求がこの秒数なければワーカースレッドを終了（次の要求で再開）
+    """
+
+    def __init__(
+        self,
+        encode: Callable[[list[str]], np.ndarray],
+        max_batch: int = 16,
+        window: float = 0.005,
+        idle_exit: float = 30.0,
+    ) -> None:
+        self._encode = encode
+        self.max_batch = max_batch
+        self.window = window
+        self.idle_exit = idle_exit
+
+        self._cond = threading.Condition()
+        # (テキスト, 結果, 受付時刻)
+        self._pending: list[tuple[str, Future[np.ndarray], float]] = []
+        self._thread: threading.Thread | None = None
+
+        self.requests = 0
+        self.batches = 0
+        self.largest_batch = 0
+
+    def encode(self, text: str) -> np.ndarray:
+        """1件をエンコード（同時に届いた要求とまとめて処理されるまで待つ）"""
+        future: Future[np.ndarray] = Future()
+        with self._cond:
+            self._pending.append((text, future, time.monotonic()))
+            self.requests += 1
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="brain-encode-batch", daemon=True
+                )
+                self._thread.start()
+            self._cond.notify_all()
+        return future.result()
+
+    def stats(self) -> dict[str, object]:
+        """要求数・バッチ数・平均/最大バッチサイズ"""
+        with self._cond:
+            return {
+                "requests": self.requests,
+                "batches": self.batches,
+                "mean_batch": (
+                    round(self.requests / self.batches, 2) if self.batches else None
+                ),
+                "largest_batch": self.largest_batch,
+            }
+
+    def _run(self) -> None:
+        """締め切り → まとめてエンコード → 結果を返す を繰り返す"""
+        while True:
+            with self._cond:
+                if not self._cond.wait_for(lambda: self._pending, self.idle_exit):
+                    self._thread = None
+                    return
+                self._wait_window()
+                batch = self._pending[: self.max_batch]
+                del self._pending[: self.max_batch]
+                self.batches += 1
+                self.largest_batch = max(self.largest_batch, len(batch))
+
+            self._process(batch)
+
+    def _wait_window(self) -> None:
+        """最初の要求からwindow秒経つか満杯になるまで待つ（ロック保持中に呼ぶ）"""
+        deadline = self._pending[0][2] + self.window
+        while len(self._pending) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            self._cond.wait(remaining)
+
+    def _process(self, batch: list[tuple[str, Future[np.ndarray], float]]) -> None:
+        """バッチをエンコードして各Futureに結果（または例外）を設定"""
+        texts = list(dict.fromkeys(text for text, _, _ in batch))
+        try:
+            vectors = self._encode(texts)
+        except Exception as e:
+            logger.warning("Batch encode failed (%d queries): %s", len(texts), e)
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+
+        by_text = dict(zip(texts, vectors, strict=True))
+        for text, future, _ in batch:
+            future.set_result(by_text[text])
@@ -0,0 +1,102 @@
+"""環境変数による設定
+
+各フィールドは `MCP_BRAIN_<フィールド名大文字>` 環境変数で上書きできる。
+（例: `MCP_BRAIN_SEARCH_MODE=ann`）
+"""
+
+import logging
+import os
+import re
+import socket
+import uuid
+from pathlib import Path
+from typing import Literal
+
+from pydantic import BaseModel, Field
+
+logger = logging.getLogger(__name__)
+
+ENV_PREFIX = "MCP_BRAIN_"
+
+
+def machine_id() -> str:
+    """この端末の識別子（利用記録のファイル名用、初回に生成して保存）
+
+    <ホスト名>-<ランダムな8桁>。ホスト名が同じ端末があっても衝突しない。
+    """
+    path = Path.home() / ".cache" / "mcp-brain" / "machine_id"
+    try:
+        existing = path.read_text(encoding="utf-8").strip()
+    except OSError:
+        existing = ""
+    if existing:
+        return existing
+    host = re.sub(r"[^a-z0-9-]+", "-", socket.gethostname().lower()).strip("-")
+    value = f"{host or 'host'}-{uuid.uuid4().hex[:8]}"
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(value, encoding="utf-8")
+    except OSError as e:
+        logger.warning("Failed to save machine id: %s", e)
+    return value
+
+
+class Settings(BaseModel):
+    """サーバー設定"""
+
+    model_name: str = Field(
+        default="cl-nagoya/ruri-v3-30m",
+        min_length=1,
+        description="Embeddingモデル（変更時は旧モデルで応答しつつ裏で再構築）",
+    )
+    model_idle_timeout: float = Field(
+        default=1800,
+        ge=0,
+        description="モデルを使わない状態がこの秒数続いたら解放（0で解放しない）",
+    )
+    model_warm_up: bool = Field(
+        default=True, description="起動後にモデルをバックグラウンドで読み込む"
+    )
+    encoder_backend: Literal["torch", "onnx-int8"] = Field(
+        default="torch",
+        description="エンコーダ（torch=PyTorch / onnx-int8=ONNX Runtimeのint8量子化）",
+    )
+    search_mode: Literal["exact", "ann", "auto"] = Field(
+        default="auto",
+        description="検索方式（exact=全件 / ann=IVF近似 / auto=件数で切り替え）",
+    )
+    search_retrieval: Literal["vector", "hybrid"] = Field(
+        default="vector",
+        description="vector=ベクトル検索のみ / hybrid=BM25とRRFで融合（オプトイン）",
+    )
+    ann_threshold: int = Field(
+        default=5000, ge=1, description="autoで近似検索に切り替える件数"
+    )
+    query_batch_size: int = Field(
+        default=16,
+        ge=1,
+        description="まとめてエンコードするクエリの最大件数",
+    )
+    query_batch_window: float = Field(
+        default=0.005, ge=0, description="クエリをまとめるために待つ時間（秒）"
+    )
+    project_cache_ttl: float = Field(
+        default=60, ge=0, description="~/pj のプロジェクト一覧をキャッシュする秒数"
+    )
+    auto_resolve_names: bool = Field(
+        default=False,
+        description="get/updateで紛れのない打ち間違いの知識名を自動で解決する",
+    )
+    git_sync_debounce: float = Field(
+        default=1.0, ge=0, description="変更をまとめてコミットするまでの待ち時間（秒）"
+    )
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        """環境変数から読み込み（未設定・空文字はデフォルト値）"""
+        values = {}
+        for field in cls.model_fields:
+            raw = os.environ.get(ENV_PREFIX + field.upper(), "").strip()
+            if raw:
+                values[field] = raw
+        return cls.model_validate(values)
@@ -1,13 +1,30 @@
 """ruri-v3によるEmbeddingインデックス管理"""
 
 import logging
+import threading
+from collections.abc import Sequence
 from pathlib import Path
+from typing import TYPE_CHECKING
 
 import numpy as np
-from sentence_transformers import SentenceTransformer
 
-from mcp_brain.index_cache import IndexCache
+from mcp_brain.ann import AnnIndex, IVFIndex
+from mcp_brain.batcher import EncodeBatcher
+from mcp_brain.encoder import BACKENDS, load_encoder
+from mcp_brain.index_cache import CACHE_WRITE_LOCK, IndexCache, text_digest
+from mcp_brain.metadata import Filter, MetadataColumns
+from mcp_brain.model_lifecycle import ModelLifecycle
 from mcp_brain.models import Knowledge
+from mcp_brain.query_cache import LRUCache, normalize_query
+from mcp_brain.similarity_graph import SimilarityGraph
+from mcp_brain.vector_store import VectorStore, normalize
+
+if TYPE_CHECKING:
+    from datetime import date
+
+    from sentence_transformers import SentenceTransformer
+
+    from mcp_brain.usage import UsageJournal
 
 logger = logging.getLogger(__name__)
 
@@ -15,84 +32,230 @@ logger = logging.getLogger(__name__)
 QUERY_PREFIX = "クエリ: "
 PASSAGE_PREFIX = "文章: "
 
+# 検索モード: exact=全件スコアリング / ann=IVF近似 / auto=件数で切り替え
+SEARCH_MODES = ("exact", "ann", "auto")
+
 
 class EmbeddingIndex:
     """セマンティック検索用のインデックス"""
 
     def __init__(
-        self, model_name: str = "cl-nagoya/ruri-v3-30m", cache_dir: Path | None = None
+        self,
+        model_name: str = "cl-nagoya/ruri-v3-30m",
+        cache_dir: Path | None = None,
+        query_cache_size: int = 256,
+        search_mode: str = "auto",
+        ann_threshold: int = 5000,
+        backend: str = "torch",
+        model_idle_timeout: float = 0,
+        query_batch_size: int = 16,
+        query_batch_window: float = 0.005,
+        usage: "UsageJournal | None" = None,
     ) -> None:
+        if search_mode not in SEARCH_MODES:
+            raise ValueError(
+                f"Invalid search_mode '{search_mode}': must be one of {SEARCH_MODES}"
+            )
+        if backend not in BACKENDS:
+            raise ValueError(f"Invalid backend '{backend}': must be one of {BACKENDS}")
         self.model_name = model_name
-        self.model: SentenceTransformer | None = None
+        # エンコーダのバックエンド（torch / onnx-int8）
+        self.backend = backend
+        # モデルの遅延読み込み・ウォームアップ・アイドル時の解放
+        self.model_lifecycle = ModelLifecycle(
+            lambda: load_encoder(self.model_name, self.backend),
+            name=model_name,
+            idle_timeout=model_idle_timeout,
+        )
         self.embeddings: dict[str, np.ndarray] = {}
         self.knowledge_texts: dict[str, str] = {}
+        # 知識名 -> 検索用テキストのダイジェスト（文書単位のキャッシュキー）
+        self.digests: dict[str, str] = {}
         self.cache_dir = cache_dir
+        # 検索用の正規化済み行列（embeddingsと常に同期）
+        self.store = VectorStore()
+        # プロジェクトごとのパーティション: プロジェクト名 -> 知識名の集合
+        self.partitions: dict[str, set[str]] = {}
+        # パーティション -> 行番号の配列（世代が変わったら作り直す）
+        self._partition_rows: dict[str, np.ndarray] = {}
+        # 行に揃えたメタデータ列（絞り込み検索のマスク用）
+        self.metadata = MetadataColumns()
+        # 最終利用日の参照先（知識ファイルのlast_usedより新しければそちら）
+        self.usage = usage
+        # 利用記録の更新ごとに増える番号（絞り込み付き結果キャッシュの無効化用）
+        self.usage_generation = 0
+        # クエリベクトル: (model_name, 正規化クエリ) -> ベクトル
+        self.query_cache = LRUCache(query_cache_size)
+        # 検索結果: (generation, 正規化クエリ, top_k) -> 結果
+        self.result_cache = LRUCache(query_cache_size)
+        # 同時に届いたクエリのエンコードをまとめる
+        self.query_batcher = EncodeBatcher(
+            self._encode_queries, max_batch=query_batch_size, window=query_batch_window
+        )
+        # インデックス変更ごとに増える世代番号（結果キャッシュの無効化用）
+        self.generation = 0
+        # 近似最近傍インデックス（小規模コーパスでは使わない）
+        self.search_mode = search_mode
+        self.ann_threshold = ann_threshold
+        self.ann: AnnIndex | None = None
+        # 文書同士のk近傍グラフ（find_similar用、モデル推論不要）
+        self.graph = SimilarityGraph()
+        self._graph_thread: threading.Thread | None = None
+        # インデックス状態の保護（検索は並行、変更は短時間だけ排他）
+        self._lock = threading.RLock()
+
+    @property
+    def model(self) -> "SentenceTransformer | None":
+        """読み込み済みのモデル（未読み込み・解放済みならNone）"""
+        return self.model_lifecycle.model
 
-    def _load_model(self) -> None:
-        """モデルを遅延ロード"""
-        if self.model is None:
-            self.model = SentenceTransformer(self.model_name)
+    @model.setter
+    def model(self, model: "SentenceTransformer | None") -> None:
+        self.model_lifecycle.model = model
+
+    def warm_up(self) -> threading.Thread:
+        """モデルをバックグラウンドで読み込んでおく"""
+        return self.model_lifecycle.warm_up()
 
     def _knowledge_to_text(self, knowledge: Knowledge) -> str:
         """知識を検索用テキストに変換"""
         return f"{knowledge.name}\n{knowledge.description}\n{knowledge.content}"
 
+    def _encode_passages(self, texts: list[str]) -> np.ndarray:
+        """文章をまとめてエンコード"""
+        with self.model_lifecycle.use() as model:
+            return model.encode(
+                [PASSAGE_PREFIX + t for t in texts],
+                convert_to_numpy=True,
+                show_progress_bar=False,
+            )
+
     def build(self, items: list[Knowledge]) -> None:
-        """全知識からインデックスを構築"""
+        """全知識からインデックスを構築
+
+        キャッシュがあれば文書ごとにダイジェストを比較し、
+        新規・変更された文書だけをエンコードする（削除された文書は捨てる）。
+        """
         if not items:
-            self.embeddings = {}
-            self.knowledge_texts = {}
+            with self._lock:
+                self.embeddings = {}
+                self.knowledge_texts = {}
+                self.digests = {}
+                self.partitions = {}
+                self.store.clear()
+                self.metadata.clear()
+                self.graph.invalidate()
+                self.ann = None
+                self._bump_generation()
             return
 
-        # knowledge_textsを設定
-        for knowledge in items:
-            text = self._knowledge_to_text(knowledge)
-            self.knowledge_texts[knowledge.name] = text
+        # knowledge_textsとダイジェストを計算
+        texts = {k.name: self._knowledge_to_text(k) for k in items}
+        digests = {name: text_digest(text) for name, text in texts.items()}
 
-        # キャッシュチェック
+        # キャッシュチェック（文書単位）
+        snapshot = None
         if self.cache_dir:
-            cache = IndexCache(self.cache_dir)
-            cached = cache.load()
-            if cached:
-                logger.info("Using cached embeddings")
-                self.embeddings = cached
-                return
+            snapshot = self._cache().load_snapshot()
+        cached = snapshot.embeddings() if snapshot else {}
+        cached_digests = snapshot.digests if snapshot else {}
 
-        # 同期ビルド
-        self._load_model()
-        assert self.model is not None
+        stale = [
+            name
+            for name, digest in digests.items()
+            if cached_digests.get(name) != digest or name not in cached
+        ]
+        removed = cached.keys() - digests.keys()
 
-        texts = [PASSAGE_PREFIX + self.knowledge_texts[k.name] for k in items]
-        names = [k.name for k in items]
+        # 新規・変更分のみ同期エンコード
+        encoded: dict[str, np.ndarray] = {}
+        if stale:
+            vectors = self._encode_passages([texts[n] for n in stale])
+            encoded = dict(zip(stale, vectors, strict=True))
+            if snapshot and snapshot.matrix.shape[1] != vectors.shape[1]:
+                # 次元の異なるキャッシュ（別モデル）は使わない
+                logger.warning("Index cache dimension mismatch, re-encoding all")
+                snapshot, removed = None, cached.keys()
+                stale = list(digests)
+                vectors = self._encode_passages([texts[n] for n in stale])
+                encoded = dict(zip(stale, vectors, strict=True))
 
-        vectors = self.model.encode(
-            texts, convert_to_numpy=True, show_progress_bar=False
+        with self._lock:
+            self.knowledge_texts = texts
+            self.digests = digests
+            self.partitions = {}
+            for k in items:
+                self.partitions.setdefault(k.project, set()).add(k.name)
+            if snapshot is not None:
+                # 正規化済みで保存したキャッシュの行列をそのまま使い、
+                # 差分だけ反映する（ほぼゼロコピー）
+                self.store.attach(snapshot.matrix, snapshot.names)
+                for name in removed:
+                    self.store.remove(name)
+                for name, vector in encoded.items():
+                    self.store.upsert(name, vector)
+            else:
+                # 知識の順序を保つ
+                self.store.reset(
+                    {name: encoded.get(name, cached.get(name)) for name in digests}
+                )
+            # 正規化済みベクトル（ストアの行ビュー）
+            self.embeddings = {name: self.store.get(name) for name in digests}
+            self.metadata.clear()
+            for k in items:
+                self._set_metadata(k)
+            self.graph.invalidate()
+            ann_fitted = self._refresh_ann()
+            self._bump_generation()
+        logger.info(
+            "Index built: %d reused, %d encoded, %d dropped",
+            len(self.embeddings) - len(stale),
+            len(stale),
+            len(removed),
         )
-        self.embeddings = dict(zip(names, vectors, strict=True))
 
-        # キャッシュに保存
-        if self.cache_dir:
-            IndexCache(self.cache_dir).save(self.embeddings)
+        # 変更があればキャッシュに保存
+        if stale or removed:
+            self._save_cache()
+        elif ann_fitted:
+            self._save_ann()
 
-    def rebuild(self, items: list[Knowledge], model_name: str | None = None) -> None:
-        """再インデックス（モデル切り替え対応）"""
-        if model_name and model_name != self.model_name:
-            self.model_name = model_name
-            self.model = None  # 次回ロード時に新モデルをロード
-        self.build(items)
+    def with_model(self, model_name: str) -> "EmbeddingIndex":
+        """同じ設定で別モデルの空のインデックスを作る（モデル移行用）"""
+        return EmbeddingIndex(
+            model_name,
+            cache_dir=self.cache_dir,
+            query_cache_size=self.query_cache.maxsize,
+            search_mode=self.search_mode,
+            ann_threshold=self.ann_threshold,
+            backend=self.backend,
+            model_idle_timeout=self.model_lifecycle.idle_timeout,
+            query_batch_size=self.query_batcher.max_batch,
+            query_batch_window=self.query_batcher.window,
+            usage=self.usage,
+        )
 
     def add(self, knowledge: Knowledge) -> None:
         """知識をインデックスに追加"""
-        self._load_model()
-        assert self.model is not None
-
         text = self._knowledge_to_text(knowledge)
-        self.knowledge_texts[knowledge.name] = text
-        vector = self.model.encode(
-            PASSAGE_PREFIX + text, convert_to_numpy=True, show_progress_bar=False
+        vector = self._encode_passages([text])[0]
+        with self._lock:
+            self.knowledge_texts[knowledge.name] = text
+            self.digests[knowledge.name] = text_digest(text)
+            self._unassign_project(knowledge.name)
+            self.partitions.setdefault(knowledge.project, set()).add(knowledge.name)
+            row = self.store.upsert(knowledge.name, vector)
+            self.embeddings[knowledge.name] = self.store.matrix[row]
+            self._set_metadata(knowledge)
+            self.graph.upsert(self.store, knowledge.name)
+            if self.ann is not None:
+                self.ann.add(row, vector)
+            ann_fitted = self._refit_ann_if_needed()
+            self._bump_generation()
+        self._append_cache(
+            upserts={knowledge.name: (normalize(vector), text_digest(text))},
+            ann_fitted=ann_fitted,
         )
-        self.embeddings[knowledge.name] = vector
-        self._save_cache()
 
     def update(self, knowledge: Knowledge) -> None:
         """知識のインデックスを更新"""
@@ -100,38 +263,340 @@ class EmbeddingIndex:
 
     def remove(self, name: str) -> None:
         """知識をインデックスから削除"""
-        self.embeddings.pop(name, None)
-        self.knowledge_texts.pop(name, None)
-        self._save_cache()
+        self.remove_many([name])
+
+    def remove_many(self, names: list[str]) -> None:
+        """複数の知識をまとめて削除（キャッシュの書き込みは1回）"""
+        with self._lock:
+            for name in names:
+                self.embeddings.pop(name, None)
+                self.knowledge_texts.pop(name, None)
+                self.digests.pop(name, None)
+                self._unassign_project(name)
+                row = self.store.row_of(name)
+                self.store.remove(name)
+                self.graph.remove(self.store, name)
+                if row is not None and self.ann is not None:
+                    self.ann.remove(row)
+            ann_fitted = self._refit_ann_if_needed()
+            self._bump_generation()
+        self._append_cache(deletes=names, ann_fitted=ann_fitted)
+
+    def mark_used(self, name: str, day: "date") -> None:
+        """最終利用日の列を更新（モデル推論・キャッシュ書き込みなし）"""
+        with self._lock:
+            row = self.store.row_of(name)
+            if row is not None:
+                self.metadata.touch(row, day)
+                self.usage_generation += 1
+
+    def _set_metadata(self, knowledge: Knowledge) -> None:
+        """知識の行にメタデータを書き込む（ロック保持中に呼ぶ）"""
+        row = self.store.row_of(knowledge.name)
+        if row is not None:
+            last_used = self.usage.last_used(knowledge.name) if self.usage else None
+            self.metadata.set(row, knowledge, last_used)
+
+    def _filter_mask(self, filters: tuple[Filter, ...]) -> np.ndarray | None:
+        """絞り込み条件のマスク（条件なしならNone、ロック保持中に呼ぶ）"""
+        if not filters:
+            return None
+        return self.metadata.mask(filters, self.store.matrix.shape[0])
+
+    def _unassign_project(self, name: str) -> None:
+        """知識をパーティションから外す（空になったパーティションは捨てる）"""
+        for project, names in list(self.partitions.items()):
+            if name in names:
+                names.discard(name)
+                if not names:
+                    del self.partitions[project]
+                return
+
+    def _rows_of_project(self, project: str) -> np.ndarray:
+        """パーティションの行番号（ロック保持中に呼ぶ）"""
+        rows = self._partition_rows.get(project)
+        if rows is None:
+            names = self.partitions.get(project, set())
+            rows = np.sort(
+                np.fromiter(
+                    (self.store.row_of(n) for n in names),
+                    dtype=np.intp,
+                    count=len(names),
+                )
+            )
+            self._partition_rows[project] = rows
+        return rows
+
+    def _bump_generation(self) -> None:
+        """世代を進めて古い検索結果キャッシュを無効化"""
+        self.generation += 1
+        self.result_cache.clear()
+        self._partition_rows.clear()
+
+    def similar(self, name: str, top_k: int = 5) -> list[tuple[str, float]]:
+        """保存済みベクトルから類似文書を取得（モデル推論なし）
+
+        Returns:
+            (name, score) のリスト（自分自身を除く、スコア降順）
+        """
+        return self.similar_many([name], top_k=top_k).get(name, [])
+
+    def similar_many(
+        self, names: list[str], top_k: int = 5
+    ) -> dict[str, list[tuple[str, float]]]:
+        """複数文書の類似文書をまとめて取得（モデル推論なし）
+
+        Returns:
+            知識名 -> (name, score) のリスト。インデックスにない名前は含まない。
+        """
+        with self._lock:
+            present = [n for n in dict.fromkeys(names) if n in self.store]
+            if not present:
+                return {}
+            if not self.graph.ready:
+                # 全件の構築（O(N²)）はバックグラウンドで行い、それまでは直接計算
+                self.start_graph_build()
+
+            results: dict[str, list[tuple[str, float]]] = {}
+            for name in present:
+                neighbors = self.graph.get(name, top_k) if self.graph.ready else None
+                if neighbors is None:
+                    # グラフ構築前・保持数を超える件数は行列から直接計算
+                    vector = self.store.get(name)
+                    assert vector is not None
+                    ranked = self.store.top_k(vector, top_k + 1)
+                    neighbors = [(n, s) for n, s in ranked if n != name][:top_k]
+                results[name] = neighbors
+            return results
+
+    def start_graph_build(self) -> threading.Thread | None:
+        """k近傍グラフを別スレッドで構築（構築済み・構築中ならNone）"""
+        with self._lock:
+            if self.graph.ready or (
+                self._graph_thread is not None and self._graph_thread.is_alive()
+            ):
+                return None
+            thread = threading.Thread(
+                target=self.build_graph, name="similarity-graph", daemon=True
+            )
+            self._graph_thread = thread
+            thread.start()
+            return thread
+
+    def build_graph(self) -> None:
+        """k近傍グラフを構築して差し替える
+
+        行列の複製に対してロック外で計算するので、構築中も検索・変更は止まらない。
+        構築中にインデックスが変わった場合は複製を取り直して作り直す。
+        """
+        while True:
+            with self._lock:
+                if self.graph.ready:
+                    return
+                generation = self.generation
+                store = self.store.copy()
+            graph = SimilarityGraph(k=self.graph.k, block_size=self.graph.block_size)
+            graph.build(store)
+            with self._lock:
+                if self.generation == generation:
+                    # 複製と行の配置が同じなので、以降は元のストアで差分更新できる
+                    self.graph = graph
+                    return
+
+    def _wants_ann(self) -> bool:
+        """現在の件数・モードで近似検索を使うか"""
+        if self.search_mode == "ann":
+            return len(self.store) > 0
+        if self.search_mode == "auto":
+            return len(self.store) >= self.ann_threshold
+        return False
+
+    def _refit_ann_if_needed(self) -> bool:
+        """件数の変化に応じてANNインデックスを作成・再学習・破棄
+
+        Returns:
+            再学習した場合True（保存が必要）
+        """
+        if not self._wants_ann():
+            self.ann = None
+        elif self.ann is None or self.ann.needs_refit(len(self.store)):
+            ann = IVFIndex()
+            ann.fit(self.store)
+            self.ann = ann
+            return True
+        return False
+
+    def _refresh_ann(self) -> bool:
+        """ANNインデックスを保存済みファイルから復元または再学習（不要なら破棄）
+
+        Returns:
+            再学習した場合True（保存が必要）
+        """
+        if not self._wants_ann():
+            self.ann = None
+            return False
+
+        ann = IVFIndex()
+        if (
+            self.cache_dir
+            and ann.load(self._cache().ann_path, self.store)
+            and not ann.needs_refit(len(self.store))
+        ):
+            self.ann = ann
+            return False
+
+        ann.fit(self.store)
+        self.ann = ann
+        return True
+
+    def _cache(self) -> IndexCache:
+        """このモデルのキャッシュ"""
+        assert self.cache_dir is not None
+        return IndexCache(self.cache_dir, self.model_name)
 
     def _save_cache(self) -> None:
-        """キャッシュに保存"""
-        if self.cache_dir and self.embeddings:
-            IndexCache(self.cache_dir).save(self.embeddings)
+        """キャッシュに保存（スナップショットを取ってからロック外で書き込む）"""
+        if not self.cache_dir:
+            return
+        with self._lock:
+            # ストアの行ビューは後続の更新で書き換わるのでコピーを取る
+            embeddings = {name: v.copy() for name, v in self.embeddings.items()}
+            digests = dict(self.digests)
+        if embeddings:
+            self._cache().save(embeddings, digests)
+            self._save_ann()
+
+    def _append_cache(
+        self,
+        upserts: dict[str, tuple[np.ndarray, str]] | None = None,
+        deletes: list[str] | None = None,
+        ann_fitted: bool = False,
+    ) -> None:
+        """変更分だけを差分ログに追記（必要ならスナップショットに畳み込む）
 
-    def search(self, query: str, top_k: int = 10) -> list[tuple[str, float]]:
+        ANNインデックスは読み込み時に未割り当ての行を補うので、
+        再学習したときだけ保存する。
+        """
+        if not self.cache_dir:
+            return
+        cache = self._cache()
+        if not cache.append(upserts, deletes) or cache.needs_compaction():
+            self._save_cache()
+        elif ann_fitted:
+            self._save_ann()
+
+    def _save_ann(self) -> None:
+        """ANNインデックスをキャッシュの隣に保存"""
+        with self._lock, CACHE_WRITE_LOCK:
+            if self.cache_dir and self.ann is not None:
+                self.ann.save(self._cache().ann_path, self.store)
+
+    def _result_key(
+        self, normalized: str, top_k: int, filters: tuple[Filter, ...]
+    ) -> tuple:
+        """検索結果キャッシュのキー（絞り込み付きは利用記録の更新でも無効化）"""
+        if not filters:
+            return (self.generation, normalized, top_k)
+        return (self.generation, normalized, top_k, filters, self.usage_generation)
+
+    def search(
+        self, query: str, top_k: int = 10, filters: Sequence[Filter] = ()
+    ) -> list[tuple[str, float]]:
         """セマンティック検索
 
+        Args:
+            query: クエリ
+            top_k: 返す件数
+            filters: メタデータの絞り込み条件（上位k件の選択前にマスクとして適用）
+
         Returns:
             (name, score) のリスト（スコア降順）
         """
-        if not self.embeddings:
+        if not self.store:
             return []
 
-        self._load_model()
-        assert self.model is not None
+        normalized = normalize_query(query)
+        filters = tuple(filters)
+        key = self._result_key(normalized, top_k, filters)
+        cached = self.result_cache.get(key)
+        if cached is not None:
+            return list(cached)
 
-        query_vector = self.model.encode(
-            QUERY_PREFIX + query, convert_to_numpy=True, show_progress_bar=False
-        )
+        # エンコードはロック外（変更処理を待たせない）
+        query_vector = self._encode_query(normalized)
+
+        with self._lock:
+            mask = self._filter_mask(filters)
+            if self.ann is not None:
+                results = self.ann.top_k(self.store, query_vector, top_k, mask=mask)
+            else:
+                # コサイン類似度計算（正規化済み行列との1回の積 + argpartition）
+                results = self.store.top_k(query_vector, top_k, mask=mask)
+            self.result_cache.put(key, tuple(results))
+        return results
+
+    def search_partitions(
+        self,
+        query: str,
+        projects: list[str],
+        top_k: int = 10,
+        filters: Sequence[Filter] = (),
+    ) -> dict[str, list[tuple[str, float]]]:
+        """プロジェクトのパーティションだけを検索（上位k件はグループごと）
+
+        指定したパーティションの行だけを採点するので、他のプロジェクトの
+        知識がいくら多くても検索コストは変わらない。
+        絞り込み条件はパーティションの行に対するマスクとして適用する。
+
+        Returns:
+            プロジェクト名 -> (name, score) のリスト（スコア降順）
+        """
+        projects = list(dict.fromkeys(projects))
+        if not any(self.partitions.get(p) for p in projects):
+            return {p: [] for p in projects}
+
+        normalized = normalize_query(query)
+        filters = tuple(filters)
+        key = (*self._result_key(normalized, top_k, filters), tuple(projects))
+        cached = self.result_cache.get(key)
+        if cached is not None:
+            return {p: list(r) for p, r in cached.items()}
+
+        # エンコードはロック外（変更処理を待たせない）
+        query_vector = self._encode_query(normalized)
+
+        with self._lock:
+            mask = self._filter_mask(filters)
+            results = {}
+            for p in projects:
+                rows = self._rows_of_project(p)
+                if mask is not None:
+                    rows = rows[mask[rows]]
+                results[p] = self.store.top_k_rows(query_vector, rows, top_k)
+            self.result_cache.put(key, {p: tuple(r) for p, r in results.items()})
+        return results
+
+    def _encode_query(self, normalized: str) -> np.ndarray:
+        """クエリをエンコード（LRUキャッシュ → マイクロバッチ経由）"""
+        key = (self.model_name, normalized)
+        cached = self.query_cache.get(key)
+        if cached is not None:
+            return cached
+
+        vector = self.query_batcher.encode(QUERY_PREFIX + normalized)
+        self.query_cache.put(key, vector)
+        return vector
 
-        # コサイン類似度計算
-        results = []
-        for name, doc_vector in self.embeddings.items():
-            norm_q = np.linalg.norm(query_vector)
-            norm_d = np.linalg.norm(doc_vector)
-            score = float(np.dot(query_vector, doc_vector) / (norm_q * norm_d))
-            results.append((name, score))
+    def _encode_queries(self, texts: list[str]) -> np.ndarray:
+        """prefix付きのクエリをまとめてエンコード（バッチワーカーから呼ばれる）"""
+        with self.model_lifecycle.use() as model:
+            return model.encode(texts, convert_to_numpy=True, show_progress_bar=False)
 
-        results.sort(key=lambda x: x[1], reverse=True)
-        return results[:top_k]
+    def cache_stats(self) -> dict[str, object]:
+        """クエリキャッシュの統計（サイズ調整用）"""
+        return {
+            "generation": self.generation,
+            "query_vectors": self.query_cache.stats(),
+            "results": self.result_cache.stats(),
+            "query_batches": self.query_batcher.stats(),
+        }
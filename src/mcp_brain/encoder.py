@@ -0,0 +1,274 @@
+"""文エンコーダのバックエンド
+
+- torch: sentence-transformers（PyTorch）でそのまま推論する（デフォルト）
+- onnx-int8: 動的int8量子化したONNXモデルをONNX Runtimeで推論する（CPU向け）
+
+onnx-int8は初回にモデルをONNXへ書き出して量子化し、PyTorch版との一致度
+（パリティ）を検査してから使う。書き出しと検査にはsentence-transformers（torch）を
+使うが、検査済みのモデルはONNX Runtimeとtokenizersだけで読み込むので、
+2回目以降はtorch / transformersをimportせずに起動できる。
+ONNX Runtimeが入っていない・検査に通らない場合はtorchにフォールバックする。
+
+sentence-transformers（とtorch）の読み込みには数秒〜数十秒かかるため、
+モジュールの読み込み時ではなく最初にエンコーダを読み込むときにimportする。
+"""
+
+import json
+import logging
+import platform
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from mcp_brain.index_cache import model_namespace
+from mcp_brain.vector_store import normalize_rows
+
+if TYPE_CHECKING:
+    from onnxruntime import InferenceSession
+    from sentence_transformers import SentenceTransformer
+    from tokenizers import Tokenizer
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("torch", "onnx-int8")
+# 量子化後もこのコサイン類似度以上ならPyTorch版と同等とみなす
+PARITY_THRESHOLD = 0.98
+# パリティ検査に使う文（実際の入力と同じくprefix付き）
+PARITY_TEXTS = [
+    "クエリ: PRを作成したい",
+    "クエリ: 本番環境にデプロイする手順",
+    "クエリ: git commit message",
+    "文章: create-pr\nPRを作成したいとき\n## 手順\n1. git push\n2. gh pr create",
+    "文章: deploy-staging\nステージング環境にデプロイしたいとき",
+    "文章: 障害対応の振り返りと再発防止策をまとめる",
+]
+PARITY_FILE = "parity.json"
+
+
+def onnx_dir(model_name: str) -> Path:
+    """量子化したONNXモデルの置き場所（端末ローカル）"""
+    return Path.home() / ".cache" / "mcp-brain" / "onnx" / model_namespace(model_name)
+
+
+class OnnxEncoder:
+    """ONNX Runtime + tokenizersだけで推論するエンコーダ
+
+    sentence-transformersが書き出したディレクトリ（tokenizer.json、
+    1_Pooling/config.json、modules.json）からトークナイズ・プーリング・正規化の
+    設定を読み、SentenceTransformer.encodeと同じ形のベクトルを返す。
+
+    Args:
+        session: ONNX RuntimeのInferenceSession
+        tokenizer: tokenizersのTokenizer（切り詰め・パディング設定済み）
+        pooling: プーリング方法（mean / cls / max）
+        normalize: 出力をL2正規化するか
+        batch_size: 1回の推論に渡す文の数
+    """
+
+    POOLINGS = ("mean", "cls", "max")
+
+    def __init__(
+        self,
+        session: "InferenceSession",
+        tokenizer: "Tokenizer",
+        pooling: str = "mean",
+        normalize: bool = False,
+        batch_size: int = 32,
+    ) -> None:
+        if pooling not in self.POOLINGS:
+            raise ValueError(f"Unsupported pooling '{pooling}'")
+        self.session = session
+        self.tokenizer = tokenizer
+        self.pooling = pooling
+        self.normalize = normalize
+        self.batch_size = batch_size
+        self._input_names = [i.name for i in session.get_inputs()]
+
+    @classmethod
+    def load(cls, export_dir: Path, file_name: str) -> "OnnxEncoder":
+        """書き出し済みのディレクトリから読み込む
+
+        Raises:
+            ImportError: onnxruntime / tokenizersが入っていない場合
+            OSError: tokenizer.jsonなどが見つからない場合
+            ValueError: 対応していないプーリングの場合
+        """
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        tokenizer = Tokenizer.from_file(str(export_dir / "tokenizer.json"))
+        config = _read_json(export_dir / "sentence_bert_config.json") or {}
+        if config.get("max_seq_length"):
+            tokenizer.enable_truncation(max_length=int(config["max_seq_length"]))
+        tokenizer.enable_padding()
+
+        session = onnxruntime.InferenceSession(
+            str(export_dir / file_name), providers=["CPUExecutionProvider"]
+        )
+        modules = _read_json(export_dir / "modules.json") or []
+        normalize = any(m.get("type", "").endswith(".Normalize") for m in modules)
+        return cls(session, tokenizer, _pooling_mode(export_dir), normalize)
+
+    def encode(self, texts: list[str], **_kwargs: object) -> np.ndarray:
+        """文をまとめてエンコード（SentenceTransformer.encodeと同じ呼び方）"""
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        batches = [
+            self._encode_batch(texts[i : i + self.batch_size])
+            for i in range(0, len(texts), self.batch_size)
+        ]
+        return np.concatenate(batches)
+
+    def _encode_batch(self, texts: list[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        inputs = {"input_ids": ids, "attention_mask": mask}
+        if "token_type_ids" in self._input_names:
+            inputs["token_type_ids"] = np.zeros_like(ids)
+        feeds = {name: inputs[name] for name in self._input_names}
+        hidden = np.asarray(self.session.run(None, feeds)[0], dtype=np.float32)
+
+        weights = mask[:, :, None].astype(np.float32)
+        if self.pooling == "cls":
+            pooled = hidden[:, 0]
+        elif self.pooling == "max":
+            pooled = np.where(weights > 0, hidden, -np.inf).max(axis=1)
+        else:
+            pooled = (hidden * weights).sum(axis=1) / np.maximum(
+                weights.sum(axis=1), 1e-9
+            )
+        return normalize_rows(pooled) if self.normalize else pooled
+
+
+def load_encoder(
+    model_name: str, backend: str = "torch"
+) -> "SentenceTransformer | OnnxEncoder":
+    """バックエンドを指定してエンコーダを読み込む
+
+    Raises:
+        ValueError: 未知のバックエンドの場合
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Invalid backend '{backend}': must be one of {BACKENDS}")
+
+    if backend == "onnx-int8":
+        try:
+            model = _load_onnx_int8(model_name, onnx_dir(model_name))
+        except Exception as e:
+            logger.warning("ONNX backend unavailable, falling back to torch: %s", e)
+        else:
+            if model is not None:
+                return model
+    return _model_class()(model_name)
+
+
+def check_parity(
+    reference: "SentenceTransformer",
+    candidate: "SentenceTransformer | OnnxEncoder",
+    texts: list[str] = PARITY_TEXTS,
+) -> float:
+    """2つのエンコーダの出力を比較し、最も低いコサイン類似度を返す"""
+    a = reference.encode(texts, convert_to_numpy=True, show_progress_bar=False)
+    b = candidate.encode(texts, convert_to_numpy=True, show_progress_bar=False)
+    similarity = np.sum(normalize_rows(a) * normalize_rows(b), axis=1)
+    return float(similarity.min())
+
+
+def _model_class() -> "type[SentenceTransformer]":
+    """sentence-transformers（torchを含む）を遅延import"""
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer
+
+
+def _load_onnx_int8(model_name: str, export_dir: Path) -> OnnxEncoder | None:
+    """量子化モデルを読み込む（未作成なら書き出して検査、不合格ならNone）"""
+    report = _read_report(export_dir)
+    if report is None:
+        report = _export(model_name, export_dir)
+    if not report["passed"]:
+        logger.warning(
+            "ONNX int8 parity check failed (min cosine %.4f < %.2f), using torch",
+            report["min_cosine"],
+            report["threshold"],
+        )
+        return None
+
+    logger.info(
+        "Using ONNX int8 encoder: %s (min cosine %.4f)",
+        report["file"],
+        report["min_cosine"],
+    )
+    return OnnxEncoder.load(export_dir, report["file"])
+
+
+def _read_json(path: Path) -> dict | list | None:
+    """JSONファイルを読む（なければ・壊れていればNone）"""
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def _pooling_mode(export_dir: Path) -> str:
+    """sentence-transformersのプーリング設定（設定がなければmean）
+
+    Raises:
+        ValueError: mean / cls / max以外のプーリングの場合
+    """
+    config = _read_json(export_dir / "1_Pooling" / "config.json")
+    if not config:
+        return "mean"
+    modes = {
+        "mean": config.get("pooling_mode_mean_tokens"),
+        "cls": config.get("pooling_mode_cls_token"),
+        "max": config.get("pooling_mode_max_tokens"),
+    }
+    enabled = [mode for mode, on in modes.items() if on]
+    if len(enabled) != 1:
+        raise ValueError(f"Unsupported pooling config: {config}")
+    return enabled[0]
+
+
+def _read_report(export_dir: Path) -> dict | None:
+    """保存済みの検査結果（なければ・壊れていればNone）"""
+    report = _read_json(export_dir / PARITY_FILE)
+    if not isinstance(report, dict) or not {"file", "passed"} <= report.keys():
+        return None
+    if not (export_dir / report["file"]).exists():
+        return None
+    return report
+
+
+def _export(model_name: str, export_dir: Path) -> dict:
+    """ONNXへ書き出して動的int8量子化し、PyTorch版とのパリティを検査"""
+    from sentence_transformers import export_dynamic_quantized_onnx_model
+
+    model_class = _model_class()
+    config = _quantization_config()
+    logger.info("Exporting %s to ONNX int8 (%s)...", model_name, config)
+    onnx_model = model_class(model_name, backend="onnx")
+    onnx_model.save(str(export_dir))
+    export_dynamic_quantized_onnx_model(onnx_model, config, str(export_dir))
+
+    # 検査は実際に使うtorchなしの読み込み経路（OnnxEncoder）で行う
+    file_name = f"onnx/model_qint8_{config}.onnx"
+    quantized = OnnxEncoder.load(export_dir, file_name)
+    min_cosine = check_parity(model_class(model_name), quantized)
+    report = {
+        "model": model_name,
+        "file": file_name,
+        "min_cosine": min_cosine,
+        "threshold": PARITY_THRESHOLD,
+        "passed": min_cosine >= PARITY_THRESHOLD,
+    }
+    (export_dir / PARITY_FILE).write_text(json.dumps(report, indent=2), "utf-8")
+    return report
+
+
+def _quantization_config() -> str:
+    """CPUに合わせた量子化設定（AVX-512は環境差が大きいのでAVX2に揃える）"""
+    machine = platform.machine().lower()
+    return "arm64" if machine in ("arm64", "aarch64") else "avx2"
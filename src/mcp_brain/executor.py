@@ -0,0 +1,71 @@
+"""ツール処理の実行レーン
+
+FastMCPのツールはasyncだが、モデル推論・ファイルI/O・Git操作・ダイアログは
+ブロッキング処理なので、イベントループ外のスレッドで実行する。
+
+- 読み取りレーン: 複数スレッドで並行実行（search, get）
+- 書き込みレーン: 1スレッドで逐次実行（create, update, forget）
+
+書き込み中（pushやダイアログ待ち）でも読み取りは止まらない。
+"""
+
+import asyncio
+import functools
+import logging
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import ParamSpec, TypeVar
+
+logger = logging.getLogger(__name__)
+
+P = ParamSpec("P")
+T = TypeVar("T")
+
+
+class ToolExecutor:
+    """読み取り用スレッドプールと単一ライターのレーン"""
+
+    def __init__(self, max_readers: int = 4) -> None:
+        self._readers = ThreadPoolExecutor(
+            max_workers=max_readers, thread_name_prefix="brain-read"
+        )
+        self._writer = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="brain-write"
+        )
+
+    async def run_read(
+        self, fn: Callable[P, T], *args: P.args, **kwargs: P.kwargs
+    ) -> T:
+        """読み取り処理を並行レーンで実行して結果を待つ"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._readers, functools.partial(fn, *args, **kwargs)
+        )
+
+    async def run_write(
+        self, fn: Callable[P, T], *args: P.args, **kwargs: P.kwargs
+    ) -> T:
+        """書き込み処理を単一ライターのレーンで実行して結果を待つ"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._writer, functools.partial(fn, *args, **kwargs)
+        )
+
+    def submit_write(
+        self, fn: Callable[P, T], *args: P.args, **kwargs: P.kwargs
+    ) -> Future[T]:
+        """書き込み処理を投入して待たない（失敗はログに残す）"""
+        future = self._writer.submit(fn, *args, **kwargs)
+        future.add_done_callback(_log_failure)
+        return future
+
+    def shutdown(self, wait: bool = True) -> None:
+        """全レーンを停止"""
+        self._readers.shutdown(wait=wait)
+        self._writer.shutdown(wait=wait)
+
+
+def _log_failure(future: Future) -> None:
+    """投げっぱなしの書き込み処理の例外をログに残す"""
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("Background write failed", exc_info=future.exception())
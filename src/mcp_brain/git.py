@@ -1,13 +1,27 @@
 """知識の自動Git管理"""
 
 import logging
+from collections.abc import Callable, Collection, Sequence
 from pathlib import Path
 
-from git import InvalidGitRepositoryError, Repo
+from git import InvalidGitRepositoryError, PushInfo, Remote, Repo
 from git.exc import GitCommandError
 
+from .index_cache import CACHE_WRITE_LOCK
+
 logger = logging.getLogger(__name__)
 
+# 知識と一緒にコミットするインデックスキャッシュ（モデルごとのサブディレクトリ）
+INDEX_CACHE_DIR = ".index"
+# キャッシュの書き込み途中の一時ファイル（コミットしない）
+INDEX_CACHE_TMP = f":(exclude,glob){INDEX_CACHE_DIR}/**/*.tmp"
+# 利用記録（端末ごとのジャーナル）の置き場所。インデックスキャッシュと一緒にコミットする
+USAGE_DIR = f"{INDEX_CACHE_DIR}/usage"
+# 利用記録だけを同期する変更の名前（知識名はkebab-caseなので衝突しない）
+USAGE_CHANGE = ":usage"
+# 旧形式のキャッシュ（新形式への移行で削除されたら削除をコミット）
+LEGACY_INDEX_CACHE_FILES = [".index_cache.pkl", ".index_hash"]
+
 
 class GitNotAvailableError(Exception):
     """Git連携が利用できない場合のエラー"""
@@ -73,34 +87,135 @@ class GitManager:
         Raises:
             GitOperationError: Git操作に失敗した場合
         """
+        self.commit_and_push_many([(name, action)])
+
+    def commit_and_push_many(self, changes: Sequence[tuple[str, str]]) -> None:
+        """複数の変更を1コミット + 1プッシュで反映
+
+        Args:
+            changes: (知識名, 操作) のリスト
+
+        Raises:
+            GitOperationError: Git操作に失敗した場合
+        """
+        self.commit_changes(changes)
+        self.push()
+
+    def commit_changes(
+        self,
+        changes: Sequence[tuple[str, str]],
+        busy: Callable[[], Collection[str]] | None = None,
+    ) -> None:
+        """複数の変更をまとめて1コミットにする（pushはしない）
+
+        同じ知識への複数の変更は最後の操作だけを反映する。
+
+        Args:
+            changes: (知識名, 操作) のリスト（操作: create, update, forget）。
+                USAGE_CHANGE は利用記録だけの同期（変更がなければコミットしない）
+            busy: 書き込み中・コミット待ちの知識名を返す関数。これらの
+                知識ファイルは手動変更としてコミットしない（後のコミットに入る）
+
+        Raises:
+            GitOperationError: Git操作に失敗した場合
+        """
+        # 同名の変更は最後の操作に畳み込む（順序は初出順）
+        final: dict[str, str] = {}
+        for name, action in changes:
+            final[name] = action
+        # 利用記録の同期は知識ファイルを持たない（.index と一緒にコミットされる）
+        usage_only = final.pop(USAGE_CHANGE, None) is not None and not final
+        if not final and not usage_only:
+            return
+
+        # フラット構造: knowledge/{name}.md
+        paths = {name: f"knowledge/{name}.md" for name in final}
+
         try:
             # 1. 不正なGit状態（rebase中など）があれば解除
             self._abort_incomplete_operations()
 
-            # 2. 未コミットの手動変更があれば先にコミット（保護）
-            self._commit_manual_changes()
-
-            # 3. 今回の変更をステージング・コミット
-            # フラット構造: knowledge/{name}.md
-            knowledge_path = f"knowledge/{name}.md"
-            if action == "forget":
-                self.repo.index.remove([knowledge_path], working_tree=True)
+            # 2. 今回の変更以外の手動変更があれば先にコミット（保護）
+            self._commit_manual_changes(
+                exclude=[*paths.values(), INDEX_CACHE_DIR, *LEGACY_INDEX_CACHE_FILES],
+                busy=busy,
+            )
+
+            # 3. 今回の変更をステージング
+            for name, action in final.items():
+                if action == "forget":
+                    self._stage_removal(paths[name])
+                else:
+                    self.repo.index.add([paths[name]])
+
+            # インデックスキャッシュも一緒にコミット（移行で消えたモデルの削除も含む）。
+            # 書き込みとは直列化し、書き込み途中のファイルを取り込まない
+            if self._has_index_cache():
+                with CACHE_WRITE_LOCK:
+                    self.repo.git.add("-A", "--", INDEX_CACHE_DIR, INDEX_CACHE_TMP)
+            for path in self._removed_legacy_cache_paths():
+                self.repo.index.remove([path], working_tree=False)
+
+            if usage_only:
+                if not self.repo.index.diff("HEAD"):
+                    return
+                message = "usage: update usage records"
             else:
-                self.repo.index.add([knowledge_path])
+                message = self._commit_message(final)
+            self.repo.index.commit(message)
+            logger.info("Committed: %s", message.splitlines()[0])
 
-            # インデックスキャッシュも一緒にコミット
-            self.repo.index.add([".index_cache.pkl", ".index_hash"])
+        except GitCommandError as e:
+            raise GitOperationError(f"Git operation failed: {e}") from e
 
-            message = f"{action}: {name}"
-            self.repo.index.commit(message)
-            logger.info("Committed: %s", message)
+    def push(self) -> None:
+        """プッシュ（競合時はrebaseで解決）
 
-            # 4. プッシュ（競合時はrebaseで解決）
+        Raises:
+            GitOperationError: Git操作に失敗した場合
+        """
+        try:
             self._push_with_rebase()
-
         except GitCommandError as e:
             raise GitOperationError(f"Git operation failed: {e}") from e
 
+    def _stage_removal(self, path: str) -> None:
+        """削除をステージング（未追跡のまま消えたファイルは無視）"""
+        try:
+            self.repo.index.remove([path], working_tree=True)
+        except GitCommandError as e:
+            if (self.knowledge_dir / path).exists():
+                raise
+            logger.info("Skip removing untracked path %s: %s", path, e)
+
+    @staticmethod
+    def _commit_message(changes: dict[str, str]) -> str:
+        """コミットメッセージ（1件なら "action: name"、複数なら一覧付き）"""
+        if len(changes) == 1:
+            name, action = next(iter(changes.items()))
+            return f"{action}: {name}"
+        actions = set(changes.values())
+        if len(actions) == 1:
+            subject = f"{actions.pop()}: {len(changes)} items"
+        else:
+            subject = f"sync: {len(changes)} changes"
+        lines = [f"{action}: {name}" for name, action in changes.items()]
+        return f"{subject}\n\n" + "\n".join(lines)
+
+    def _has_index_cache(self) -> bool:
+        """インデックスキャッシュが存在するか、追跡されているか"""
+        return (self.knowledge_dir / INDEX_CACHE_DIR).exists() or bool(
+            self.repo.git.ls_files("--", INDEX_CACHE_DIR)
+        )
+
+    def _removed_legacy_cache_paths(self) -> list[str]:
+        """作業ツリーから削除済みで、まだ追跡されている旧形式キャッシュのパス"""
+        return [
+            p
+            for p in LEGACY_INDEX_CACHE_FILES
+            if not (self.knowledge_dir / p).exists() and self.repo.git.ls_files("--", p)
+        ]
+
     def _abort_incomplete_operations(self) -> None:
         """不完全なGit操作を中止（rebase中、merge中など）"""
         git_dir = Path(self.repo.git_dir)
@@ -122,32 +237,82 @@ class GitManager:
         except GitCommandError as e:
             logger.warning("Failed to abort incomplete operation: %s", e)
 
-    def _commit_manual_changes(self) -> None:
-        """未コミットの手動変更をコミット（変更を保護）"""
+    def _commit_manual_changes(
+        self,
+        exclude: Sequence[str] = (),
+        busy: Callable[[], Collection[str]] | None = None,
+    ) -> None:
+        """未コミットの手動変更をコミット（変更を保護）
+
+        Args:
+            exclude: 手動変更として扱わないパス（今回コミットする変更）
+            busy: 手動変更として扱わない知識名（書き込み中・コミット待ち）を返す関数
+        """
         if not self.repo.is_dirty(untracked_files=True):
             return
 
+        def excluded() -> list[str]:
+            names = busy() if busy is not None else ()
+            return [*exclude, *(f"knowledge/{name}.md" for name in names)]
+
         try:
-            # 全ての変更をステージング
+            if all(_is_excluded(p, excluded()) for p in self._dirty_paths()):
+                return
+
+            # 全ての変更をステージングし、今回の変更と処理中の変更を外す
+            # （処理中の知識名はaddの後に取得するので、add時点で書き込まれていた
+            # ファイルの知識は必ず書き込み中かコミット待ちとして含まれる）
             self.repo.git.add("-A")
+            paths = excluded()
+            if paths:
+                self.repo.git.reset("-q", "--", *paths)
             # 手動変更としてコミット
             self.repo.index.commit("manual: uncommitted changes")
             logger.info("Committed manual changes")
         except GitCommandError as e:
             logger.warning("Failed to commit manual changes: %s", e)
 
+    def _dirty_paths(self) -> list[str]:
+        """変更・未追跡のパス一覧（リポジトリルートからの相対パス）"""
+        output = self.repo.git.status("--porcelain", "--untracked-files=all")
+        paths = []
+        for line in output.splitlines():
+            path = line[3:]
+            # リネームは "old -> new"
+            paths.extend(p.strip('"') for p in path.split(" -> "))
+        return paths
+
     def _push_with_rebase(self) -> None:
         """プッシュ（競合時はrebaseで解決）"""
         origin = self.repo.remote("origin")
         try:
-            origin.push()
+            _push(origin)
             logger.info("Pushed to origin")
         except GitCommandError:
             # プッシュ失敗 → pull --rebase してリトライ
+            # （利用記録やキャッシュの未コミットの変更は退避して戻す）
             logger.info("Push failed, trying pull --rebase...")
             try:
-                origin.pull(rebase=True)
-                origin.push()
+                origin.pull(rebase=True, autostash=True)
+                _push(origin)
                 logger.info("Pushed after rebase")
             except GitCommandError as e:
                 raise GitOperationError(f"Push failed after rebase: {e}") from e
+
+
+def _push(origin: Remote) -> None:
+    """プッシュし、拒否されたらGitCommandErrorを投げる
+
+    GitPythonは拒否（non-fast-forwardなど）でも例外を投げず、
+    PushInfoのフラグで返すので確認する。
+    """
+    results = origin.push()
+    results.raise_if_error()
+    for info in results:
+        if info.flags & (PushInfo.ERROR | PushInfo.REJECTED | PushInfo.REMOTE_REJECTED):
+            raise GitCommandError("push", 1, stderr=info.summary.strip())
+
+
+def _is_excluded(path: str, exclude: Sequence[str]) -> bool:
+    """パスが除外対象（またはそのディレクトリ配下）か"""
+    return any(path == e or path.startswith(e + "/") for e in exclude)
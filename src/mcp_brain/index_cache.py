@@ -2,75 +2,359 @@
 
 起動高速化のため、Embeddingをキャッシュしておき、
 変更がなければ再利用する。
+Embeddingは文書ごとに本文テキストのダイジェストと組で保存し、
+変更された文書だけを再エンコードできるようにする。
+
+スナップショットはfloat32行列のバイナリ（np.memmapで開く）と、
+モデル名・次元・行ごとの知識名とダイジェストを持つメタデータJSONの2ファイル。
+読み込みはコピーオンライトのmemmapなので、ほぼゼロコピーで起動でき、
+同じマシン上の複数プロセスはOSのページキャッシュを共有する。
+
+add/update/removeのたびにスナップショット全体を書き直さないよう、
+変更は追記専用の差分ログに1件ずつ記録し、読み込み時に再生する。
+ログがスナップショットに対して大きくなったらスナップショットに畳み込む。
 """
 
+import base64
 import hashlib
+import json
+import logging
 import pickle
+import re
+import shutil
+import threading
+from dataclasses import dataclass
 from pathlib import Path
 
 import numpy as np
 
+from mcp_brain.vector_store import normalize_rows
+
+logger = logging.getLogger(__name__)
+
+# .index/ 以下への書き込み（キャッシュ・利用記録）と、Git同期でのステージングを
+# 直列化する（書き込み途中のファイルをコミットしない）
+CACHE_WRITE_LOCK = threading.RLock()
+
 
-def compute_content_hash(knowledge_dir: Path) -> str:
-    """知識ディレクトリの内容からハッシュを計算"""
-    hasher = hashlib.sha256()
+def text_digest(text: str) -> str:
+    """検索用テキストのダイジェスト（文書単位のキャッシュキー）"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
 
-    if not knowledge_dir.exists():
-        return hasher.hexdigest()
 
-    # 既定は knowledge/ 配下（リポジトリ構造に合わせる）
-    # テストや旧構造ではknowledge_dir直下の再帰走査にフォールバック
-    content_root = knowledge_dir / "knowledge"
-    search_root = content_root if content_root.is_dir() else knowledge_dir
+@dataclass
+class IndexSnapshot:
+    """読み込んだキャッシュ（差分ログ適用済み）
 
-    knowledge_files = sorted(search_root.rglob("*.md"))
-    for f in knowledge_files:
-        hasher.update(str(f.relative_to(knowledge_dir)).encode())
-        hasher.update(f.read_bytes())
+    Attributes:
+        model: 作成したモデル名
+        matrix: float32行列（memmapの場合、書き込みはコピーオンライト）
+        names: 行 -> 知識名（削除済みの行はNone）
+        digests: 知識名 -> 検索用テキストのダイジェスト
+    """
 
-    return hasher.hexdigest()
+    model: str | None
+    matrix: np.ndarray
+    names: list[str | None]
+    digests: dict[str, str]
+
+    def embeddings(self) -> dict[str, np.ndarray]:
+        """知識名 -> ベクトル（行列の行ビュー）"""
+        return {
+            name: self.matrix[row]
+            for row, name in enumerate(self.names)
+            if name is not None
+        }
+
+
+def model_namespace(model_name: str | None) -> str:
+    """モデル名からキャッシュのディレクトリ名を作る（例: cl-nagoya--ruri-v3-30m）"""
+    if not model_name:
+        return "default"
+    return re.sub(r"[^A-Za-z0-9._-]+", "--", model_name).strip("-.") or "default"
 
 
 class IndexCache:
-    """Embeddingインデックスのキャッシュ"""
+    """Embeddingインデックスのキャッシュ
+
+    キャッシュはモデルごとに `.index/<モデル名>/` に分けて置くので、
+    モデル移行中も旧モデルのキャッシュはそのまま使える。
 
-    CACHE_FILE = ".index_cache.pkl"
-    HASH_FILE = ".index_hash"
+    Args:
+        knowledge_dir: キャッシュを置くディレクトリ
+        model_name: モデル名（指定時は別モデル・別次元のキャッシュを読み込まない）
+    """
 
-    def __init__(self, knowledge_dir: Path) -> None:
+    INDEX_DIR = ".index"
+    VECTORS_FILE = "vectors.f32"
+    META_FILE = "meta.json"
+    ANN_FILE = "ann.npz"
+    LOG_FILE = "log.jsonl"
+    # 旧形式（pickle）。読み込みのみ対応し、次回保存時に新形式へ移行して削除する
+    LEGACY_CACHE_FILE = ".index_cache.pkl"
+    # 旧形式でリポジトリ直下に置いていたファイル（保存時に削除）
+    LEGACY_FILES = (".index_cache.pkl", ".index_hash")
+    # 旧形式を書き出していた唯一のモデル（モデル設定の導入前）
+    LEGACY_MODEL = "cl-nagoya/ruri-v3-30m"
+    FORMAT_VERSION = 1
+    # ログがこのサイズとスナップショットの半分の大きい方を超えたら畳み込む
+    COMPACT_MIN_BYTES = 1 << 20
+
+    def __init__(self, knowledge_dir: Path, model_name: str | None = None) -> None:
         self.knowledge_dir = knowledge_dir
-        self.cache_path = knowledge_dir / self.CACHE_FILE
-        self.hash_path = knowledge_dir / self.HASH_FILE
+        self.model_name = model_name
+        self.cache_dir = knowledge_dir / self.INDEX_DIR / model_namespace(model_name)
+        self.vectors_path = self.cache_dir / self.VECTORS_FILE
+        self.meta_path = self.cache_dir / self.META_FILE
+        self.legacy_path = knowledge_dir / self.LEGACY_CACHE_FILE
+        # 差分ログ（スナップショット以降の追加・削除）
+        self.log_path = self.cache_dir / self.LOG_FILE
+        # 近似最近傍インデックス（ANN使用時のみ生成）
+        self.ann_path = self.cache_dir / self.ANN_FILE
+
+    @classmethod
+    def cached_models(cls, knowledge_dir: Path) -> list[str]:
+        """キャッシュが保存されているモデル名の一覧"""
+        models = []
+        for meta_path in sorted((knowledge_dir / cls.INDEX_DIR).glob("*/meta.json")):
+            try:
+                model = json.loads(meta_path.read_text(encoding="utf-8")).get("model")
+            except (OSError, ValueError):
+                continue
+            if isinstance(model, str):
+                models.append(model)
+        legacy = any((knowledge_dir / p).exists() for p in cls.LEGACY_FILES)
+        if legacy and cls.LEGACY_MODEL not in models:
+            models.append(cls.LEGACY_MODEL)
+        return models
+
+    def exists(self) -> bool:
+        """このモデルのスナップショットがあるか"""
+        return self.meta_path.exists()
+
+    def delete(self) -> None:
+        """このモデルのキャッシュを削除（モデル移行後の後始末）"""
+        with CACHE_WRITE_LOCK:
+            shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def load_entries(
+        self,
+    ) -> tuple[dict[str, np.ndarray], dict[str, str]] | None:
+        """キャッシュを文書単位で読み込み
+
+        呼び出し側が文書ごとのダイジェストを比較して再利用可否を判断する。
+
+        Returns:
+            (embeddings, digests) のタプル。旧形式のキャッシュではdigestsが空。
+            キャッシュがない・壊れている場合はNone。
+        """
+        snapshot = self.load_snapshot()
+        if snapshot is None:
+            return None
+        return snapshot.embeddings(), snapshot.digests
+
+    def load_snapshot(self) -> IndexSnapshot | None:
+        """スナップショットに差分ログを再生した結果を読み込み
 
-    def load(self) -> dict[str, np.ndarray] | None:
-        """キャッシュからEmbeddingを読み込み（有効性チェック込み）"""
-        if not self.cache_path.exists() or not self.hash_path.exists():
+        Returns:
+            キャッシュがない・壊れている・別モデルの場合はNone
+        """
+        snapshot = self._load_base()
+        if snapshot is None:
             return None
+        if (
+            self.model_name is not None
+            and snapshot.model is not None
+            and snapshot.model != self.model_name
+        ):
+            logger.info("Ignoring index cache for another model: %s", snapshot.model)
+            return None
+        self._replay_log(snapshot)
+        return snapshot
+
+    def _load_base(self) -> IndexSnapshot | None:
+        """スナップショット（新形式、なければ旧形式）を読み込み"""
+        if self.meta_path.exists():
+            return self._load_binary()
+        if self.legacy_path.exists():
+            return self._load_legacy()
+        return None
 
-        # ハッシュが一致するか確認
-        stored_hash = self.hash_path.read_text(encoding="utf-8").strip()
-        current_hash = compute_content_hash(self.knowledge_dir)
-        if stored_hash != current_hash:
+    def _load_binary(self) -> IndexSnapshot | None:
+        """メタデータを検証してベクトル行列をmemmapで開く"""
+        try:
+            meta = json.loads(self.meta_path.read_text(encoding="utf-8"))
+            if meta.get("version") != self.FORMAT_VERSION:
+                return None
+            dim = int(meta["dim"])
+            names = [name for name, _ in meta["entries"]]
+            digests = {name: digest for name, digest in meta["entries"] if digest}
+            count = len(names)
+            expected = count * dim * np.dtype(np.float32).itemsize
+            if self.vectors_path.stat().st_size != expected:
+                logger.warning("Index vectors size mismatch, ignoring cache")
+                return None
+        except (OSError, ValueError, KeyError, TypeError):
             return None
 
+        if count == 0:
+            matrix = np.zeros((0, dim), dtype=np.float32)
+        else:
+            matrix = np.memmap(
+                self.vectors_path, dtype=np.float32, mode="c", shape=(count, dim)
+            )
+        return IndexSnapshot(meta.get("model"), matrix, list(names), digests)
+
+    def _load_legacy(self) -> IndexSnapshot | None:
+        """旧形式（pickle）のキャッシュを読み込み（移行用、正規化して返す）"""
         try:
-            with self.cache_path.open("rb") as f:
-                return pickle.load(f)  # noqa: S301
+            with self.legacy_path.open("rb") as f:
+                payload = pickle.load(f)  # noqa: S301
         except Exception:
             return None
 
-    def save(self, embeddings: dict[str, np.ndarray]) -> None:
-        """Embeddingをキャッシュに保存（アトミック書き込み）"""
-        self.knowledge_dir.mkdir(parents=True, exist_ok=True)
+        # 旧形式は name -> vector の辞書のみ（ダイジェストなし）
+        if not isinstance(payload, dict):
+            return None
+        names: list[str | None] = list(payload)
+        if names:
+            matrix = normalize_rows(np.stack([payload[n] for n in names]))
+        else:
+            matrix = np.zeros((0, 0), dtype=np.float32)
+        return IndexSnapshot(self.LEGACY_MODEL, matrix, names, {})
+
+    def append(
+        self,
+        upserts: dict[str, tuple[np.ndarray, str]] | None = None,
+        deletes: list[str] | None = None,
+    ) -> bool:
+        """変更を差分ログに追記（スナップショットは書き直さない）
+
+        新形式のスナップショットがなければ追記せずFalseを返す
+        （呼び出し側でsaveする）。
+
+        Args:
+            upserts: 知識名 -> (ベクトル, ダイジェスト)
+            deletes: 削除した知識名
+        """
+        if not self.meta_path.exists():
+            return False
+
+        lines = []
+        for name, (vector, digest) in (upserts or {}).items():
+            data = np.ascontiguousarray(vector, dtype=np.float32).tobytes()
+            entry = {
+                "op": "put",
+                "name": name,
+                "digest": digest,
+                "vec": base64.b64encode(data).decode("ascii"),
+            }
+            lines.append(json.dumps(entry, ensure_ascii=False))
+        for name in deletes or []:
+            lines.append(json.dumps({"op": "del", "name": name}, ensure_ascii=False))
+
+        with CACHE_WRITE_LOCK, self.log_path.open("a", encoding="utf-8") as f:
+            f.write("".join(line + "\n" for line in lines))
+        return True
+
+    def needs_compaction(self) -> bool:
+        """差分ログをスナップショットに畳み込むべきか"""
+        try:
+            log_size = self.log_path.stat().st_size
+            base_size = self.vectors_path.stat().st_size
+        except FileNotFoundError:
+            return False
+        return log_size > max(self.COMPACT_MIN_BYTES, base_size // 2)
+
+    def _replay_log(self, snapshot: IndexSnapshot) -> None:
+        """差分ログを先頭から適用（壊れた行は読み飛ばす）
+
+        既存の行は上書き（memmapならコピーオンライト）、新しい知識は末尾に追加する。
+        """
+        if not self.log_path.exists():
+            return
+        rows = {name: row for row, name in enumerate(snapshot.names) if name}
+        dim = snapshot.matrix.shape[1]
+        added: dict[str, np.ndarray] = {}
+        with self.log_path.open(encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    name = entry["name"]
+                    if entry["op"] == "del":
+                        vector, digest = None, None
+                    else:
+                        vector = np.frombuffer(
+                            base64.b64decode(entry["vec"]), dtype=np.float32
+                        )
+                        digest = entry["digest"]
+                except (ValueError, KeyError, TypeError):
+                    logger.warning("Skipping broken index log line")
+                    continue
+
+                if vector is None:
+                    snapshot.digests.pop(name, None)
+                    added.pop(name, None)
+                    row = rows.pop(name, None)
+                    if row is not None:
+                        snapshot.names[row] = None
+                    continue
+                if dim and vector.shape[0] != dim:
+                    logger.warning("Skipping index log entry with wrong dimension")
+                    continue
+                dim = vector.shape[0]
+                snapshot.digests[name] = digest
+                if name in rows:
+                    snapshot.matrix[rows[name]] = vector
+                else:
+                    added[name] = vector
+
+        if added:
+            extra = np.stack(list(added.values()))
+            base = snapshot.matrix.reshape(-1, dim)
+            snapshot.matrix = np.concatenate([base, extra])
+            snapshot.names.extend(added)
+
+    def save(
+        self,
+        embeddings: dict[str, np.ndarray],
+        digests: dict[str, str] | None = None,
+    ) -> None:
+        """Embeddingをキャッシュに保存（アトミック書き込み）
+
+        Args:
+            embeddings: 知識名 -> ベクトル（float32で保存）
+            digests: 知識名 -> 検索用テキストのダイジェスト
+        """
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        digests = digests or {}
 
-        current_hash = compute_content_hash(self.knowledge_dir)
+        names = list(embeddings)
+        if names:
+            matrix = np.stack([embeddings[n] for n in names]).astype(np.float32)
+        else:
+            matrix = np.zeros((0, 0), dtype=np.float32)
+        meta = {
+            "version": self.FORMAT_VERSION,
+            "model": self.model_name,
+            "dim": int(matrix.shape[1]),
+            "dtype": "float32",
+            # 行順の [知識名, ダイジェスト]（行 i のオフセットは i * dim * 4 バイト）
+            "entries": [[name, digests.get(name, "")] for name in names],
+        }
 
-        # 一時ファイルに書いてからrenameでアトミック化
-        tmp_cache = self.cache_path.with_suffix(".tmp")
-        with tmp_cache.open("wb") as f:
-            pickle.dump(embeddings, f)
-        tmp_cache.rename(self.cache_path)
+        # 一時ファイルに書いてからrenameでアトミック化（メタデータを最後に置き換える）
+        tmp_vectors = self.vectors_path.with_suffix(".tmp")
+        with tmp_vectors.open("wb") as f:
+            np.ascontiguousarray(matrix).tofile(f)
+        tmp_meta = self.meta_path.with_suffix(".tmp")
+        tmp_meta.write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+        with CACHE_WRITE_LOCK:
+            tmp_vectors.replace(self.vectors_path)
+            tmp_meta.replace(self.meta_path)
 
-        tmp_hash = self.hash_path.with_suffix(".tmp")
-        tmp_hash.write_text(current_hash, encoding="utf-8")
-        tmp_hash.rename(self.hash_path)
+            # スナップショットに畳み込んだので差分ログを空にし、旧形式は削除する
+            if self.log_path.exists():
+                self.log_path.write_bytes(b"")
+            for name in self.LEGACY_FILES:
+                (self.knowledge_dir / name).unlink(missing_ok=True)
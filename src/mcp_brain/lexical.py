@@ -0,0 +1,199 @@
+"""文字n-gramの転置インデックスとBM25
+
+形態素解析器なしで日本語を扱えるよう、文字bigramを語として転置インデックスを
+作り、BM25で採点する。スクリプト名・環境変数名のような完全一致させたい識別子は
+ベクトル検索では拾いにくいので、ベクトル検索と順位融合（RRF）して使う。
+モデルを使わないので、モデルの読み込み中・インデックス構築中の検索にも使う。
+
+- 名前・説明の語は本文の語より重く数える（head_weight倍）
+- 追加・削除は転置リストの差分更新（全件の作り直しはしない）
+- 採点は語ごとの転置リストの配列演算（数千件で1ミリ秒未満）
+"""
+
+import math
+import threading
+import unicodedata
+from collections import Counter
+from collections.abc import Iterable
+
+import numpy as np
+
+from mcp_brain.models import Knowledge
+
+
+def ngrams(text: str, n: int = 2) -> list[str]:
+    """NFKC + 小文字化したテキストの文字n-gram（空白をまたがない）"""
+    grams = []
+    for word in unicodedata.normalize("NFKC", text).lower().split():
+        if len(word) < n:
+            grams.append(word)
+        else:
+            grams.extend(word[i : i + n] for i in range(len(word) - n + 1))
+    return grams
+
+
+def reciprocal_rank_fusion(
+    rankings: Iterable[list[str]], k: int = 60
+) -> list[tuple[str, float]]:
+    """複数の順位リストをRRFで融合（score = Σ 1 / (k + 順位)）
+
+    Returns:
+        (name, score) のリスト（スコア降順、同点は先に現れた順）
+    """
+    scores: dict[str, float] = {}
+    for ranking in rankings:
+        for rank, name in enumerate(ranking, start=1):
+            scores[name] = scores.get(name, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda x: x[1], reverse=True)
+
+
+class LexicalIndex:
+    """文字n-gramの転置インデックス（BM25）
+
+    転置リストは差分更新用の辞書で持ち、検索時は語ごとの (文書ID, 語頻度) 配列
+    （変更があった語だけ作り直す）でまとめて採点する。
+
+    Args:
+        n: n-gramの文字数
+        k1: BM25の語頻度の飽和パラメータ
+        b: BM25の文書長の正規化パラメータ
+        head_weight: 名前・説明の語の重み
+    """
+
+    def __init__(
+        self, n: int = 2, k1: float = 1.2, b: float = 0.75, head_weight: int = 2
+    ) -> None:
+        self.n = n
+        self.k1 = k1
+        self.b = b
+        self.head_weight = head_weight
+        self._lock = threading.Lock()
+        self._clear()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._ids
+
+    def _clear(self) -> None:
+        # 語 -> {文書ID: 語頻度}
+        self.postings: dict[str, dict[int, int]] = {}
+        # 語 -> (文書IDの配列, 語頻度の配列)（検索用、変更した語は作り直す）
+        self._arrays: dict[str, tuple[np.ndarray, np.ndarray]] = {}
+        self._ids: dict[str, int] = {}
+        self._names: list[str | None] = []
+        self._free: list[int] = []
+        self._terms: dict[int, Counter[str]] = {}
+        self._lengths = np.zeros(0, dtype=np.float64)
+        self._total_length = 0
+
+    def build(self, items: list[Knowledge]) -> None:
+        """全知識から作り直す"""
+        docs = [(k.name, self._count_terms(k)) for k in items]
+        with self._lock:
+            self._clear()
+            for name, terms in docs:
+                self._add_locked(name, terms)
+
+    def add(self, knowledge: Knowledge) -> None:
+        """知識を追加（既存なら置き換え）"""
+        terms = self._count_terms(knowledge)
+        with self._lock:
+            self._remove_locked(knowledge.name)
+            self._add_locked(knowledge.name, terms)
+
+    def remove_many(self, names: list[str]) -> None:
+        """知識を削除"""
+        with self._lock:
+            for name in names:
+                self._remove_locked(name)
+
+    def search(self, query: str, top_k: int = 10) -> list[tuple[str, float]]:
+        """BM25で上位k件を返す（一致する語がない知識は含まない）
+
+        Returns:
+            (name, score) のリスト（スコア降順）
+        """
+        terms = set(ngrams(query, self.n))
+        if not terms or top_k <= 0:
+            return []
+        with self._lock:
+            count = len(self._ids)
+            if not count:
+                return []
+            avg_length = self._total_length / count
+            scores = np.zeros(len(self._names), dtype=np.float64)
+            for term in terms:
+                arrays = self._posting_arrays(term)
+                if arrays is None:
+                    continue
+                ids, tfs = arrays
+                df = len(ids)
+                weight = math.log(1 + (count - df + 0.5) / (df + 0.5)) * (self.k1 + 1)
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[ids] / avg_length)
+                scores[ids] += weight * tfs / (tfs + norm)
+
+            hits = np.flatnonzero(scores)
+            if top_k < len(hits):
+                hits = hits[np.argpartition(-scores[hits], top_k - 1)[:top_k]]
+            hits = hits[np.argsort(-scores[hits], kind="stable")]
+            return [(self._names[i], float(scores[i])) for i in hits]
+
+    def _count_terms(self, knowledge: Knowledge) -> Counter[str]:
+        """知識の語頻度（名前・説明はhead_weight倍で数える）"""
+        head = ngrams(f"{knowledge.name} {knowledge.description}", self.n)
+        terms = Counter(ngrams(knowledge.content, self.n))
+        for term in head:
+            terms[term] += self.head_weight
+        return terms
+
+    def _posting_arrays(self, term: str) -> tuple[np.ndarray, np.ndarray] | None:
+        """語の転置リストの配列（ロック保持中に呼ぶ）"""
+        arrays = self._arrays.get(term)
+        if arrays is None:
+            posting = self.postings.get(term)
+            if not posting:
+                return None
+            arrays = (
+                np.fromiter(posting.keys(), dtype=np.intp, count=len(posting)),
+                np.fromiter(posting.values(), dtype=np.float64, count=len(posting)),
+            )
+            self._arrays[term] = arrays
+        return arrays
+
+    def _add_locked(self, name: str, terms: Counter[str]) -> None:
+        if self._free:
+            doc_id = self._free.pop()
+            self._names[doc_id] = name
+        else:
+            doc_id = len(self._names)
+            self._names.append(name)
+            if doc_id >= len(self._lengths):
+                self._lengths = np.resize(self._lengths, max(64, 2 * doc_id))
+        self._ids[name] = doc_id
+        self._terms[doc_id] = terms
+        length = sum(terms.values())
+        self._lengths[doc_id] = length
+        self._total_length += length
+        for term, tf in terms.items():
+            self.postings.setdefault(term, {})[doc_id] = tf
+            self._arrays.pop(term, None)
+
+    def _remove_locked(self, name: str) -> None:
+        doc_id = self._ids.pop(name, None)
+        if doc_id is None:
+            return
+        terms = self._terms.pop(doc_id)
+        self._total_length -= int(self._lengths[doc_id])
+        self._lengths[doc_id] = 0
+        self._names[doc_id] = None
+        self._free.append(doc_id)
+        for term in terms:
+            self._arrays.pop(term, None)
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            posting.pop(doc_id, None)
+            if not posting:
+                del self.postings[term]
@@ -0,0 +1,150 @@
+"""知識のメタデータ列（ベクトル行列と行を揃えたNumPy配列）
+
+「直近90日に使った知識だけ」「version 3以上だけ」のような絞り込みを、
+Pydanticモデルを1件ずつ調べるのではなく列ごとの比較（ブールマスク）で行う。
+マスクは上位k件の選択前にスコアへ適用するので、絞り込み付きの検索も
+絞り込みなしと同じコストで済む。
+
+列:
+- project: プロジェクト名のコード（int32、コード表は列ごとに保持）
+- created: 作成日（datetime64[D]）
+- last_used: 最終利用日（datetime64[D]、未使用はNaT）
+- version: バージョン番号（int32）
+"""
+
+import operator
+from collections.abc import Callable, Sequence
+from dataclasses import dataclass
+from datetime import date, timedelta
+
+import numpy as np
+
+from mcp_brain.models import Knowledge
+
+FIELDS = ("project", "created", "last_used", "version")
+OPS: dict[str, Callable] = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    ">=": operator.ge,
+    ">": operator.gt,
+    "<=": operator.le,
+    "<": operator.lt,
+}
+NAT = np.datetime64("NaT", "D")
+
+
+@dataclass(frozen=True)
+class Filter:
+    """メタデータの絞り込み条件（例: Filter("version", ">=", 3)）
+
+    Raises:
+        ValueError: 未知の列・演算子の場合
+    """
+
+    field: str
+    op: str
+    value: str | int | date
+
+    def __post_init__(self) -> None:
+        if self.field not in FIELDS:
+            raise ValueError(
+                f"Invalid filter field '{self.field}': must be one of {FIELDS}"
+            )
+        if self.op not in OPS:
+            raise ValueError(
+                f"Invalid filter operator '{self.op}': must be one of {tuple(OPS)}"
+            )
+
+    def matches(self, value: str | int | date | None) -> bool:
+        """1件の値が条件を満たすか（値がなければFalse）"""
+        if value is None:
+            return False
+        return bool(OPS[self.op](value, self.value))
+
+
+def used_within(days: int, today: date | None = None) -> Filter:
+    """直近days日以内に利用された知識"""
+    today = today or date.today()
+    return Filter("last_used", ">=", today - timedelta(days=days))
+
+
+def min_version(version: int) -> Filter:
+    """指定バージョン以上の知識"""
+    return Filter("version", ">=", version)
+
+
+def knowledge_value(
+    knowledge: Knowledge, field: str, last_used: date | None = None
+) -> str | int | date | None:
+    """知識の列の値（last_usedは利用記録と比べた新しい方）"""
+    if field == "last_used":
+        dates = [d for d in (knowledge.last_used, last_used) if d is not None]
+        return max(dates, default=None)
+    return getattr(knowledge, field)
+
+
+class MetadataColumns:
+    """VectorStoreの行に揃えたメタデータ列"""
+
+    INITIAL_CAPACITY = 64
+
+    def __init__(self) -> None:
+        self.clear()
+
+    def clear(self) -> None:
+        """全件削除"""
+        self.project = np.zeros(0, dtype=np.int32)
+        self.created = np.zeros(0, dtype="datetime64[D]")
+        self.last_used = np.zeros(0, dtype="datetime64[D]")
+        self.version = np.zeros(0, dtype=np.int32)
+        self._codes: dict[str, int] = {}
+
+    def set(self, row: int, knowledge: Knowledge, last_used: date | None) -> None:
+        """行のメタデータを書き込む"""
+        self._ensure(row + 1)
+        self.project[row] = self._codes.setdefault(knowledge.project, len(self._codes))
+        self.created[row] = np.datetime64(knowledge.created, "D")
+        used = knowledge_value(knowledge, "last_used", last_used)
+        self.last_used[row] = NAT if used is None else np.datetime64(used, "D")
+        self.version[row] = knowledge.version
+
+    def touch(self, row: int, day: date) -> None:
+        """最終利用日を更新（古い日付では戻さない）"""
+        self._ensure(row + 1)
+        value = np.datetime64(day, "D")
+        current = self.last_used[row]
+        if np.isnat(current) or value > current:
+            self.last_used[row] = value
+
+    def mask(self, filters: Sequence[Filter], size: int) -> np.ndarray:
+        """全条件を満たす行のブールマスク（長さsize）"""
+        self._ensure(size)
+        mask = np.ones(size, dtype=bool)
+        for f in filters:
+            mask &= OPS[f.op](getattr(self, f.field)[:size], self._encode(f))
+        return mask
+
+    def _encode(self, f: Filter) -> np.generic:
+        """条件の値を列の型に変換"""
+        if f.field == "project":
+            # 未知のプロジェクトはどの行とも一致しないコード
+            return np.int32(self._codes.get(str(f.value), -1))
+        if f.field == "version":
+            return np.int32(f.value)
+        return np.datetime64(f.value, "D")
+
+    def _ensure(self, size: int) -> None:
+        """容量をsize以上に拡張（倍々）"""
+        capacity = self.project.shape[0]
+        if size <= capacity:
+            return
+        capacity = max(self.INITIAL_CAPACITY, capacity * 2, size)
+        grown = self.project.shape[0]
+        self.project = np.resize(self.project, capacity)
+        self.project[grown:] = -1
+        self.created = np.resize(self.created, capacity)
+        self.created[grown:] = NAT
+        self.last_used = np.resize(self.last_used, capacity)
+        self.last_used[grown:] = NAT
+        self.version = np.resize(self.version, capacity)
+        self.version[grown:] = 0
@@ -0,0 +1,185 @@
+"""エンコーダモデルのライフサイクル管理
+
+- 起動後にバックグラウンドで読み込んでおく（最初のsearchで読み込みを待たせない）
+- 一定時間使われなければ解放する（アイドル中のエディタで数百MBを返す）
+- 読み込み・解放を所要時間付きでログと統計に残す
+"""
+
+import gc
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterator
+
+    from sentence_transformers import SentenceTransformer
+
+logger = logging.getLogger(__name__)
+
+
+class ModelLifecycle:
+    """モデルの遅延読み込み・ウォームアップ・アイドル時の解放
+
+    Args:
+        loader: モデルを読み込む関数
+        name: ログ用の名前（モデル名）
+        idle_timeout: 最後の利用からこの秒数で解放（0なら解放しない）
+    """
+
+    def __init__(
+        self,
+        loader: "Callable[[], SentenceTransformer]",
+        name: str,
+        idle_timeout: float = 0,
+    ) -> None:
+        self._loader = loader
+        self.name = name
+        self.idle_timeout = idle_timeout
+        self._model: SentenceTransformer | None = None
+        self._cond = threading.Condition()
+        self._loading = False
+        self._in_use = 0
+        self._last_used = time.monotonic()
+        self._reaper: threading.Thread | None = None
+
+        self.loads = 0
+        self.unloads = 0
+        self.last_load_seconds: float | None = None
+        self.last_unload_seconds: float | None = None
+        self.last_error: str | None = None
+
+    @property
+    def model(self) -> "SentenceTransformer | None":
+        """読み込み済みのモデル（未読み込み・解放済みならNone）"""
+        return self._model
+
+    @model.setter
+    def model(self, model: "SentenceTransformer | None") -> None:
+        with self._cond:
+            self._model = model
+            self._last_used = time.monotonic()
+
+    @contextmanager
+    def use(self) -> "Iterator[SentenceTransformer]":
+        """モデルを使う（必要なら読み込む。使用中は解放しない）"""
+        model = self._acquire()
+        try:
+            yield model
+        finally:
+            with self._cond:
+                self._in_use -= 1
+                self._last_used = time.monotonic()
+                self._cond.notify_all()
+
+    def warm_up(self) -> threading.Thread:
+        """バックグラウンドで読み込む（失敗はログに残し、次の利用時に再試行）"""
+
+        def run() -> None:
+            try:
+                with self.use():
+                    pass
+            except Exception:
+                logger.exception("Model warm-up failed: %s", self.name)
+
+        thread = threading.Thread(target=run, name="brain-model-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def unload(self) -> bool:
+        """使用中でなければ解放（解放したらTrue）"""
+        with self._cond:
+            if self._model is None or self._in_use:
+                return False
+            self._unload_locked()
+            return True
+
+    def stats(self) -> dict[str, object]:
+        """読み込み状態と読み込み・解放の回数と所要時間"""
+        with self._cond:
+            loaded = self._model is not None
+            return {
+                "loaded": loaded,
+                "loads": self.loads,
+                "unloads": self.unloads,
+                "last_load_seconds": self.last_load_seconds,
+                "last_unload_seconds": self.last_unload_seconds,
+                "idle_seconds": (
+                    round(time.monotonic() - self._last_used, 1) if loaded else None
+                ),
+                "idle_timeout": self.idle_timeout,
+                "last_error": self.last_error,
+            }
+
+    def _acquire(self) -> "SentenceTransformer":
+        """読み込み済みのモデルを返す（並行呼び出しでも読み込みは1回だけ）"""
+        with self._cond:
+            while self._model is None and self._loading:
+                self._cond.wait()
+            if self._model is not None:
+                self._in_use += 1
+                self._last_used = time.monotonic()
+                return self._model
+            self._loading = True
+
+        # 読み込みはロック外（他の呼び出しは上のwaitで待つ）
+        start = time.perf_counter()
+        try:
+            model = self._loader()
+        except Exception as e:
+            with self._cond:
+                self._loading = False
+                self.last_error = str(e)
+                self._cond.notify_all()
+            raise
+        elapsed = time.perf_counter() - start
+
+        with self._cond:
+            self._model = model
+            self._loading = False
+            self._in_use += 1
+            self._last_used = time.monotonic()
+            self.loads += 1
+            self.last_load_seconds = round(elapsed, 3)
+            self.last_error = None
+            self._cond.notify_all()
+            self._start_reaper()
+        logger.info("Model loaded: %s (%.3fs)", self.name, elapsed)
+        return model
+
+    def _start_reaper(self) -> None:
+        """アイドル監視スレッドを開始（ロック保持中に呼ぶ）"""
+        if self.idle_timeout <= 0 or self._reaper is not None:
+            return
+        self._reaper = threading.Thread(
+            target=self._reap, name="brain-model-reaper", daemon=True
+        )
+        self._reaper.start()
+
+    def _reap(self) -> None:
+        """idle_timeout秒使われなければ解放する"""
+        with self._cond:
+            while self._model is not None:
+                if self._in_use:
+                    self._cond.wait()
+                    continue
+                idle = time.monotonic() - self._last_used
+                if idle >= self.idle_timeout:
+                    self._unload_locked()
+                    break
+                self._cond.wait(self.idle_timeout - idle)
+            self._reaper = None
+
+    def _unload_locked(self) -> None:
+        """モデルを解放して所要時間を記録（ロック保持中に呼ぶ）"""
+        idle = time.monotonic() - self._last_used
+        start = time.perf_counter()
+        self._model = None
+        gc.collect()
+        elapsed = time.perf_counter() - start
+        self.unloads += 1
+        self.last_unload_seconds = round(elapsed, 3)
+        self._cond.notify_all()
+        logger.info("Model unloaded: %s (idle %.0fs, %.3fs)", self.name, idle, elapsed)
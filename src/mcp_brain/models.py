@@ -1,6 +1,9 @@
 """Pydanticモデル定義"""
 
+import os
 import re
+import threading
+import time
 from datetime import date
 from pathlib import Path
 
@@ -13,20 +16,109 @@ KNOWLEDGE_NAME_PATTERN = re.compile(r"^[a-z0-9]+(?:-[a-z0-9]+)*$")
 PJ_BASE_DIR = Path.home() / "pj"
 
 
-def get_valid_project_names() -> set[str]:
-    """~/pj 以下の全プロジェクトフォルダ名を取得"""
-    if not PJ_BASE_DIR.exists():
-        return set()
+class ProjectRegistry:
+    """~/pj 以下のプロジェクト名のキャッシュ
+
+    プロジェクト名の検証は検索のたび・知識ファイルの読み込みのたびに走るので、
+    ディレクトリの走査結果をキャッシュする。
+
+    - TTL以内はファイルシステムに触れずにキャッシュを返す
+    - TTL切れ時は ~/pj とカテゴリディレクトリのmtimeだけを確認し、
+      変わっていなければ走査しない（プロジェクトの追加・削除で親のmtimeが変わる）
+    - refresh() で強制的に走査し直す
+
+    Args:
+        base_dir: プロジェクトのベースディレクトリ
+        ttl: mtimeを確認せずにキャッシュを使う秒数
+    """
+
+    def __init__(self, base_dir: Path, ttl: float = 60.0) -> None:
+        self.base_dir = base_dir
+        self.ttl = ttl
+        self.scans = 0
+        self._names: frozenset[str] = frozenset()
+        self._stamps: dict[str, int] | None = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def names(self, *, check: bool = False) -> frozenset[str]:
+        """プロジェクト名の集合
+
+        Args:
+            check: TTL以内でもmtimeを確認する（未知の名前を検証するとき用）
+        """
+        with self._lock:
+            fresh = time.monotonic() - self._checked < self.ttl
+            if self._stamps is not None and fresh and not check:
+                return self._names
+            stamps = self._dir_stamps()
+            if stamps != self._stamps:
+                self._scan(stamps)
+            self._checked = time.monotonic()
+            return self._names
+
+    def refresh(self) -> frozenset[str]:
+        """キャッシュを捨てて走査し直す"""
+        with self._lock:
+            self._scan(self._dir_stamps())
+            self._checked = time.monotonic()
+            return self._names
+
+    def stats(self) -> dict[str, object]:
+        """プロジェクト数・走査回数・最後の確認からの経過秒数"""
+        with self._lock:
+            return {
+                "projects": len(self._names),
+                "scans": self.scans,
+                "checked_seconds_ago": (
+                    round(time.monotonic() - self._checked, 1)
+                    if self._stamps is not None
+                    else None
+                ),
+                "ttl": self.ttl,
+            }
+
+    def _dir_stamps(self) -> dict[str, int]:
+        """ベースディレクトリとカテゴリディレクトリのmtime"""
+        try:
+            stamps = {"": self.base_dir.stat().st_mtime_ns}
+            for category in self._categories():
+                stamps[category.name] = category.stat().st_mtime_ns
+        except OSError:
+            return {}
+        return stamps
+
+    def _categories(self) -> list[os.DirEntry]:
+        with os.scandir(self.base_dir) as it:
+            return [e for e in it if e.is_dir() and not e.name.startswith(".")]
+
+    def _scan(self, stamps: dict[str, int]) -> None:
+        """~/pj/<カテゴリ>/<プロジェクト> を走査"""
+        projects = set()
+        if stamps:
+            try:
+                # ~/pj 直下のカテゴリ（my, work, other）内のプロジェクトフォルダ
+                for category in self._categories():
+                    with os.scandir(category.path) as it:
+                        projects.update(
+                            e.name
+                            for e in it
+                            if e.is_dir() and not e.name.startswith(".")
+                        )
+            except OSError:
+                pass
+        self._names = frozenset(projects)
+        self._stamps = stamps
+        self.scans += 1
+
+
+# プロセス全体で共有するプロジェクト名のキャッシュ
+project_registry = ProjectRegistry(PJ_BASE_DIR)
 
-    projects = set()
-    # ~/pj 直下のカテゴリ（my, work, other）を走査
-    for category in PJ_BASE_DIR.iterdir():
-        if category.is_dir() and not category.name.startswith("."):
-            # カテゴリ内のプロジェクトフォルダを追加
-            for project in category.iterdir():
-                if project.is_dir() and not project.name.startswith("."):
-                    projects.add(project.name)
-    return projects
+
+def get_valid_project_names() -> set[str]:
+    """~/pj 以下の全プロジェクトフォルダ名を取得（キャッシュ経由）"""
+    return set(project_registry.names())
 
 
 def validate_project_name(v: str) -> str:
@@ -51,7 +143,10 @@ def validate_project_name(v: str) -> str:
         return v
 
     # ~/pj 以下に存在するプロジェクト名のみ許可
-    valid_projects = get_valid_project_names()
+    # （キャッシュに無ければmtimeを確認して、作成直後のプロジェクトも拾う）
+    valid_projects = project_registry.names()
+    if v not in valid_projects:
+        valid_projects = project_registry.names(check=True)
     if v not in valid_projects:
         raise ValueError(
             f"Invalid project '{v}': must be 'global' or an existing project in ~/pj. "
@@ -0,0 +1,239 @@
+"""知識名の解決（前方一致のトライ + 編集距離のbigram索引）
+
+get / update / forget は完全な知識名を要求するため、1文字違いの名前でも
+"not found" になり、エージェントは名前を探し直すためだけにsearch（モデル推論）を
+1往復することになる。知識名だけの小さな索引から、モデルを使わずに
+「もしかして」の候補を返す。
+
+- 表記ゆれ（大文字・空白・アンダースコア）は正規化してkebab-caseに揃える
+- 前方一致: トライで補完候補を列挙（"create" → "create-pr"）
+- 編集距離: 距離k以内の名前を列挙（"crate-pr" → "create-pr"）
+
+編集距離の候補はBK木ではなく文字bigramの転置索引で絞る。距離k以内の名前は
+クエリのbigram（重複なし）のうち少なくとも「個数 - 2k」個を含む（1回の編集で
+壊れるbigramは高々2つ）ので、その数に満たない名前と長さがk以上違う名前を
+除いてから、残りだけ編集距離を計算する。PythonのBK木は名前の距離が
+ばらつくとほとんどの節を訪れてしまい、千件規模でミリ秒かかるため。
+"""
+
+import re
+import threading
+import unicodedata
+from collections import Counter
+from collections.abc import Callable, Iterable
+
+
+def normalize_name(name: str) -> str:
+    """kebab-caseに正規化（NFKC・小文字化、空白・記号の連続はハイフン1つ）"""
+    name = unicodedata.normalize("NFKC", name).lower()
+    return re.sub(r"[^a-z0-9]+", "-", name).strip("-")
+
+
+def edit_distance(a: str, b: str) -> int:
+    """レーベンシュタイン距離"""
+    return _distance_from(a)(b)
+
+
+def _distance_from(pattern: str) -> Callable[[str], int]:
+    """patternとの編集距離を求める関数（Myersのビット並列法）
+
+    bigramで絞った候補の名前を同じクエリと次々に比べるので、クエリ側の
+    文字ごとのビットマスクを一度だけ作って使い回す。
+    """
+    m = len(pattern)
+    if m == 0:
+        return len
+    peq: dict[str, int] = {}
+    for i, ch in enumerate(pattern):
+        peq[ch] = peq.get(ch, 0) | (1 << i)
+    mask = (1 << m) - 1
+    last = 1 << (m - 1)
+
+    def distance(text: str) -> int:
+        pv, mv, score = mask, 0, m
+        for ch in text:
+            eq = peq.get(ch, 0)
+            xv = eq | mv
+            xh = (((eq & pv) + pv) ^ pv) | eq
+            ph = mv | ~(xh | pv)
+            mh = pv & xh
+            if ph & last:
+                score += 1
+            elif mh & last:
+                score -= 1
+            ph = (ph << 1) | 1
+            mh <<= 1
+            pv = (mh | ~(xv | ph)) & mask
+            mv = ph & xv
+        return score
+
+    return distance
+
+
+class _TrieNode:
+    __slots__ = ("children", "terminal")
+
+    def __init__(self) -> None:
+        self.children: dict[str, _TrieNode] = {}
+        self.terminal = False
+
+
+def _bigrams(name: str) -> set[str]:
+    """先頭・末尾の印を付けた文字bigram（重複なし）"""
+    padded = f"^{name}$"
+    return {padded[i : i + 2] for i in range(len(padded) - 1)}
+
+
+class NameIndex:
+    """知識名の前方一致・編集距離索引"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._clear()
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._names
+
+    def _clear(self) -> None:
+        self._names: set[str] = set()
+        self._trie = _TrieNode()
+        # bigram -> その bigram を含む名前
+        self._grams: dict[str, set[str]] = {}
+
+    def build(self, names: Iterable[str]) -> None:
+        """全件を作り直す"""
+        with self._lock:
+            self._clear()
+            for name in names:
+                self._add_locked(name)
+
+    def add(self, name: str) -> None:
+        """名前を追加"""
+        with self._lock:
+            self._add_locked(name)
+
+    def remove_many(self, names: Iterable[str]) -> None:
+        """名前を削除"""
+        with self._lock:
+            for name in names:
+                if name not in self._names:
+                    continue
+                self._names.discard(name)
+                self._trie_remove(name)
+                for gram in _bigrams(name):
+                    holders = self._grams.get(gram)
+                    if holders is not None:
+                        holders.discard(name)
+                        if not holders:
+                            del self._grams[gram]
+
+    def complete(self, prefix: str, limit: int = 10) -> list[str]:
+        """prefixで始まる名前（短い順）"""
+        prefix = normalize_name(prefix)
+        with self._lock:
+            node = self._trie
+            for ch in prefix:
+                next_node = node.children.get(ch)
+                if next_node is None:
+                    return []
+                node = next_node
+            found: list[str] = []
+            stack = [(node, prefix)]
+            while stack:
+                node, path = stack.pop()
+                if node.terminal:
+                    found.append(path)
+                stack.extend((child, path + ch) for ch, child in node.children.items())
+        return sorted(found, key=lambda n: (len(n), n))[:limit]
+
+    def within(self, query: str, max_distance: int) -> list[tuple[str, int]]:
+        """編集距離がmax_distance以内の名前（距離の近い順）"""
+        query = normalize_name(query)
+        grams = _bigrams(query)
+        threshold = len(grams) - 2 * max_distance
+        with self._lock:
+            if threshold > 0:
+                counts = Counter(
+                    name for gram in grams for name in self._grams.get(gram, ())
+                )
+                candidates = [n for n, c in counts.items() if c >= threshold]
+            else:
+                # 短いクエリはbigramで絞れないので長さだけで絞る
+                candidates = list(self._names)
+        distance_to = _distance_from(query)
+        found = []
+        for name in candidates:
+            if abs(len(name) - len(query)) > max_distance:
+                continue
+            distance = distance_to(name)
+            if distance <= max_distance:
+                found.append((name, distance))
+        return sorted(found, key=lambda x: (x[1], x[0]))
+
+    def suggest(self, query: str, limit: int = 5) -> list[str]:
+        """「もしかして」の候補（正規化一致 → 編集距離の近い順 → 前方一致）"""
+        normalized = normalize_name(query)
+        if not normalized:
+            return []
+        candidates = [name for name, _ in self.within(normalized, _radius(normalized))]
+        candidates += self.complete(normalized, limit)
+        return list(dict.fromkeys(candidates))[:limit]
+
+    def resolve(self, query: str) -> str | None:
+        """紛れのない近い名前が1つだけあれば返す（なければNone）
+
+        - 正規化すると一致する名前
+        - 最も近い名前が1つだけで、距離が短い名前なら1・長い名前なら2以内
+        - 距離で見つからなければ、前方一致する名前が1つだけのとき
+        """
+        normalized = normalize_name(query)
+        if not normalized:
+            return None
+        if normalized in self:
+            return normalized
+        limit = 1 if len(normalized) < 8 else 2
+        matches = self.within(normalized, limit)
+        if matches:
+            best = [name for name, d in matches if d == matches[0][1]]
+            return best[0] if len(best) == 1 else None
+        completions = self.complete(normalized, limit=2)
+        return completions[0] if len(completions) == 1 else None
+
+    def _add_locked(self, name: str) -> None:
+        if name in self._names:
+            return
+        self._names.add(name)
+        self._trie_add(name)
+        for gram in _bigrams(name):
+            self._grams.setdefault(gram, set()).add(name)
+
+    def _trie_add(self, name: str) -> None:
+        node = self._trie
+        for ch in name:
+            node = node.children.setdefault(ch, _TrieNode())
+        node.terminal = True
+
+    def _trie_remove(self, name: str) -> None:
+        """終端を外し、子のなくなった節を刈り取る"""
+        path = [self._trie]
+        for ch in name:
+            node = path[-1].children.get(ch)
+            if node is None:
+                return
+            path.append(node)
+        path[-1].terminal = False
+        for i in range(len(name), 0, -1):
+            node = path[i]
+            if node.terminal or node.children:
+                break
+            del path[i - 1].children[name[i - 1]]
+
+
+def _radius(name: str) -> int:
+    """候補を探す編集距離（長い名前ほど広く）"""
+    if len(name) < 5:
+        return 1
+    return 2 if len(name) < 12 else 3
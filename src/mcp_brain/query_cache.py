@@ -0,0 +1,63 @@
+"""クエリ結果のLRUキャッシュ
+
+エージェントやフックは同じ（またはほぼ同じ）クエリを繰り返し投げるため、
+クエリベクトルと検索結果をキャッシュしてモデル推論を省略する。
+"""
+
+import threading
+import unicodedata
+from collections import OrderedDict
+from collections.abc import Hashable
+
+
+def normalize_query(query: str) -> str:
+    """キャッシュキー用にクエリを正規化（NFKC + 空白の畳み込み）"""
+    return " ".join(unicodedata.normalize("NFKC", query).split())
+
+
+class LRUCache:
+    """スレッドセーフな上限付きLRUキャッシュ（ヒット/ミス数を記録）"""
+
+    def __init__(self, maxsize: int = 256) -> None:
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[Hashable, object] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> object | None:
+        """値を取得（なければNone）"""
+        with self._lock:
+            if key not in self._data:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return self._data[key]
+
+    def put(self, key: Hashable, value: object) -> None:
+        """値を格納（上限を超えたら最も古いものを捨てる）"""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        """全件削除（統計は保持）"""
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict[str, int]:
+        """ヒット/ミス数とサイズ"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+        }
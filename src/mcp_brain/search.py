@@ -1,66 +1,436 @@
 """セマンティック検索"""
 
+import logging
+import threading
+from collections.abc import Callable, Sequence
+from datetime import date
 from pathlib import Path
+from typing import TYPE_CHECKING
 
 from mcp_brain.embedding import EmbeddingIndex
+from mcp_brain.index_cache import IndexCache
+from mcp_brain.lexical import LexicalIndex, reciprocal_rank_fusion
+from mcp_brain.metadata import Filter, knowledge_value
 from mcp_brain.models import Knowledge, KnowledgeSummary
+from mcp_brain.name_index import NameIndex
+
+if TYPE_CHECKING:
+    from mcp_brain.usage import UsageJournal
+
+logger = logging.getLogger(__name__)
+
+# 検索方式: vector=ベクトル検索のみ / hybrid=ベクトル検索とBM25をRRFで融合
+RETRIEVAL_MODES = ("vector", "hybrid")
+# 融合前に各検索から取り出す件数
+FUSION_DEPTH = 50
 
 
 class SemanticSearch:
     """Embeddingベースのセマンティック検索"""
 
     def __init__(
-        self, model_name: str = "cl-nagoya/ruri-v3-30m", cache_dir: Path | None = None
+        self,
+        model_name: str = "cl-nagoya/ruri-v3-30m",
+        cache_dir: Path | None = None,
+        search_mode: str = "auto",
+        ann_threshold: int = 5000,
+        backend: str = "torch",
+        model_idle_timeout: float = 0,
+        query_batch_size: int = 16,
+        query_batch_window: float = 0.005,
+        usage: "UsageJournal | None" = None,
+        retrieval: str = "vector",
     ) -> None:
-        self.embedding_index = EmbeddingIndex(model_name, cache_dir=cache_dir)
+        if retrieval not in RETRIEVAL_MODES:
+            raise ValueError(
+                f"Invalid retrieval '{retrieval}': must be one of {RETRIEVAL_MODES}"
+            )
+        self.retrieval = retrieval
+        self.embedding_index = EmbeddingIndex(
+            model_name,
+            cache_dir=cache_dir,
+            search_mode=search_mode,
+            ann_threshold=ann_threshold,
+            backend=backend,
+            model_idle_timeout=model_idle_timeout,
+            query_batch_size=query_batch_size,
+            query_batch_window=query_batch_window,
+            usage=usage,
+        )
+        self.usage = usage
+        # 文字bigramの転置インデックス（モデル不要、構築中の検索にも使う）
+        self.lexical_index = LexicalIndex()
+        # 知識名の前方一致・編集距離索引（名前の「もしかして」用）
+        self.name_index = NameIndex()
         self.knowledge_map: dict[str, Knowledge] = {}
+        self._lock = threading.Lock()
+        # バックグラウンド構築中に受け付けた変更（構築先に再適用する）。
+        # 構築中でなければNone
+        self._pending: list[tuple[str, Knowledge | list[str] | str]] | None = None
+        self.migrating_to: str | None = None
+        # ベクトルインデックスの状態（building中・failed時は語彙検索で応答）
+        self.state = "ready"
+        self.last_error: str | None = None
+
+    @property
+    def model_name(self) -> str:
+        """検索に使っているモデル名"""
+        return self.embedding_index.model_name
 
     def build(self, items: list[Knowledge]) -> None:
-        """インデックス構築（起動時）"""
+        """インデックス構築（完了まで待つ）"""
         self.knowledge_map = {k.name: k for k in items}
+        self.lexical_index.build(items)
+        self.name_index.build(k.name for k in items)
         self.embedding_index.build(items)
+        self.state = "ready"
+
+    def start_build(
+        self, items: list[Knowledge] | Callable[[], list[Knowledge]]
+    ) -> threading.Thread:
+        """インデックスをバックグラウンドで構築（待たない）
+
+        構築が終わるまでの検索は語彙一致の簡易検索で応答する。
+        構築中の追加・削除は構築後のインデックスにも再適用する。
+
+        Args:
+            items: 構築する知識。読み込み関数を渡すと読み込みも構築スレッドで行い、
+                読み込み中の追加・削除は読み込んだ知識に重ねる
+
+        Returns:
+            構築スレッド（join()で完了を待てる）
+        """
+        if callable(items):
+            return self._start_background(
+                self.model_name, None, "brain-index-build", load=items
+            )
+        return self._start_background(self.model_name, items, "brain-index-build")
 
     def rebuild(self, items: list[Knowledge], model_name: str | None = None) -> None:
-        """再インデックス（モデル切り替え対応）"""
-        if model_name:
-            self.embedding_index.rebuild(items, model_name)
+        """再インデックス（モデル切り替え時は移行が終わるまで待つ）"""
+        if model_name and model_name != self.model_name:
+            self.migrate(model_name, items).join()
         else:
-            self.embedding_index.build(items)
-        self.knowledge_map = {k.name: k for k in items}
+            self.build(items)
+
+    def migrate(
+        self, model_name: str, items: list[Knowledge] | None = None
+    ) -> threading.Thread:
+        """別モデルのインデックスをバックグラウンドで構築して切り替える
+
+        構築中は旧モデルのインデックスで検索を続け、その間の追加・削除は
+        新しいインデックスにも再適用する。完成したらアトミックに差し替え、
+        旧モデルのキャッシュを削除する。
+
+        Args:
+            model_name: 移行先のモデル名
+            items: 構築する知識（省略時は現在の知識）
+
+        Returns:
+            移行スレッド（join()で完了を待てる）
+        """
+        return self._start_background(model_name, items, "brain-migrate")
+
+    def warm_up(self) -> threading.Thread:
+        """検索に使うモデルをバックグラウンドで読み込んでおく"""
+        return self.embedding_index.warm_up()
+
+    def model_stats(self) -> dict[str, object]:
+        """モデルの読み込み状態と読み込み・解放の所要時間"""
+        return self.embedding_index.model_lifecycle.stats()
+
+    def index_status(self) -> dict[str, object]:
+        """インデックスの状態（building / ready / failed）と使用中のモデル"""
+        with self._lock:
+            return {
+                "state": self.state,
+                "model": self.model_name,
+                "migrating_to": self.migrating_to,
+                "items": len(self.knowledge_map),
+                "last_error": self.last_error,
+            }
+
+    def _start_background(
+        self,
+        model_name: str,
+        items: list[Knowledge] | None,
+        thread_name: str,
+        load: Callable[[], list[Knowledge]] | None = None,
+    ) -> threading.Thread:
+        """インデックスを別スレッドで構築し、完成したら差し替える"""
+        with self._lock:
+            if self._pending is not None:
+                target = self.migrating_to or self.model_name
+                raise RuntimeError(f"Index build in progress: {target}")
+            self._pending = []
+            if model_name != self.model_name:
+                self.migrating_to = model_name
+            else:
+                # 同じモデルの構築（起動時）: 完成するまで語彙検索で応答
+                self.state = "building"
+            if load is not None:
+                items = []
+            elif items is None:
+                items = list(self.knowledge_map.values())
+            else:
+                self.knowledge_map = {k.name: k for k in items}
+                # 語彙インデックスはすぐ作れるので先に作る（構築中の検索用）
+                self.lexical_index.build(items)
+                self.name_index.build(k.name for k in items)
+
+        target = self.embedding_index.with_model(model_name)
+        thread = threading.Thread(
+            target=self._run_background,
+            args=(target, items, load),
+            name=thread_name,
+            daemon=True,
+        )
+        thread.start()
+        return thread
+
+    def _run_background(
+        self,
+        target: EmbeddingIndex,
+        items: list[Knowledge],
+        load: Callable[[], list[Knowledge]] | None = None,
+    ) -> None:
+        """（読み込み →）構築 → 受け付けた変更を再適用 → 差し替え"""
+        try:
+            if load is not None:
+                items = self._load_items(load)
+            target.build(items)
+            while True:
+                with self._lock:
+                    ops, self._pending = self._pending or [], []
+                    if not ops:
+                        old = self.embedding_index
+                        self.embedding_index = target
+                        self._pending = None
+                        self.migrating_to = None
+                        self.state = "ready"
+                        self.last_error = None
+                        break
+                for op, arg in ops:
+                    if op == "add":
+                        target.add(arg)
+                    elif op == "used":
+                        target.mark_used(arg, date.today())
+                    else:
+                        target.remove_many(arg)
+        except Exception as e:
+            logger.exception("Index build failed: %s", target.model_name)
+            with self._lock:
+                self._pending = None
+                self.migrating_to = None
+                if self.state == "building":
+                    self.state = "failed"
+                self.last_error = str(e)
+            return
+
+        # find_similar用のk近傍グラフも構築しておく（初回のgetを待たせない）
+        target.start_graph_build()
+        if old.model_name == target.model_name:
+            logger.info("Search index ready (%d items)", len(items))
+            return
+        logger.info("Model migrated: %s -> %s", old.model_name, target.model_name)
+        old.model_lifecycle.unload()
+        if old.cache_dir:
+            cache_dir, old.cache_dir = old.cache_dir, None
+            IndexCache(cache_dir, old.model_name).delete()
+
+    def _load_items(self, load: Callable[[], list[Knowledge]]) -> list[Knowledge]:
+        """知識を読み込み、読み込み中に受け付けた追加・削除を重ねる"""
+        loaded = load()
+        with self._lock:
+            pending = self._pending or []
+            knowledge_map = {k.name: k for k in loaded}
+            for op, arg in pending:
+                if op == "add":
+                    knowledge_map[arg.name] = arg
+                elif op == "remove":
+                    for name in arg:
+                        knowledge_map.pop(name, None)
+            # 追加・削除は読み込み結果に反映済み（利用日の更新だけ構築後に再適用）
+            self._pending = [(op, arg) for op, arg in pending if op == "used"]
+            self.knowledge_map = knowledge_map
+            items = list(knowledge_map.values())
+            self.lexical_index.build(items)
+            self.name_index.build(k.name for k in items)
+        return items
+
+    def _current_index(
+        self, op: str, arg: Knowledge | list[str] | str
+    ) -> EmbeddingIndex | None:
+        """変更を反映するインデックス（構築中なら構築先への再適用も予約）
+
+        初回の構築が終わっていなければ、空のインデックスには反映せずNoneを返す。
+        ロック保持中に呼ぶ。
+        """
+        if self._pending is not None:
+            self._pending.append((op, arg))
+        return self.embedding_index if self.state == "ready" else None
 
     def add(self, knowledge: Knowledge) -> None:
         """知識を追加"""
-        self.knowledge_map[knowledge.name] = knowledge
-        self.embedding_index.add(knowledge)
+        with self._lock:
+            self.knowledge_map[knowledge.name] = knowledge
+            self.lexical_index.add(knowledge)
+            self.name_index.add(knowledge.name)
+            index = self._current_index("add", knowledge)
+        if index is not None:
+            index.add(knowledge)
 
     def update(self, knowledge: Knowledge) -> None:
         """知識を更新"""
-        self.knowledge_map[knowledge.name] = knowledge
-        self.embedding_index.update(knowledge)
+        with self._lock:
+            self.knowledge_map[knowledge.name] = knowledge
+            self.lexical_index.add(knowledge)
+            self.name_index.add(knowledge.name)
+            index = self._current_index("add", knowledge)
+        if index is not None:
+            index.update(knowledge)
 
     def remove(self, name: str) -> None:
         """知識を削除"""
-        self.knowledge_map.pop(name, None)
-        self.embedding_index.remove(name)
+        self.remove_many([name])
+
+    def remove_many(self, names: list[str]) -> None:
+        """複数の知識をまとめて削除"""
+        with self._lock:
+            for name in names:
+                self.knowledge_map.pop(name, None)
+            self.lexical_index.remove_many(names)
+            self.name_index.remove_many(names)
+            index = self._current_index("remove", list(names))
+        if index is not None:
+            index.remove_many(names)
 
-    def search(self, query: str, top_k: int = 10) -> list[KnowledgeSummary]:
+    def suggest_names(self, name: str, limit: int = 5) -> list[str]:
+        """存在しない知識名に近い名前の候補（モデル推論なし）"""
+        return self.name_index.suggest(name, limit)
+
+    def resolve_name(self, name: str) -> str | None:
+        """紛れのない近い知識名が1つだけあれば返す"""
+        return self.name_index.resolve(name)
+
+    def mark_used(self, name: str, day: date | None = None) -> None:
+        """最終利用日の列を更新（絞り込み検索用）"""
+        with self._lock:
+            index = self._current_index("used", name)
+        if index is not None:
+            index.mark_used(name, day or date.today())
+
+    def search(
+        self,
+        query: str,
+        top_k: int = 10,
+        project: str | None = None,
+        filters: Sequence[Filter] = (),
+        retrieval: str | None = None,
+    ) -> list[KnowledgeSummary]:
         """セマンティック検索
 
         Args:
             query: 自然言語クエリ
-            top_k: 返す件数
+            top_k: 返す件数（project指定時はプロジェクト・globalそれぞれの件数）
+            project: 指定するとそのプロジェクトとglobalの知識だけを検索し、
+                プロジェクトの結果 → globalの結果の順に返す
+            filters: メタデータの絞り込み条件（例: used_within(90), min_version(3)）
+            retrieval: 検索方式（省略時は設定値）。hybridはベクトル検索とBM25の
+                順位をRRFで融合する。ベクトルインデックスの準備中はBM25のみ
         """
         if not self.knowledge_map or not query:
             return []
+        retrieval = retrieval or self.retrieval
+        if retrieval not in RETRIEVAL_MODES:
+            raise ValueError(
+                f"Invalid retrieval '{retrieval}': must be one of {RETRIEVAL_MODES}"
+            )
+        groups = self._scope(project)
+        if self.state != "ready":
+            rankings = self._lexical_rankings(query, top_k, groups, filters)
+            return self._summaries(rankings)
+
+        hybrid = retrieval == "hybrid"
+        depth = max(top_k, FUSION_DEPTH) if hybrid else top_k
+        rankings = self._vector_rankings(query, depth, groups, filters)
+        if hybrid:
+            lexical = self._lexical_rankings(query, depth, groups, filters)
+            rankings = [
+                [name for name, _ in reciprocal_rank_fusion([v, lx])]
+                for v, lx in zip(rankings, lexical, strict=True)
+            ]
+        return self._summaries([ranking[:top_k] for ranking in rankings])
 
-        results = self.embedding_index.search(query, top_k=top_k)
+    @staticmethod
+    def _scope(project: str | None) -> list[str] | None:
+        """検索するパーティション（Noneなら全件）"""
+        if project is None or project == "global":
+            return None
+        return [project, "global"]
 
+    def _summaries(self, rankings: list[list[str]]) -> list[KnowledgeSummary]:
+        """グループごとの順位を連結してサマリーにする"""
         return [
             self.knowledge_map[name].to_summary()
-            for name, _ in results
+            for ranking in rankings
+            for name in ranking
             if name in self.knowledge_map
         ]
 
+    def _vector_rankings(
+        self,
+        query: str,
+        top_k: int,
+        groups: list[str] | None,
+        filters: Sequence[Filter],
+    ) -> list[list[str]]:
+        """ベクトル検索の順位（グループごと、グループなしなら1つ）"""
+        if groups is None:
+            results = self.embedding_index.search(query, top_k=top_k, filters=filters)
+            return [[name for name, _ in results]]
+        partitions = self.embedding_index.search_partitions(
+            query, groups, top_k=top_k, filters=filters
+        )
+        return [[name for name, _ in partitions[group]] for group in groups]
+
+    def _lexical_rankings(
+        self,
+        query: str,
+        top_k: int,
+        groups: list[str] | None,
+        filters: Sequence[Filter],
+    ) -> list[list[str]]:
+        """BM25の順位（グループごと、グループなしなら1つ）"""
+        if groups is None and not filters:
+            return [[name for name, _ in self.lexical_index.search(query, top_k)]]
+
+        # 絞り込み・グループ分けがあるときは一致した全件から選ぶ
+        rankings: dict[str | None, list[str]] = {g: [] for g in groups or [None]}
+        for name, _ in self.lexical_index.search(query, len(self.lexical_index)):
+            knowledge = self.knowledge_map.get(name)
+            if knowledge is None:
+                continue
+            group = None if groups is None else knowledge.project
+            ranking = rankings.get(group)
+            if ranking is None or len(ranking) >= top_k:
+                continue
+            if filters and not self._matches(knowledge, filters):
+                continue
+            ranking.append(name)
+        return list(rankings.values())
+
+    def _matches(self, knowledge: Knowledge, filters: Sequence[Filter]) -> bool:
+        """1件の知識が絞り込み条件を満たすか（語彙検索用）"""
+        last_used = self.usage.last_used(knowledge.name) if self.usage else None
+        return all(
+            f.matches(knowledge_value(knowledge, f.field, last_used)) for f in filters
+        )
+
+    def cache_stats(self) -> dict[str, object]:
+        """クエリキャッシュのヒット/ミス統計"""
+        return self.embedding_index.cache_stats()
+
     def find_similar(
         self, name: str, top_k: int = 5
     ) -> list[tuple[KnowledgeSummary, float]]:
@@ -73,16 +443,38 @@ class SemanticSearch:
         Returns:
             (知識サマリー, 類似度) のリスト
         """
-        knowledge = self.knowledge_map.get(name)
-        if not knowledge:
+        if name not in self.knowledge_map:
             return []
 
-        # 知識の説明で検索（自分自身を除外）
-        query = f"{knowledge.name} {knowledge.description}"
-        results = self.embedding_index.search(query, top_k=top_k + 1)
+        # 事前計算したk近傍グラフから取得（モデル推論なし）
+        results = self.embedding_index.similar(name, top_k=top_k)
 
         return [
             (self.knowledge_map[n].to_summary(), score)
             for n, score in results
-            if n in self.knowledge_map and n != name
-        ][:top_k]
+            if n in self.knowledge_map
+        ]
+
+    def find_similar_many(
+        self, names: list[str], top_k: int = 5
+    ) -> dict[str, list[tuple[KnowledgeSummary, float]]]:
+        """複数の知識の類似知識をまとめて取得（関連知識の幅優先展開用）
+
+        Args:
+            names: 知識名のリスト
+            top_k: 各知識について返す件数
+
+        Returns:
+            知識名 -> (知識サマリー, 類似度) のリスト
+        """
+        names = [n for n in names if n in self.knowledge_map]
+        results = self.embedding_index.similar_many(names, top_k=top_k)
+
+        return {
+            name: [
+                (self.knowledge_map[n].to_summary(), score)
+                for n, score in similar
+                if n in self.knowledge_map
+            ]
+            for name, similar in results.items()
+        }
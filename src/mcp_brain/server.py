@@ -4,16 +4,36 @@ import logging
 import os
 import subprocess
 import sys
+import threading
+import time
+from contextlib import ExitStack
 from datetime import date
 from pathlib import Path
 
 from mcp.server.fastmcp import FastMCP
 
-from .git import GitManager, GitNotAvailableError, GitOperationError
-from .models import Knowledge, validate_project_name
+from . import IMPORT_STARTED, metadata
+from .config import Settings, machine_id
+from .executor import ToolExecutor
+from .git import (
+    USAGE_CHANGE,
+    USAGE_DIR,
+    GitManager,
+    GitNotAvailableError,
+)
+from .index_cache import IndexCache
+from .models import (
+    Knowledge,
+    KnowledgeSummary,
+    project_registry,
+    validate_project_name,
+)
 from .notification import show_create_confirmation, show_stale_dialog
 from .search import SemanticSearch
+from .startup import StartupProfile
 from .storage import KnowledgeStorage
+from .sync import GitSyncWorker
+from .usage import UsageJournal
 
 # ロギング設定
 logging.basicConfig(level=logging.INFO, format="%(name)s - %(levelname)s - %(message)s")
@@ -33,6 +53,17 @@ def play_sound() -> None:
 storage: KnowledgeStorage | None = None
 search_engine: SemanticSearch | None = None
 git_manager: GitManager | None = None
+git_sync: GitSyncWorker | None = None
+usage_journal: UsageJournal | None = None
+# 利用記録を最後に同期へ登録した日（getのたびにはコミットしない）
+usage_synced_on: date | None = None
+# 知識名の紛れのない打ち間違いを自動で解決する（get / update）
+auto_resolve_names = False
+# 起動時間の内訳（statusツールでも参照できる）
+startup_profile = StartupProfile(IMPORT_STARTED)
+
+# ブロッキング処理の実行レーン（読み取りは並行、書き込みは単一ライター）
+executor = ToolExecutor()
 
 
 def get_git() -> GitManager:
@@ -42,6 +73,13 @@ def get_git() -> GitManager:
     return git_manager
 
 
+def get_git_sync() -> GitSyncWorker:
+    """Git同期キューを取得"""
+    if git_sync is None:
+        raise RuntimeError("Git sync not initialized")
+    return git_sync
+
+
 mcp = FastMCP(
     "brain",
     instructions="""AIの長期記憶。経験から学び、同じ失敗を繰り返さない。
@@ -61,6 +99,13 @@ def get_storage() -> KnowledgeStorage:
     return storage
 
 
+def get_usage() -> UsageJournal:
+    """利用記録を取得"""
+    if usage_journal is None:
+        raise RuntimeError("Usage journal not initialized")
+    return usage_journal
+
+
 def get_search() -> SemanticSearch:
     """検索エンジンを取得"""
     if search_engine is None:
@@ -69,59 +114,92 @@ def get_search() -> SemanticSearch:
 
 
 def _expand_related(
-    s: KnowledgeStorage,
-    related_names: list[str],
+    search: SemanticSearch,
+    roots: list[KnowledgeSummary],
     hops: int,
-    visited: set[str] | None = None,
+    visited: set[str],
 ) -> list[dict]:
-    """関連知識をNホップ先まで展開（自動関連用）
+    """関連知識をNホップ先まで幅優先で展開（自動関連用）
+
+    各ホップのフロンティアは1回の一括類似検索で解決し、
+    サマリーはメモリ上のインデックスから取得する（ファイル読み込みなし）。
 
     Args:
-        s: ストレージ
-        related_names: 関連知識名のリスト
-        hops: 残りホップ数
-        visited: 訪問済み知識名（循環防止）
+        search: 検索エンジン
+        roots: 1ホップ目の知識サマリー
+        hops: 展開するホップ数
+        visited: 訪問済み知識名（循環防止、更新される）
 
     Returns:
-        関連知識のサマリーリスト
+        関連知識のサマリーリスト（入れ子）
     """
-    if hops <= 0 or not related_names:
+    if hops <= 0:
         return []
 
-    if visited is None:
-        visited = set()
+    def node(summary: KnowledgeSummary) -> dict:
+        return {"name": summary.name, "description": summary.description, "related": []}
 
-    search = get_search()
     results = []
-
-    for name in related_names:
-        if name in visited:
+    nodes: dict[str, dict] = {}
+    for summary in roots:
+        if summary.name in visited:
             continue
-        visited.add(name)
+        visited.add(summary.name)
+        nodes[summary.name] = node(summary)
+        results.append(nodes[summary.name])
+
+    frontier = list(nodes)
+    for _ in range(hops - 1):
+        if not frontier:
+            break
+        # 次のホップ: フロンティア全体の類似知識を一括取得
+        similar = search.find_similar_many(frontier, top_k=3)
+        next_frontier = []
+        for parent in frontier:
+            for summary, _ in similar.get(parent, []):
+                if summary.name in visited:
+                    continue
+                visited.add(summary.name)
+                nodes[summary.name] = node(summary)
+                nodes[parent]["related"].append(nodes[summary.name])
+                next_frontier.append(summary.name)
+        frontier = next_frontier
 
-        knowledge = s.load(name)
-        if knowledge is None:
-            continue
+    return results
 
-        # 次のホップ: この知識に類似する知識を取得
-        next_similar_names = [
-            summary.name for summary, _ in search.find_similar(name, top_k=3)
-        ]
-        nested_related = _expand_related(s, next_similar_names, hops - 1, visited)
 
-        results.append(
-            {
-                "name": knowledge.name,
-                "description": knowledge.description,
-                "related": nested_related,
-            }
-        )
+def _search(
+    query: str,
+    project: str,
+    used_within_days: int | None = None,
+    min_version: int | None = None,
+) -> list[dict]:
+    """searchツールの本体"""
+    # バリデーション
+    validate_project_name(project)
+    filters = []
+    if used_within_days is not None:
+        filters.append(metadata.used_within(max(0, used_within_days)))
+    if min_version is not None:
+        filters.append(metadata.min_version(min_version))
 
-    return results
+    # project指定時はそのプロジェクトとglobalのパーティションだけを検索し、
+    # それぞれの上位件数を プロジェクト → global の順に並べる
+    results = get_search().search(query, project=project, filters=filters)
+
+    return [
+        {"name": r.name, "description": r.description, "project": r.project}
+        for r in results
+    ]
 
 
 @mcp.tool()
-async def search(query: str, project: str = "global") -> list[dict]:
+async def search(
+    query: str,
+    project: str = "global",
+    used_within_days: int | None = None,
+    min_version: int | None = None,
+) -> list[dict]:
     """過去の経験を想起。タスク開始前に「これ、前にやったことあるか？」と記憶を探る。
 
     Args:
@@ -129,25 +207,79 @@ async def search(query: str, project: str = "global") -> list[dict]:
         project: リポジトリ名（kebab-case）または "global"。
                  プロジェクト固有の知識はそのリポジトリ名、
                  汎用的な知識は "global" を指定。
+        used_within_days: 指定すると直近N日以内に使った知識だけを返す
+        min_version: 指定するとこのバージョン以上の知識だけを返す
     """
     play_sound()
+    return await executor.run_read(
+        _search, query, project, used_within_days, min_version
+    )
 
-    # バリデーション
-    validate_project_name(project)
 
-    results = get_search().search(query)
+def _load_or_suggest(name: str, resolve: bool = False) -> Knowledge:
+    """知識を読み込む（なければ近い名前を「もしかして」としてエラーに含める）
+
+    Args:
+        name: 知識名
+        resolve: 自動解決が有効なら、紛れのない近い名前の知識を読み込む
+    """
+    s = get_storage()
+    knowledge = s.load(name)
+    if knowledge is not None:
+        return knowledge
 
-    # project指定時は3グループに分割してソート
-    if project != "global":
-        matched = [r for r in results if r.project == project]
-        global_ = [r for r in results if r.project == "global"]
-        others = [r for r in results if r.project not in (project, "global")]
-        results = matched + global_ + others
+    search_eng = get_search()
+    if resolve and auto_resolve_names:
+        resolved = search_eng.resolve_name(name)
+        knowledge = s.load(resolved) if resolved else None
+        if knowledge is not None:
+            logger.info("Resolved knowledge name: %s -> %s", name, resolved)
+            return knowledge
+
+    message = f"Knowledge '{name}' not found"
+    suggestions = search_eng.suggest_names(name)
+    if suggestions:
+        message += f". Did you mean: {', '.join(suggestions)}?"
+    raise ValueError(message)
+
+
+def _get(name: str, hops: int) -> dict:
+    """getツールの本体（読み取りのみ）"""
+    # hopsのバリデーション
+    hops = max(0, min(hops, 5))
 
-    return [
-        {"name": r.name, "description": r.description, "project": r.project}
-        for r in results
-    ]
+    search_eng = get_search()
+    knowledge = _load_or_suggest(name, resolve=True)
+    requested, name = name, knowledge.name
+
+    # Embeddingベースで類似知識を自動取得
+    similar = search_eng.find_similar(name, top_k=5)
+
+    # N ホップ先まで関連知識を展開
+    related_summaries = _expand_related(
+        search_eng, [summary for summary, _ in similar], hops, visited={name}
+    )
+
+    return {
+        "name": knowledge.name,
+        "description": knowledge.description,
+        "project": knowledge.project,
+        "content": knowledge.content,
+        "version": knowledge.version,
+        "related": related_summaries,
+    } | ({"resolved_from": requested} if requested != name else {})
+
+
+def _record_usage(name: str) -> None:
+    """利用を記録（知識ファイルには触れず、他の端末へは1日1回まとめて共有）"""
+    global usage_synced_on
+
+    get_usage().record(name)
+    get_search().mark_used(name)
+    today = date.today()
+    if usage_synced_on != today:
+        usage_synced_on = today
+        get_git_sync().enqueue(USAGE_CHANGE, "usage")
 
 
 @mcp.tool()
@@ -165,26 +297,36 @@ async def get(name: str, hops: int = 2) -> dict:
     低コストは試行で解決し、getは使わない。
     """
     play_sound()
+    result = await executor.run_read(_get, name, hops)
+
+    # 利用を記録（忘却システム用、書き込みレーンで非同期に追記）
+    executor.submit_write(_record_usage, result["name"])
+    return result
 
-    # hopsのバリデーション
-    hops = max(0, min(hops, 5))
 
+def _create(
+    name: str, description: str, instructions_markdown: str, project: str
+) -> dict:
+    """createツールの本体（確認ダイアログ後に書き込みレーンで実行）"""
     s = get_storage()
-    search_eng = get_search()
-    knowledge = s.load(name)
-    if knowledge is None:
-        raise ValueError(f"Knowledge '{name}' not found")
 
-    # last_usedを更新（忘却システム用）
-    knowledge.last_used = date.today()
-    s.save(knowledge)
+    # ダイアログ表示中に作成された可能性があるので再チェック
+    if s.load(name) is not None:
+        raise ValueError(f"Knowledge '{name}' already exists")
 
-    # Embeddingベースで類似知識を自動取得
-    similar = search_eng.find_similar(name, top_k=5)
-    similar_names = [summary.name for summary, _ in similar]
+    # 知識の作成（バリデーションエラーはそのままraise）
+    knowledge = Knowledge(
+        name=name,
+        description=description,
+        content=instructions_markdown,
+        project=project,
+    )
 
-    # N ホップ先まで関連知識を展開
-    related_summaries = _expand_related(s, similar_names, hops, visited={name})
+    # 保存してインデックスに追加し、Git commit + push はバックグラウンドで実行
+    # （書き込み中に走った同期のコミットにこのファイルが混ざらないよう囲む）
+    with get_git_sync().track(name, "create"):
+        s.save(knowledge)
+        get_search().add(knowledge)
 
     return {
         "name": knowledge.name,
@@ -192,7 +334,6 @@ async def get(name: str, hops: int = 2) -> dict:
         "project": knowledge.project,
         "content": knowledge.content,
         "version": knowledge.version,
-        "related": related_summaries,
     }
 
 
@@ -228,29 +369,44 @@ async def create(
     s = get_storage()
 
     # 既存知識のチェック
-    if s.load(name) is not None:
+    if await executor.run_read(s.load, name) is not None:
         raise ValueError(f"Knowledge '{name}' already exists")
 
-    # 確認ダイアログ
-    if not show_create_confirmation(name, description):
+    # 確認ダイアログ（書き込みレーンを塞がないよう読み取りレーンで待つ）
+    if not await executor.run_read(show_create_confirmation, name, description):
         raise ValueError("ユーザーが作成をキャンセルしました")
 
-    # 知識の作成（バリデーションエラーはそのままraise）
-    knowledge = Knowledge(
-        name=name,
-        description=description,
-        content=instructions_markdown,
-        project=project,
+    return await executor.run_write(
+        _create, name, description, instructions_markdown, project
     )
 
-    # 保存
-    s.save(knowledge)
 
-    # インデックスに追加
-    get_search().add(knowledge)
+def _update(
+    name: str,
+    description: str | None,
+    content_markdown: str | None,
+    project: str | None,
+) -> dict:
+    """updateツールの本体"""
+    s = get_storage()
+    knowledge = _load_or_suggest(name, resolve=True)
+    requested, name = name, knowledge.name
+
+    # 更新を適用
+    if description is not None:
+        knowledge.description = description
+    if content_markdown is not None:
+        knowledge.content = content_markdown
+    if project is not None:
+        knowledge.project = validate_project_name(project)
+
+    # バージョンを上げる
+    knowledge.version += 1
 
-    # Git commit + push
-    get_git().commit_and_push(name, "create")
+    # 保存してインデックスを更新し、Git commit + push はバックグラウンドで実行
+    with get_git_sync().track(name, "update"):
+        s.save(knowledge)
+        get_search().update(knowledge)
 
     return {
         "name": knowledge.name,
@@ -258,7 +414,7 @@ async def create(
         "project": knowledge.project,
         "content": knowledge.content,
         "version": knowledge.version,
-    }
+    } | ({"resolved_from": requested} if requested != name else {})
 
 
 @mcp.tool()
@@ -277,38 +433,25 @@ async def update(
         project: リポジトリ名（kebab-case）または "global"（任意）
     """
     play_sound()
-    s = get_storage()
-    knowledge = s.load(name)
-    if knowledge is None:
-        raise ValueError(f"Knowledge '{name}' not found")
-
-    # 更新を適用
-    if description is not None:
-        knowledge.description = description
-    if content_markdown is not None:
-        knowledge.content = content_markdown
-    if project is not None:
-        knowledge.project = validate_project_name(project)
+    return await executor.run_write(
+        _update, name, description, content_markdown, project
+    )
 
-    # バージョンを上げる
-    knowledge.version += 1
 
-    # 保存
-    s.save(knowledge)
+def _forget(name: str) -> dict:
+    """forgetツールの本体"""
+    s = get_storage()
 
-    # インデックスを更新
-    get_search().update(knowledge)
+    # 存在確認（削除は取り消せないので自動解決はせず、候補を示すだけ）
+    _load_or_suggest(name)
 
-    # Git commit + push
-    get_git().commit_and_push(name, "update")
+    # 検索インデックスとローカルから削除し、Git commit + push はバックグラウンドで実行
+    with get_git_sync().track(name, "forget"):
+        get_search().remove(name)
+        s.delete(name)
+    get_usage().forget([name])
 
-    return {
-        "name": knowledge.name,
-        "description": knowledge.description,
-        "project": knowledge.project,
-        "content": knowledge.content,
-        "version": knowledge.version,
-    }
+    return {"deleted": name}
 
 
 @mcp.tool()
@@ -319,40 +462,117 @@ async def forget(name: str) -> dict:
         name: 削除する知識名
     """
     play_sound()
-    s = get_storage()
+    return await executor.run_write(_forget, name)
 
-    # 存在確認
-    knowledge = s.load(name)
-    if knowledge is None:
-        raise ValueError(f"Knowledge '{name}' not found")
 
-    # 検索インデックスから削除
-    get_search().remove(name)
+@mcp.tool()
+async def status() -> dict:
+    """サーバーの状態（Git同期、検索キャッシュ、インデックスとモデルの準備状況）"""
+    return {
+        "git_sync": get_git_sync().status(),
+        "search_cache": get_search().cache_stats(),
+        "search_index": get_search().index_status(),
+        "model": get_search().model_stats(),
+        "startup": startup_profile.report(),
+        "projects": project_registry.stats(),
+    }
 
-    # Git commit + push（git rmがファイル削除も行う）
-    get_git().commit_and_push(name, "forget")
 
-    return {"deleted": name}
+def _load_knowledge() -> list[Knowledge]:
+    """全知識を読み込む（起動時の構築スレッドで実行）"""
+    with startup_profile.phase("load"):
+        return get_storage().load_all()
+
+
+def _prepare_index(
+    search: SemanticSearch,
+    build: threading.Thread,
+    model_name: str,
+    warm_up: bool = True,
+) -> None:
+    """インデックスの構築を待ち、必要なら設定したモデルへ移行する（バックグラウンド）"""
+    with startup_profile.phase("index"):
+        build.join()
+    if search.state != "ready":
+        return
+    if search.model_name != model_name:
+        # 旧モデルで応答を続けながら、設定したモデルのインデックスを構築して切り替え
+        logger.info("Migrating search model: %s -> %s", search.model_name, model_name)
+        search.migrate(model_name)
+    elif warm_up:
+        # 最初のsearchでモデルの読み込みを待たせない
+        search.warm_up()
+
+
+def _serving_model(repo_dir: Path, model_name: str) -> str:
+    """起動直後に検索に使うモデル
+
+    設定したモデルのキャッシュがなく、別モデルのキャッシュがあればそちらで
+    応答を始める（設定したモデルへはバックグラウンドで移行する）。
+    """
+    cached = IndexCache.cached_models(repo_dir)
+    if not cached or model_name in cached:
+        return model_name
+    return cached[0]
 
 
-def _load_all(s: KnowledgeStorage) -> list[Knowledge]:
-    """全知識を読み込み"""
-    items = []
-    for summary in s.list_all():
-        knowledge = s.load(summary.name)
-        if knowledge:
-            items.append(knowledge)
-    return items
+def _stale_check(threshold_days: int = 30) -> None:
+    """忘却チェック: 古い知識があればGUIで通知（起動後のバックグラウンド）
+
+    ダイアログの応答待ちはこのスレッドで行い、削除は書き込みレーンに渡す。
+    """
+    stale = get_storage().get_stale(threshold_days=threshold_days, usage=get_usage())
+    if not stale:
+        return
+    stale_names = [k.name for k in stale]
+    logger.info("Found %d stale knowledge items", len(stale_names))
+    if show_stale_dialog(stale_names):
+        executor.submit_write(_delete_stale, stale_names, threshold_days)
+
+
+def _delete_stale(names: list[str], threshold_days: int) -> None:
+    """古い知識を削除（コミット・プッシュは同期キューでまとめて1回）"""
+    s = get_storage()
+    # ダイアログを待つ間に使われた・更新された知識は残す
+    still_stale = {
+        k.name for k in s.get_stale(threshold_days=threshold_days, usage=get_usage())
+    }
+    names = [name for name in names if name in still_stale]
+    if not names:
+        return
+    with ExitStack() as stack:
+        for name in names:
+            stack.enter_context(get_git_sync().track(name, "forget"))
+        for name in names:
+            s.delete(name)
+        get_search().remove_many(names)
+    get_usage().forget(names)
+    logger.info("Deleted %d stale knowledge items", len(names))
+
+
+def _open_usage_journal(repo_dir: Path) -> UsageJournal:
+    """この端末の利用記録を開く（他の端末のジャーナルもマージする）"""
+    usage_dir = repo_dir / USAGE_DIR
+    return UsageJournal(usage_dir / f"{machine_id()}.jsonl", peers_dir=usage_dir)
 
 
 def main() -> None:
-    """エントリポイント"""
-    global storage, search_engine, git_manager
+    """エントリポイント
+
+    `--startup-profile` を付けると起動時間の内訳をログに出力する。
+    """
+    global storage, search_engine, git_manager, git_sync, usage_journal
+    global auto_resolve_names
+
+    startup_profile.record("imports", time.perf_counter() - IMPORT_STARTED)
+    args = sys.argv[1:]
+    profile_enabled = "--startup-profile" in args
+    args = [a for a in args if a != "--startup-profile"]
 
     # 知識ベースディレクトリ: MCP_BRAIN_DIR > 引数 > ~/pj/my/mcp-brain-storage
     default_dir = Path.home() / "pj" / "my" / "mcp-brain-storage"
     env_dir = os.environ.get("MCP_BRAIN_DIR", "").strip()
-    knowledge_path = env_dir or (sys.argv[1] if len(sys.argv) > 1 else str(default_dir))
+    knowledge_path = env_dir or (args[0] if args else str(default_dir))
     repo_dir = Path(knowledge_path).expanduser().resolve()
     storage_dir = repo_dir / "knowledge"  # 知識ファイルはknowledge/以下に配置
     logger.info("Repository directory: %s", repo_dir)
@@ -360,42 +580,68 @@ def main() -> None:
 
     # Git管理を初期化（必須: リモート接続を検証）
     try:
-        git_manager = GitManager(repo_dir)
-        git_manager.verify_remote()
+        with startup_profile.phase("git"):
+            git_manager = GitManager(repo_dir)
+            git_manager.verify_remote()
     except GitNotAvailableError as e:
         logger.error("Git integration required: %s", e)
         sys.exit(1)
 
+    settings = Settings.from_env()
+    project_registry.ttl = settings.project_cache_ttl
+    auto_resolve_names = settings.auto_resolve_names
+
     # ストレージを初期化（knowledge/以下）
     storage = KnowledgeStorage(storage_dir)
 
-    # 検索エンジンを初期化（キャッシュはリポジトリrootに配置）
-    search_engine = SemanticSearch(cache_dir=repo_dir)
-
-    # 起動時に全知識をインデックス化（キャッシュがあれば即座に完了）
-    logger.info("Initializing search index...")
-    items = _load_all(storage)
-    search_engine.build(items)
-    logger.info("Search index ready (%d items)", len(items))
-
-    # 忘却チェック: 古い知識があればGUIで通知
-    stale = storage.get_stale(threshold_days=30)
-    if stale:
-        stale_names = [k.name for k in stale]
-        logger.info("Found %d stale knowledge items", len(stale_names))
-
-        if show_stale_dialog(stale_names):
-            # 削除を選択（バッチ処理なので1件の失敗で中断しない）
-            for k in stale:
-                search_engine.remove(k.name)
-                storage.delete(k.name)
-                try:
-                    git_manager.commit_and_push(k.name, "forget")
-                except GitOperationError:
-                    logger.exception("Failed to commit stale deletion: %s", k.name)
-            logger.info("Deleted %d stale knowledge items", len(stale))
-
-    mcp.run()
+    # 利用記録（端末ごとのジャーナルをリポジトリに置き、全端末分をマージして使う）
+    with startup_profile.phase("usage"):
+        usage_journal = _open_usage_journal(repo_dir)
+
+    # 検索エンジンを初期化（キャッシュはリポジトリrootの.index/に配置）
+    serving_model = _serving_model(repo_dir, settings.model_name)
+    search_engine = SemanticSearch(
+        model_name=serving_model,
+        cache_dir=repo_dir,
+        search_mode=settings.search_mode,
+        ann_threshold=settings.ann_threshold,
+        backend=settings.encoder_backend,
+        model_idle_timeout=settings.model_idle_timeout,
+        query_batch_size=settings.query_batch_size,
+        query_batch_window=settings.query_batch_window,
+        usage=usage_journal,
+        retrieval=settings.search_retrieval,
+    )
+
+    # 知識の読み込みとインデックスの構築はバックグラウンドで行い、MCPの応答は
+    # すぐに始める（構築が終わるまでsearchは語彙一致の簡易検索で応答し、
+    # その間の追加・削除は読み込んだ知識に重ねる）
+    build = search_engine.start_build(_load_knowledge)
+    threading.Thread(
+        target=_prepare_index,
+        args=(search_engine, build, settings.model_name, settings.model_warm_up),
+        name="brain-index-init",
+        daemon=True,
+    ).start()
+
+    # Git同期キュー（ツールはローカル保存後すぐに返る）
+    git_sync = GitSyncWorker(git_manager, debounce=settings.git_sync_debounce)
+    git_sync.start()
+
+    # 忘却チェックはダイアログの応答を待つので、接続の受け付けを止めない
+    threading.Thread(target=_stale_check, name="brain-stale-check", daemon=True).start()
+
+    startup_profile.mark_ready()
+    if profile_enabled:
+        startup_profile.log()
+
+    try:
+        mcp.run()
+    finally:
+        executor.shutdown()
+        # 未同期の変更（今日の利用記録を含む）を可能な範囲でcommit + push
+        git_sync.enqueue(USAGE_CHANGE, "usage")
+        git_sync.stop()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,143 @@
+"""文書ベクトルのk近傍グラフ
+
+find_similar（関連知識の自動連想）のたびにモデルで再エンコードしないよう、
+保存済みの文書ベクトル同士の類似度から上位k件の近傍を事前計算しておく。
+インデックスの追加・削除に合わせて影響する行だけを差分更新する。
+"""
+
+import numpy as np
+
+from mcp_brain.vector_store import VectorStore
+
+
+class SimilarityGraph:
+    """k近傍グラフ（初回参照時に構築し、以降は差分更新）
+
+    Args:
+        k: 各文書について保持する近傍数
+        block_size: 一括構築時に一度に計算する行数
+    """
+
+    def __init__(self, k: int = 10, block_size: int = 256) -> None:
+        self.k = k
+        self.block_size = block_size
+        self.ready = False
+        # 知識名 -> [(近傍名, 類似度)]（類似度降順）
+        self.neighbors: dict[str, list[tuple[str, float]]] = {}
+        # 知識名 -> その知識を近傍に持つ知識名（削除時の影響範囲）
+        self._reverse: dict[str, set[str]] = {}
+        # 行番号 -> 近傍k番目の類似度（k件未満なら-inf）。差分更新の絞り込み用
+        self._kth = np.zeros(0, dtype=np.float32)
+
+    def invalidate(self) -> None:
+        """全体を破棄（次回参照時に再構築）"""
+        self.ready = False
+        self.neighbors = {}
+        self._reverse = {}
+        self._kth = np.zeros(0, dtype=np.float32)
+
+    def build(self, store: VectorStore) -> None:
+        """ブロック単位の行列積で全文書の近傍を計算"""
+        self.invalidate()
+        rows = np.flatnonzero(store.valid)
+        for name in store.names[rows]:
+            self._reverse[name] = set()
+
+        matrix = store.matrix[rows]
+        for start in range(0, rows.size, self.block_size):
+            block = matrix[start : start + self.block_size]
+            scores = block @ matrix.T
+            # 自分自身を除外
+            idx = np.arange(block.shape[0])
+            scores[idx, start + idx] = -np.inf
+            for i, row_scores in enumerate(scores):
+                name = store.names[rows[start + i]]
+                self._set(store, name, self._top(row_scores, store.names[rows]))
+        self.ready = True
+
+    def get(self, name: str, top_k: int) -> list[tuple[str, float]] | None:
+        """近傍を取得（top_kがkを超える場合はNone）"""
+        if top_k > self.k:
+            return None
+        return self.neighbors.get(name, [])[:top_k]
+
+    def upsert(self, store: VectorStore, name: str) -> None:
+        """追加・更新された文書の近傍と、他文書の近傍リストを差分更新"""
+        if not self.ready:
+            return
+        if name in self.neighbors:
+            self.remove(store, name)
+
+        vector = store.get(name)
+        if vector is None:
+            return
+        scores = store.scores(vector)
+        row = store.row_of(name)
+        scores[row] = -np.inf
+        self._reverse.setdefault(name, set())
+        self._set(store, name, self._top(scores, store.names[: scores.shape[0]]))
+
+        # 新しい文書が近傍k番目より近くなる他文書だけを更新
+        kth = self._kth_for(store)[: scores.shape[0]]
+        for other_row in np.flatnonzero(scores > kth):
+            other = store.names[other_row]
+            current = self.neighbors.get(other, [])
+            updated = sorted(
+                [*current, (name, float(scores[other_row]))],
+                key=lambda x: x[1],
+                reverse=True,
+            )
+            self._set(store, other, updated[: self.k])
+
+    def remove(self, store: VectorStore, name: str) -> None:
+        """削除された文書を近傍に持っていた文書だけを再計算"""
+        if not self.ready:
+            return
+        self._set(store, name, [])
+        self.neighbors.pop(name, None)
+        affected = self._reverse.pop(name, set())
+        for other in affected:
+            vector = store.get(other)
+            if vector is None or other not in self.neighbors:
+                continue
+            scores = store.scores(vector)
+            scores[store.row_of(other)] = -np.inf
+            if name in store:
+                scores[store.row_of(name)] = -np.inf
+            self._set(store, other, self._top(scores, store.names[: scores.shape[0]]))
+
+    def _top(self, scores: np.ndarray, names: np.ndarray) -> list[tuple[str, float]]:
+        """スコア上位k件"""
+        k = min(self.k, scores.shape[0])
+        if k <= 0:
+            return []
+        if k < scores.shape[0]:
+            idx = np.argpartition(-scores, k - 1)[:k]
+        else:
+            idx = np.arange(scores.shape[0])
+        idx = idx[np.argsort(-scores[idx], kind="stable")]
+        return [(names[i], float(scores[i])) for i in idx if np.isfinite(scores[i])]
+
+    def _kth_for(self, store: VectorStore) -> np.ndarray:
+        """行番号に揃えたk番目類似度の配列（ストアの容量に合わせて拡張）"""
+        capacity = store.matrix.shape[0]
+        if self._kth.shape[0] < capacity:
+            grown = np.full(capacity, -np.inf, dtype=np.float32)
+            grown[: self._kth.shape[0]] = self._kth
+            self._kth = grown
+        return self._kth
+
+    def _set(
+        self, store: VectorStore, name: str, neighbors: list[tuple[str, float]]
+    ) -> None:
+        """近傍リストを置き換え、逆引きとk番目類似度を更新"""
+        for old, _ in self.neighbors.get(name, []):
+            self._reverse.get(old, set()).discard(name)
+        self.neighbors[name] = neighbors
+        for new, _ in neighbors:
+            self._reverse.setdefault(new, set()).add(name)
+
+        row = store.row_of(name)
+        if row is not None:
+            kth = self._kth_for(store)
+            kth[row] = neighbors[-1][1] if len(neighbors) >= self.k else -np.inf
@@ -0,0 +1,67 @@
+"""起動時間の内訳（--startup-profile）
+
+MCPのハンドシェイクを受け付けるまでの時間を段階ごとに記録する。
+重いモジュール（torchなど）がハンドシェイク前に読み込まれていないかも併せて記録し、
+起動時間の劣化に気づけるようにする。
+"""
+
+import logging
+import sys
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# ハンドシェイク前には読み込まれていてほしくないモジュール
+HEAVY_MODULES = ("torch", "transformers", "sentence_transformers", "onnxruntime")
+
+
+class StartupProfile:
+    """起動処理の段階ごとの所要時間
+
+    Args:
+        started: 計測の起点（time.perf_counter()の値）
+    """
+
+    def __init__(self, started: float) -> None:
+        self.started = started
+        self.phases: dict[str, float] = {}
+        self.ready: float | None = None
+        self.heavy_modules: list[str] = []
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """ブロックの所要時間を記録"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name: str, seconds: float) -> None:
+        """段階の所要時間を記録（同名は加算）"""
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def mark_ready(self) -> None:
+        """ハンドシェイクを受け付けられる状態になった時点を記録"""
+        self.ready = time.perf_counter() - self.started
+        self.heavy_modules = [m for m in HEAVY_MODULES if m in sys.modules]
+
+    def report(self) -> dict[str, object]:
+        """内訳（秒）"""
+        return {
+            "ready": round(self.ready, 3) if self.ready is not None else None,
+            "phases": {name: round(s, 3) for name, s in self.phases.items()},
+            "heavy_modules_at_ready": self.heavy_modules,
+        }
+
+    def log(self) -> None:
+        """内訳をログ出力（stdoutはMCPの通信に使うのでログのみ）"""
+        logger.info("Startup profile: ready in %.3fs", self.ready or 0.0)
+        for name, seconds in self.phases.items():
+            logger.info("  %-12s %8.3fs", name, seconds)
+        if self.heavy_modules:
+            logger.warning(
+                "Heavy modules imported before ready: %s", ", ".join(self.heavy_modules)
+            )
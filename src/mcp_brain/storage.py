@@ -1,13 +1,16 @@
 """知識ファイルの読み書き"""
 
 import logging
+import os
 import re
+import threading
 from datetime import date, timedelta
 from pathlib import Path
 
 import yaml
 
 from .models import Knowledge, KnowledgeSummary
+from .usage import UsageJournal
 
 logger = logging.getLogger(__name__)
 
@@ -16,7 +19,11 @@ FRONTMATTER_PATTERN = re.compile(r"^---\s*\n(.*?)\n---\s*\n?", re.DOTALL)
 
 
 class KnowledgeStorage:
-    """知識ファイルのストレージ"""
+    """知識ファイルのストレージ
+
+    パース済みの知識をファイルの (mtime, サイズ) と一緒にメモリに保持し、
+    変更のあったファイルだけを読み直す（手動編集・git pullにも追従）。
+    """
 
     def __init__(self, knowledge_dir: Path) -> None:
         if not knowledge_dir or str(knowledge_dir) == "":
@@ -25,6 +32,9 @@ class KnowledgeStorage:
         self.knowledge_dir = Path(knowledge_dir).expanduser().resolve()
         logger.info("KnowledgeStorage initialized: %s", self.knowledge_dir)
         self.knowledge_dir.mkdir(parents=True, exist_ok=True)
+        # 知識名 -> (mtime_ns, サイズ, パース結果)（パース失敗はNone）
+        self._catalog: dict[str, tuple[int, int, Knowledge | None]] = {}
+        self._lock = threading.Lock()
 
     def _knowledge_path(self, name: str) -> Path:
         """知識ファイルのパスを取得"""
@@ -32,14 +42,11 @@ class KnowledgeStorage:
 
     def list_all(self) -> list[KnowledgeSummary]:
         """全知識を取得"""
-        items = []
-        for item_file in self.knowledge_dir.iterdir():
-            if item_file.is_file() and item_file.suffix == ".md":
-                name = item_file.stem
-                knowledge = self.load(name)
-                if knowledge:
-                    items.append(knowledge.to_summary())
-        return items
+        return [k.to_summary() for k in self._scan()]
+
+    def load_all(self) -> list[Knowledge]:
+        """全知識を読み込み"""
+        return [k.model_copy() for k in self._scan()]
 
     def search(self, query: str) -> list[KnowledgeSummary]:
         """クエリに一致する知識を検索"""
@@ -56,11 +63,48 @@ class KnowledgeStorage:
     def load(self, name: str) -> Knowledge | None:
         """知識を読み込み"""
         path = self._knowledge_path(name)
-        if not path.exists():
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            with self._lock:
+                self._catalog.pop(name, None)
             return None
 
+        knowledge = self._cached(name, path, stat)
+        return knowledge.model_copy() if knowledge else None
+
+    def _cached(self, name: str, path: Path, stat: os.stat_result) -> Knowledge | None:
+        """カタログから取得（mtime・サイズが変わっていればパースし直す）"""
+        key = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            entry = self._catalog.get(name)
+        if entry is not None and entry[:2] == key:
+            return entry[2]
+
         text = path.read_text(encoding="utf-8")
-        return self._parse_knowledge_file(name, text)
+        knowledge = self._parse_knowledge_file(name, text)
+        with self._lock:
+            self._catalog[name] = (*key, knowledge)
+        return knowledge
+
+    def _scan(self) -> list[Knowledge]:
+        """ディレクトリを走査してカタログを更新（変更のないファイルは読まない）"""
+        items = []
+        seen = set()
+        with os.scandir(self.knowledge_dir) as entries:
+            for entry in entries:
+                if not entry.is_file() or not entry.name.endswith(".md"):
+                    continue
+                name = entry.name[: -len(".md")]
+                seen.add(name)
+                knowledge = self._cached(name, Path(entry.path), entry.stat())
+                if knowledge:
+                    items.append(knowledge)
+
+        with self._lock:
+            for name in self._catalog.keys() - seen:
+                del self._catalog[name]
+        return items
 
     def save(self, knowledge: Knowledge) -> None:
         """知識を保存
@@ -76,6 +120,9 @@ class KnowledgeStorage:
         try:
             text = self._serialize_knowledge(knowledge)
             path.write_text(text, encoding="utf-8")
+            # 次回読み込み時にパースし直す
+            with self._lock:
+                self._catalog.pop(knowledge.name, None)
             logger.info("Knowledge saved successfully: %s", knowledge.name)
         except OSError as e:
             logger.error(
@@ -94,20 +141,29 @@ class KnowledgeStorage:
             return False
 
         path.unlink()
+        with self._lock:
+            self._catalog.pop(name, None)
         return True
 
-    def get_stale(self, threshold_days: int = 30) -> list[Knowledge]:
-        """古い知識を取得（最終使用日からthreshold_days以上経過）"""
+    def get_stale(
+        self, threshold_days: int = 30, usage: UsageJournal | None = None
+    ) -> list[Knowledge]:
+        """古い知識を取得（最終使用日からthreshold_days以上経過）
+
+        Args:
+            threshold_days: 経過日数のしきい値
+            usage: 利用記録（ファイルのlast_usedより新しければそちらを使う）
+        """
         cutoff = date.today() - timedelta(days=threshold_days)
         stale = []
 
-        for summary in self.list_all():
-            knowledge = self.load(summary.name)
-            if knowledge is None:
-                continue
-
+        for knowledge in self.load_all():
             # last_usedがなければcreatedを使用
             last_active = knowledge.last_used or knowledge.created
+            if usage is not None:
+                last_active = max(
+                    last_active, usage.last_used(knowledge.name) or last_active
+                )
             if last_active < cutoff:
                 stale.append(knowledge)
 
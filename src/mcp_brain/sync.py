@@ -0,0 +1,227 @@
+"""Git同期のバックグラウンドキュー
+
+ツール呼び出しはファイルをローカルに保存した時点で返し、
+commit + push は専用スレッドでまとめて行う。
+
+- 短時間に続いた変更はデバウンスして1コミットにまとめる
+- 同じ知識への連続した変更は最後の操作だけを反映する
+- pushに失敗したら指数バックオフで再試行する（ツール呼び出しは失敗させない）
+- 書き込み中・コミット待ちの知識ファイルは、同期中のコミット（手動変更の保護を
+  含む）に巻き込まない
+"""
+
+import logging
+import threading
+import time
+from collections.abc import Callable, Collection, Iterator, Sequence
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Protocol
+
+from .git import GitOperationError
+
+logger = logging.getLogger(__name__)
+
+
+class GitSyncTarget(Protocol):
+    """同期先（GitManager）のインターフェース"""
+
+    def commit_changes(
+        self,
+        changes: Sequence[tuple[str, str]],
+        busy: Callable[[], Collection[str]] | None = None,
+    ) -> None: ...
+
+    def push(self) -> None: ...
+
+
+class GitSyncWorker:
+    """変更をまとめてcommit + pushするワーカースレッド
+
+    Args:
+        git: 同期先
+        debounce: 最後の変更からコミットまで待つ秒数
+        base_backoff: 失敗時の最初の再試行間隔（秒）
+        max_backoff: 再試行間隔の上限（秒）
+    """
+
+    def __init__(
+        self,
+        git: GitSyncTarget,
+        debounce: float = 1.0,
+        base_backoff: float = 2.0,
+        max_backoff: float = 300.0,
+    ) -> None:
+        self.git = git
+        self.debounce = debounce
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+        self._cond = threading.Condition()
+        # 知識名 -> 操作（同名は最後の操作で上書き）
+        self._pending: dict[str, str] = {}
+        # 知識名 -> 書き込み中の数（trackの中）
+        self._writing: dict[str, int] = {}
+        self._in_flight = 0
+        self._needs_push = False
+        self._last_enqueue = 0.0
+        self._flushing = False
+        self._stopping = False
+        self._thread: threading.Thread | None = None
+
+        self.last_sync: datetime | None = None
+        self.last_error: str | None = None
+        self.failures = 0
+
+    def start(self) -> None:
+        """ワーカースレッドを開始"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=self._run, name="brain-git-sync", daemon=True
+        )
+        self._thread.start()
+
+    def enqueue(self, name: str, action: str) -> None:
+        """変更を登録（すぐに返る）
+
+        Args:
+            name: 知識名
+            action: 操作（create, update, forget）
+        """
+        with self._cond:
+            # 再登録時は末尾へ移動（コミットメッセージを操作順にする）
+            self._pending.pop(name, None)
+            self._pending[name] = action
+            self._last_enqueue = time.monotonic()
+            self._cond.notify_all()
+
+    @contextmanager
+    def track(self, name: str, action: str) -> Iterator[None]:
+        """知識ファイルの書き込みを囲み、正常に抜けたら変更を登録する
+
+        書き込み中のファイルは、その間に走った同期のコミットに含めない
+        （手動変更として別のコミットに入ってしまうのを防ぐ）。
+
+        Args:
+            name: 知識名
+            action: 操作（create, update, forget）
+        """
+        with self._cond:
+            self._writing[name] = self._writing.get(name, 0) + 1
+        try:
+            yield
+            self.enqueue(name, action)
+        finally:
+            with self._cond:
+                self._writing[name] -= 1
+                if not self._writing[name]:
+                    del self._writing[name]
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """デバウンスを待たずに同期し、キューが空になるまで待つ
+
+        Returns:
+            時間内に同期が完了したらTrue
+        """
+        with self._cond:
+            self._flushing = True
+            self._cond.notify_all()
+            done = self._cond.wait_for(self._idle, timeout)
+            self._flushing = False
+            return done
+
+    def stop(self, timeout: float | None = 10.0) -> None:
+        """残りの変更を同期してから停止（失敗しても待ちすぎない）"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def status(self) -> dict:
+        """キューの深さと最終同期の状態"""
+        with self._cond:
+            return {
+                "pending": len(self._pending) + self._in_flight,
+                "unpushed": self._needs_push,
+                "last_sync": self.last_sync.isoformat() if self.last_sync else None,
+                "last_error": self.last_error,
+                "consecutive_failures": self.failures,
+            }
+
+    def _busy(self) -> set[str]:
+        """書き込み中・コミット待ちの知識名（同期中のコミットから外す）"""
+        with self._cond:
+            return set(self._writing) | set(self._pending)
+
+    def _idle(self) -> bool:
+        return not self._pending and not self._in_flight and not self._needs_push
+
+    def _run(self) -> None:
+        """デバウンス → 一括コミット → push を繰り返す"""
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: not self._idle() or self._stopping)
+                if self._stopping and self._idle():
+                    return
+                self._wait_debounce()
+                batch = list(self._pending.items())
+                self._pending.clear()
+                self._in_flight = len(batch)
+
+            ok = self._sync(batch)
+
+            with self._cond:
+                self._in_flight = 0
+                self._cond.notify_all()
+                if ok:
+                    continue
+                if self._stopping:
+                    logger.error(
+                        "Git sync stopped with %d unsynced changes",
+                        len(self._pending),
+                    )
+                    return
+                delay = min(
+                    self.base_backoff * 2 ** (self.failures - 1), self.max_backoff
+                )
+                logger.info("Retrying git sync in %.1fs", delay)
+                self._cond.wait_for(lambda: self._stopping or self._flushing, delay)
+
+    def _wait_debounce(self) -> None:
+        """最後の変更からdebounce秒経つまで待つ（ロック保持中に呼ぶ）"""
+        while not self._stopping and not self._flushing:
+            remaining = self._last_enqueue + self.debounce - time.monotonic()
+            if remaining <= 0:
+                return
+            self._cond.wait(remaining)
+
+    def _sync(self, batch: list[tuple[str, str]]) -> bool:
+        """コミットとpushを実行（成功したらTrue）"""
+        committed = False
+        try:
+            if batch:
+                self.git.commit_changes(batch, busy=self._busy)
+                committed = self._needs_push = True
+            if self._needs_push:
+                self.git.push()
+                self._needs_push = False
+        except (GitOperationError, OSError) as e:
+            logger.warning("Git sync failed: %s", e)
+            with self._cond:
+                # コミットできなかった変更を戻す（新しい変更があればそちらを優先）
+                if not committed:
+                    for name, action in batch:
+                        self._pending.setdefault(name, action)
+                self.last_error = str(e)
+                self.failures += 1
+            return False
+
+        with self._cond:
+            self.last_sync = datetime.now().astimezone()
+            self.last_error = None
+            self.failures = 0
+        logger.info("Git sync completed (%d changes)", len(batch))
+        return True
@@ -0,0 +1,224 @@
+"""知識の利用記録（追記専用ジャーナル）
+
+getのたびに知識ファイルのlast_usedを書き換えると、読み取りなのにディスク書き込みが
+発生し、インデックスキャッシュも無効になる。
+利用日と利用回数は知識ファイルとは別のJSONLファイルに1行ずつ追記し、
+一定量たまったらスナップショットに書き直す（コンパクション）。
+
+ジャーナルは端末ごとに1ファイルで、知識リポジトリに置いてGitで共有する
+（同じファイルに複数の端末が追記しないので競合しない）。読み込み時に
+他の端末のジャーナルもマージするので、忘却チェックは誰か1人でも最近使った知識を
+古いとみなさない。
+
+行の形式:
+- 利用: {"n": 知識名, "d": 利用日, "c": 回数}（回数は加算、日付は新しい方）
+- 削除: {"n": 知識名, "rm": true, "d": 削除日}（削除日以前の他端末の記録も無視する）
+"""
+
+import json
+import logging
+import threading
+from dataclasses import dataclass
+from datetime import date
+from pathlib import Path
+
+from .index_cache import CACHE_WRITE_LOCK
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class UsageRecord:
+    """知識ごとの利用状況"""
+
+    last_used: date
+    count: int = 0
+
+
+class UsageJournal:
+    """利用記録のジャーナル
+
+    Args:
+        path: この端末のジャーナルファイルのパス（追記先）
+        compact_threshold: この行数を超えて追記したらコンパクションする
+            （記録件数の方が多ければそちらを基準にする）
+        peers_dir: 他の端末のジャーナル（*.jsonl）を置くディレクトリ
+            （読み込んでマージするだけで、書き込まない）
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        compact_threshold: int = 1000,
+        peers_dir: Path | None = None,
+    ) -> None:
+        self.path = path
+        self.compact_threshold = compact_threshold
+        self.peers_dir = peers_dir
+        # この端末の記録と削除（知識名 -> 削除日）
+        self.records: dict[str, UsageRecord] = {}
+        self.removed: dict[str, date] = {}
+        # 他の端末の記録をマージしたもの
+        self.peers: dict[str, UsageRecord] = {}
+        self._lines = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    def record(self, name: str, day: date | None = None) -> None:
+        """利用を記録（1行追記）"""
+        day = day or date.today()
+        with self._lock:
+            record = self.records.get(name)
+            if record is None:
+                record = self.records[name] = UsageRecord(last_used=day)
+            record.last_used = max(record.last_used, day)
+            record.count += 1
+            self._append({"n": name, "d": day.isoformat(), "c": 1})
+            self._compact_if_needed()
+
+    def forget(self, names: list[str], day: date | None = None) -> None:
+        """削除した知識の記録を消す（他の端末の記録も含めて無視する）"""
+        day = day or date.today()
+        with self._lock:
+            for name in names:
+                own = self.records.pop(name, None)
+                peer = self.peers.pop(name, None)
+                if own is not None or peer is not None:
+                    self.removed[name] = day
+                    self._append({"n": name, "rm": True, "d": day.isoformat()})
+            self._compact_if_needed()
+
+    def last_used(self, name: str) -> date | None:
+        """最終利用日（全端末で最も新しい日、記録がなければNone）"""
+        days = [r.last_used for r in self._records_of(name)]
+        return max(days) if days else None
+
+    def count(self, name: str) -> int:
+        """利用回数（全端末の合計）"""
+        return sum(r.count for r in self._records_of(name))
+
+    def _records_of(self, name: str) -> list[UsageRecord]:
+        """この端末と他の端末の記録"""
+        return [r for r in (self.records.get(name), self.peers.get(name)) if r]
+
+    def compact(self) -> None:
+        """現在の記録だけのスナップショットに書き直す（アトミック）"""
+        with self._lock:
+            self._compact()
+
+    def _load(self) -> None:
+        """この端末と他の端末のジャーナルを再生してマージ"""
+        if self.path.exists():
+            self.records, self.removed, self._lines = _replay(self.path)
+        peer_removed: dict[str, date] = {}
+        if self.peers_dir is not None and self.peers_dir.is_dir():
+            for peer in sorted(self.peers_dir.glob("*.jsonl")):
+                if peer.resolve() == self.path.resolve():
+                    continue
+                records, removed, _ = _replay(peer)
+                _merge(self.peers, records)
+                for name, day in removed.items():
+                    peer_removed[name] = max(day, peer_removed.get(name, day))
+        # 他の端末で削除された知識は、削除日より前の記録を無視する
+        # （同じジャーナル内の順序は再生時に反映済み）
+        _drop_removed(self.records, peer_removed)
+        _drop_removed(self.peers, peer_removed)
+        _drop_removed(self.peers, self.removed)
+        logger.info(
+            "Usage journal loaded: %d records, %d lines, %d from other machines",
+            len(self.records),
+            self._lines,
+            len(self.peers),
+        )
+
+    def _append(self, entry: dict) -> None:
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with CACHE_WRITE_LOCK, self.path.open("a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._lines += 1
+        except OSError as e:
+            logger.warning("Failed to append usage journal: %s", e)
+
+    def _compact_if_needed(self) -> None:
+        size = len(self.records) + len(self.removed)
+        if self._lines > max(self.compact_threshold, 2 * size):
+            self._compact()
+
+    def _compact(self) -> None:
+        tmp = self.path.with_suffix(".tmp")
+        # 削除は他の端末の古い記録を打ち消すために残す（再生順のため記録より前）
+        entries = [
+            {"n": name, "rm": True, "d": day.isoformat()}
+            for name, day in self.removed.items()
+        ]
+        entries += [
+            {"n": name, "d": record.last_used.isoformat(), "c": record.count}
+            for name, record in self.records.items()
+        ]
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with tmp.open("w", encoding="utf-8") as f:
+                for entry in entries:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            with CACHE_WRITE_LOCK:
+                tmp.replace(self.path)
+        except OSError as e:
+            logger.warning("Failed to compact usage journal: %s", e)
+            return
+        logger.info(
+            "Usage journal compacted: %d -> %d lines", self._lines, len(entries)
+        )
+        self._lines = len(entries)
+
+
+def _replay(path: Path) -> tuple[dict[str, UsageRecord], dict[str, date], int]:
+    """ジャーナルを先頭から再生（壊れた行は読み飛ばす）
+
+    Returns:
+        (記録, 知識名 -> 削除日, 行数)
+    """
+    records: dict[str, UsageRecord] = {}
+    removed: dict[str, date] = {}
+    lines = 0
+    try:
+        f = path.open(encoding="utf-8")
+    except OSError as e:
+        logger.warning("Failed to read usage journal %s: %s", path, e)
+        return records, removed, lines
+    with f:
+        for line in f:
+            lines += 1
+            try:
+                entry = json.loads(line)
+                name = entry["n"]
+                day = date.fromisoformat(entry["d"])
+                if entry.get("rm"):
+                    records.pop(name, None)
+                    removed[name] = max(day, removed.get(name, day))
+                    continue
+                count = int(entry.get("c", 1))
+            except (ValueError, KeyError, TypeError):
+                logger.warning("Skipping broken usage journal line: %r", line)
+                continue
+            _merge(records, {name: UsageRecord(last_used=day, count=count)})
+    return records, removed, lines
+
+
+def _merge(into: dict[str, UsageRecord], records: dict[str, UsageRecord]) -> None:
+    """記録を足し合わせる（日付は新しい方、回数は合計）"""
+    for name, record in records.items():
+        current = into.get(name)
+        if current is None:
+            into[name] = UsageRecord(record.last_used, record.count)
+        else:
+            current.last_used = max(current.last_used, record.last_used)
+            current.count += record.count
+
+
+def _drop_removed(records: dict[str, UsageRecord], removed: dict[str, date]) -> None:
+    """削除日より前の記録を消す"""
+    for name, day in removed.items():
+        record = records.get(name)
+        if record is not None and record.last_used < day:
+            del records[name]
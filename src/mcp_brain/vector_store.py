@@ -0,0 +1,230 @@
+"""正規化済みベクトルの行列ストア
+
+コサイン類似度を1回の行列ベクトル積で求めるため、
+L2正規化済みのfloat32行列と、行に対応する名前配列を並べて保持する。
+行番号は削除後も変わらない（空き行は次の追加で再利用する）。
+"""
+
+from collections.abc import Mapping, Sequence
+
+import numpy as np
+
+
+def normalize(vector: np.ndarray) -> np.ndarray:
+    """L2正規化したfloat32ベクトルを返す（ゼロベクトルはそのまま）"""
+    v = np.asarray(vector, dtype=np.float32).reshape(-1)
+    norm = float(np.linalg.norm(v))
+    if norm == 0.0:
+        return v.copy()
+    return v / norm
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """行ごとにL2正規化したfloat32行列を返す"""
+    m = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    norms[norms == 0.0] = 1.0
+    return m / norms
+
+
+class VectorStore:
+    """名前付きベクトルの行列ストア"""
+
+    INITIAL_CAPACITY = 64
+
+    def __init__(self) -> None:
+        self._init_empty(0)
+
+    def _init_empty(self, dim: int) -> None:
+        """空の状態に初期化"""
+        self.matrix = np.zeros((0, dim), dtype=np.float32)
+        self.names = np.empty(0, dtype=object)
+        self.valid = np.zeros(0, dtype=bool)
+        self._rows: dict[str, int] = {}
+        self._free: list[int] = []
+        self._size = 0  # 使用済み行数（空き行を含む）
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._rows
+
+    @property
+    def dim(self) -> int:
+        return self.matrix.shape[1]
+
+    def row_of(self, name: str) -> int | None:
+        """名前に対応する行番号"""
+        return self._rows.get(name)
+
+    def get(self, name: str) -> np.ndarray | None:
+        """正規化済みベクトルを取得"""
+        row = self._rows.get(name)
+        if row is None:
+            return None
+        return self.matrix[row]
+
+    def copy(self) -> "VectorStore":
+        """行の配置を保ったままの複製（ロック外での一括計算用）"""
+        other = VectorStore()
+        other.matrix = np.array(self.matrix[: self._size])
+        other.names = self.names[: self._size].copy()
+        other.valid = self.valid[: self._size].copy()
+        other._rows = dict(self._rows)
+        other._free = list(self._free)
+        other._size = self._size
+        return other
+
+    def clear(self) -> None:
+        """全件削除"""
+        self._init_empty(0)
+
+    def reset(self, vectors: Mapping[str, np.ndarray]) -> None:
+        """全件を置き換え（一括構築）"""
+        self.clear()
+        if not vectors:
+            return
+        names = list(vectors)
+        matrix = normalize_rows(np.stack([vectors[n] for n in names]))
+        capacity = max(self.INITIAL_CAPACITY, len(names))
+        self.matrix = np.zeros((capacity, matrix.shape[1]), dtype=np.float32)
+        self.matrix[: len(names)] = matrix
+        self.names = np.empty(capacity, dtype=object)
+        self.names[: len(names)] = names
+        self.valid = np.zeros(capacity, dtype=bool)
+        self.valid[: len(names)] = True
+        self._rows = {n: i for i, n in enumerate(names)}
+        self._size = len(names)
+
+    def attach(self, matrix: np.ndarray, names: Sequence[str | None]) -> None:
+        """正規化済みの行列をコピーせずにそのまま使う（memmapのキャッシュなど）
+
+        Args:
+            matrix: 正規化済みfloat32行列（書き込み可能であること）
+            names: 行 -> 名前（Noneの行は空き行）
+        """
+        self._init_empty(matrix.shape[1])
+        self.matrix = matrix
+        self.names = np.empty(len(names), dtype=object)
+        self.names[:] = list(names)
+        self.valid = np.array([n is not None for n in names], dtype=bool)
+        self._rows = {n: i for i, n in enumerate(names) if n is not None}
+        self._free = [i for i, n in enumerate(names) if n is None]
+        self._size = len(names)
+
+    def upsert(self, name: str, vector: np.ndarray) -> int:
+        """ベクトルを追加または上書きし、行番号を返す
+
+        Raises:
+            ValueError: 既存ベクトルと次元が異なる場合
+        """
+        v = normalize(vector)
+        if not self._rows:
+            if self.dim != v.shape[0]:
+                self._init_empty(v.shape[0])
+        elif v.shape[0] != self.dim:
+            raise ValueError(
+                f"Vector dimension mismatch: expected {self.dim}, got {v.shape[0]}"
+            )
+
+        row = self._rows.get(name)
+        if row is None:
+            row = self._allocate_row()
+            self._rows[name] = row
+            self.names[row] = name
+            self.valid[row] = True
+        self.matrix[row] = v
+        return row
+
+    def remove(self, name: str) -> bool:
+        """ベクトルを削除（行は空き行として再利用）"""
+        row = self._rows.pop(name, None)
+        if row is None:
+            return False
+        self.valid[row] = False
+        self.names[row] = None
+        self.matrix[row] = 0.0
+        self._free.append(row)
+        return True
+
+    def scores(self, query: np.ndarray) -> np.ndarray:
+        """全行とのコサイン類似度（無効行は-inf）"""
+        q = normalize(query)
+        scores = self.matrix[: self._size] @ q
+        scores[~self.valid[: self._size]] = -np.inf
+        return scores
+
+    def top_k(
+        self, query: np.ndarray, top_k: int, mask: np.ndarray | None = None
+    ) -> list[tuple[str, float]]:
+        """類似度上位k件を返す
+
+        Args:
+            query: クエリベクトル（正規化不要）
+            top_k: 返す件数
+            mask: 対象行のブールマスク（省略時は全行）
+
+        Returns:
+            (name, score) のリスト（スコア降順）
+        """
+        if not self._rows or top_k <= 0:
+            return []
+        scores = self.scores(query)
+        if mask is not None:
+            scores[~mask[: self._size]] = -np.inf
+        return self._select(scores, top_k)
+
+    def top_k_rows(
+        self, query: np.ndarray, rows: np.ndarray, top_k: int
+    ) -> list[tuple[str, float]]:
+        """指定した行だけを採点して上位k件を返す（パーティション検索用）
+
+        Args:
+            query: クエリベクトル（正規化不要）
+            rows: 対象の行番号（有効な行であること）
+            top_k: 返す件数
+
+        Returns:
+            (name, score) のリスト（スコア降順）
+        """
+        if len(rows) == 0 or top_k <= 0:
+            return []
+        scores = self.matrix[rows] @ normalize(query)
+        return self._select(scores, top_k, rows)
+
+    def _select(
+        self, scores: np.ndarray, top_k: int, rows: np.ndarray | None = None
+    ) -> list[tuple[str, float]]:
+        """argpartitionで上位k件を選択して降順に並べる
+
+        rowsを渡した場合、scoresはrowsの各行のスコア。
+        """
+        k = min(top_k, len(scores))
+        if k < len(scores):
+            idx = np.argpartition(-scores, k - 1)[:k]
+        else:
+            idx = np.arange(len(scores))
+        idx = idx[np.argsort(-scores[idx], kind="stable")]
+        names = self.names if rows is None else self.names[rows]
+        return [(names[i], float(scores[i])) for i in idx if np.isfinite(scores[i])]
+
+    def _allocate_row(self) -> int:
+        """空き行を確保（なければ容量を倍に拡張）"""
+        if self._free:
+            return self._free.pop()
+        if self._size == self.matrix.shape[0]:
+            self._grow(max(self.INITIAL_CAPACITY, self._size * 2))
+        row = self._size
+        self._size += 1
+        return row
+
+    def _grow(self, capacity: int) -> None:
+        """容量を拡張"""
+        matrix = np.zeros((capacity, self.dim), dtype=np.float32)
+        matrix[: self._size] = self.matrix[: self._size]
+        names = np.empty(capacity, dtype=object)
+        names[: self._size] = self.names[: self._size]
+        valid = np.zeros(capacity, dtype=bool)
+        valid[: self._size] = self.valid[: self._size]
+        self.matrix, self.names, self.valid = matrix, names, valid
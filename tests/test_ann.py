@@ -0,0 +1,89 @@
+"""近似最近傍（IVF）インデックスのテスト"""
+
+import numpy as np
+import pytest
+
+from mcp_brain.ann import IVFIndex
+from mcp_brain.vector_store import VectorStore
+
+
+@pytest.fixture
+def store():
+    """クラスタ構造を持つベクトル群"""
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(20, 32))
+    vectors = {
+        f"k{i}": (centers[i % 20] + 0.1 * rng.normal(size=32)).astype(np.float32)
+        for i in range(2000)
+    }
+    s = VectorStore()
+    s.reset(vectors)
+    return s
+
+
+def _recall(ann, store, queries, top_k=10):
+    hits = 0
+    for q in queries:
+        exact = {n for n, _ in store.top_k(q, top_k)}
+        approx = {n for n, _ in ann.top_k(store, q, top_k)}
+        hits += len(exact & approx)
+    return hits / (len(queries) * top_k)
+
+
+class TestIVFIndex:
+    """IVFIndexのテスト"""
+
+    def test_recall_against_exact(self, store):
+        """厳密検索に対して十分な再現率を持つ"""
+        ann = IVFIndex(nprobe=8)
+        ann.fit(store)
+        queries = [store.get(f"k{i}") for i in range(0, 2000, 100)]
+        assert _recall(ann, store, queries) >= 0.9
+
+    def test_incremental_add_and_remove(self, store):
+        """追加・削除が再学習なしで反映される"""
+        ann = IVFIndex()
+        ann.fit(store)
+
+        vector = store.get("k7").copy()
+        row = store.upsert("new", vector)
+        ann.add(row, vector)
+        assert ann.top_k(store, vector, 1)[0][0] in {"new", "k7"}
+        assert "new" in {n for n, _ in ann.top_k(store, vector, 5)}
+
+        row = store.row_of("new")
+        store.remove("new")
+        ann.remove(row)
+        assert "new" not in {n for n, _ in ann.top_k(store, vector, 5)}
+
+    def test_save_and_load(self, store, tmp_path):
+        """保存した重心と割り当てを名前で復元できる"""
+        ann = IVFIndex()
+        ann.fit(store)
+        path = tmp_path / "ann.npz"
+        ann.save(path, store)
+
+        restored = IVFIndex()
+        assert restored.load(path, store) is True
+        np.testing.assert_array_equal(restored.centroids, ann.centroids)
+        q = store.get("k3")
+        assert restored.top_k(store, q, 5) == ann.top_k(store, q, 5)
+
+    def test_load_rejects_dimension_mismatch(self, store, tmp_path):
+        """次元の異なるストアには復元しない"""
+        ann = IVFIndex()
+        ann.fit(store)
+        path = tmp_path / "ann.npz"
+        ann.save(path, store)
+
+        other = VectorStore()
+        other.upsert("a", np.ones(8))
+        assert IVFIndex().load(path, other) is False
+
+    def test_needs_refit(self, store):
+        """件数が大きく変わったら再学習が必要"""
+        ann = IVFIndex()
+        assert ann.needs_refit(1) is True
+        ann.fit(store)
+        assert ann.needs_refit(2000) is False
+        assert ann.needs_refit(10000) is True
@@ -0,0 +1,88 @@
+"""クエリエンコードのマイクロバッチのテスト"""
+
+import threading
+
+import numpy as np
+import pytest
+
+from mcp_brain.batcher import EncodeBatcher
+
+
+class Encoder:
+    """呼び出しごとのテキストを記録し、長さのベクトルを返す"""
+
+    def __init__(self, fail: bool = False) -> None:
+        self.calls: list[list[str]] = []
+        self.fail = fail
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        if self.fail:
+            raise RuntimeError("encode failed")
+        return np.array([[float(len(t))] for t in texts])
+
+
+def _encode_concurrently(batcher, texts):
+    results = {}
+    barrier = threading.Barrier(len(texts))
+
+    def run(text):
+        barrier.wait()
+        results[text] = batcher.encode(text)
+
+    threads = [threading.Thread(target=run, args=(t,)) for t in texts]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+    return results
+
+
+def test_single_request():
+    encoder = Encoder()
+    batcher = EncodeBatcher(encoder, window=0)
+    np.testing.assert_array_equal(batcher.encode("abc"), [3.0])
+    assert encoder.calls == [["abc"]]
+
+
+def test_concurrent_requests_share_one_forward_pass():
+    """window内に届いた要求は1回のエンコードにまとまり、各自の結果を受け取る"""
+    encoder = Encoder()
+    batcher = EncodeBatcher(encoder, max_batch=8, window=0.2)
+    texts = ["a", "bb", "ccc", "dddd"]
+
+    results = _encode_concurrently(batcher, texts)
+
+    assert len(encoder.calls) == 1
+    assert sorted(encoder.calls[0]) == texts
+    assert {t: float(v[0]) for t, v in results.items()} == {
+        t: float(len(t)) for t in texts
+    }
+    assert batcher.stats()["largest_batch"] == 4
+
+
+def test_full_batch_is_sent_without_waiting_for_window():
+    """max_batch件たまったらwindowを待たずに締め切る"""
+    encoder = Encoder()
+    batcher = EncodeBatcher(encoder, max_batch=2, window=10)
+
+    results = _encode_concurrently(batcher, ["a", "b", "c", "d"])
+
+    assert len(results) == 4
+    assert all(len(call) <= 2 for call in encoder.calls)
+
+
+def test_duplicate_texts_are_encoded_once():
+    encoder = Encoder()
+    batcher = EncodeBatcher(encoder, max_batch=8, window=0.2)
+
+    results = _encode_concurrently(batcher, ["same", "same", "other"])
+
+    assert sorted(encoder.calls[0]) == ["other", "same"]
+    assert float(results["same"][0]) == 4.0
+
+
+def test_failure_is_raised_to_callers():
+    batcher = EncodeBatcher(Encoder(fail=True), window=0)
+    with pytest.raises(RuntimeError, match="encode failed"):
+        batcher.encode("a")
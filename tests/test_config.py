@@ -0,0 +1,30 @@
+"""設定読み込みのテスト"""
+
+import pytest
+from pydantic import ValidationError
+
+from mcp_brain.config import Settings
+
+
+def test_defaults(monkeypatch) -> None:
+    monkeypatch.delenv("MCP_BRAIN_SEARCH_MODE", raising=False)
+    monkeypatch.delenv("MCP_BRAIN_SEARCH_RETRIEVAL", raising=False)
+    settings = Settings.from_env()
+    assert settings.search_mode == "auto"
+    assert settings.ann_threshold == 5000
+    # BM25との融合は順位が変わるのでオプトイン
+    assert settings.search_retrieval == "vector"
+
+
+def test_from_env(monkeypatch) -> None:
+    monkeypatch.setenv("MCP_BRAIN_SEARCH_MODE", "ann")
+    monkeypatch.setenv("MCP_BRAIN_ANN_THRESHOLD", "100")
+    settings = Settings.from_env()
+    assert settings.search_mode == "ann"
+    assert settings.ann_threshold == 100
+
+
+def test_invalid_value(monkeypatch) -> None:
+    monkeypatch.setenv("MCP_BRAIN_SEARCH_MODE", "fast")
+    with pytest.raises(ValidationError):
+        Settings.from_env()
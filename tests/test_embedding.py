@@ -0,0 +1,525 @@
+"""Embeddingインデックスのテスト（モデルを使わない部分）"""
+
+import threading
+from datetime import date
+
+import numpy as np
+import pytest
+
+from mcp_brain import models
+from mcp_brain.embedding import EmbeddingIndex
+from mcp_brain.index_cache import IndexCache
+from mcp_brain.metadata import min_version, used_within
+from mcp_brain.models import Knowledge, ProjectRegistry
+from mcp_brain.search import SemanticSearch
+from mcp_brain.similarity_graph import SimilarityGraph
+from mcp_brain.usage import UsageJournal
+
+
+def _fake_vector(text: str) -> np.ndarray:
+    rng = np.random.default_rng(abs(hash(text)) % (2**32))
+    return rng.normal(size=8).astype(np.float32)
+
+
+@pytest.fixture
+def encoded(monkeypatch):
+    """エンコードされたテキストを記録するフェイクエンコーダ"""
+    calls: list[list[str]] = []
+
+    def fake_encode(self, texts):
+        calls.append(list(texts))
+        return np.stack([_fake_vector(t) for t in texts])
+
+    monkeypatch.setattr(EmbeddingIndex, "_encode_passages", fake_encode)
+    return calls
+
+
+@pytest.fixture
+def projects(tmp_path, monkeypatch):
+    """テスト用の ~/pj（実行環境のディレクトリ構成に依存しない）"""
+    base = tmp_path / "pj"
+    (base / "my" / "mcp-server-brain").mkdir(parents=True)
+    (base / "work" / "simple-ai-chat").mkdir(parents=True)
+    monkeypatch.setattr(models, "project_registry", ProjectRegistry(base))
+    return base
+
+
+def _items(*names: str, suffix: str = "") -> list[Knowledge]:
+    return [Knowledge(name=n, description=f"{n}{suffix}") for n in names]
+
+
+class TestIncrementalBuild:
+    """文書単位の差分再エンコード"""
+
+    def test_reuses_unchanged_documents(self, tmp_path, encoded):
+        """変更のない文書は再エンコードしない"""
+        EmbeddingIndex(cache_dir=tmp_path).build(_items("a", "b", "c"))
+        assert sum(len(c) for c in encoded) == 3
+
+        encoded.clear()
+        items = _items("a", "b") + _items("c", suffix=" changed") + _items("d")
+        index = EmbeddingIndex(cache_dir=tmp_path)
+        index.build(items)
+
+        assert [len(c) for c in encoded] == [2]
+        assert set(index.embeddings) == {"a", "b", "c", "d"}
+
+    def test_drops_deleted_documents(self, tmp_path, encoded):
+        """削除された文書はキャッシュから除かれる"""
+        EmbeddingIndex(cache_dir=tmp_path).build(_items("a", "b"))
+        encoded.clear()
+
+        index = EmbeddingIndex(cache_dir=tmp_path)
+        index.build(_items("a"))
+        assert encoded == []
+        assert set(index.embeddings) == {"a"}
+
+        index = EmbeddingIndex(cache_dir=tmp_path)
+        index.build(_items("a"))
+        assert encoded == []
+        assert set(index.embeddings) == {"a"}
+
+    def test_add_updates_cache_digest(self, tmp_path, encoded):
+        """addした文書は次回起動時に再利用される"""
+        index = EmbeddingIndex(cache_dir=tmp_path)
+        index.build(_items("a"))
+        index.add(_items("b")[0])
+        encoded.clear()
+
+        EmbeddingIndex(cache_dir=tmp_path).build(_items("a", "b"))
+        assert encoded == []
+
+    def test_unchanged_cache_is_attached_without_copy(self, tmp_path, encoded):
+        """変更がなければキャッシュの行列（memmap）をそのまま検索に使う"""
+        EmbeddingIndex(cache_dir=tmp_path).build(_items("a", "b", "c"))
+
+        index = EmbeddingIndex(cache_dir=tmp_path)
+        index.build(_items("a", "b", "c"))
+        assert isinstance(index.store.matrix, np.memmap)
+        assert {n for n, _ in index.similar("a", top_k=5)} == {"b", "c"}
+
+    def test_mutation_appends_to_log(self, tmp_path, encoded):
+        """add/removeはスナップショットを書き直さず差分ログに追記する"""
+        index = EmbeddingIndex(cache_dir=tmp_path)
+        index.build(_items("a", "b"))
+        cache = IndexCache(tmp_path, index.model_name)
+        snapshot = cache.vectors_path.read_bytes()
+
+        index.add(_items("c")[0])
+        index.remove("a")
+
+        assert cache.vectors_path.read_bytes() == snapshot
+        assert len(cache.log_path.read_text().splitlines()) == 2
+        encoded.clear()
+        restarted = EmbeddingIndex(cache_dir=tmp_path)
+        restarted.build(_items("b", "c"))
+        assert encoded == []
+        assert set(restarted.embeddings) == {"b", "c"}
+
+    def test_remove_many_saves_cache_once(self, tmp_path, encoded, monkeypatch):
+        """まとめて削除してもキャッシュの書き込みは1回"""
+        index = EmbeddingIndex(cache_dir=tmp_path)
+        index.build(_items("a", "b", "c", "d"))
+
+        writes: list[list[str]] = []
+        original = EmbeddingIndex._append_cache
+
+        def counting_append(self, upserts=None, deletes=None, ann_fitted=False):
+            writes.append(list(deletes or []))
+            original(self, upserts, deletes, ann_fitted)
+
+        monkeypatch.setattr(EmbeddingIndex, "_append_cache", counting_append)
+        index.remove_many(["a", "c", "missing"])
+
+        assert writes == [["a", "c", "missing"]]
+        assert set(index.embeddings) == {"b", "d"}
+        assert {n for n, _ in index.similar("b", top_k=5)} == {"d"}
+
+
+class _CountingModel:
+    """encode呼び出し回数を数えるフェイクモデル"""
+
+    def __init__(self) -> None:
+        self.queries: list[str] = []
+
+    def encode(self, texts, **_kwargs):
+        self.queries.append(texts)
+        return np.stack([_fake_vector(t) for t in texts])
+
+
+class TestQueryCache:
+    """クエリベクトル・検索結果キャッシュ"""
+
+    def test_repeated_query_skips_encode(self, encoded):
+        """同じ（正規化後に同じ）クエリは再エンコードしない"""
+        index = EmbeddingIndex()
+        index.build(_items("a", "b"))
+        index.model = model = _CountingModel()
+
+        first = index.search("PR 作成")
+        assert index.search("  PR　作成 ") == first
+        assert len(model.queries) == 1
+        assert index.cache_stats()["results"]["hits"] == 1
+
+    def test_mutation_invalidates_results(self, encoded):
+        """add/removeで世代が進み、結果キャッシュは再計算される"""
+        index = EmbeddingIndex()
+        index.build(_items("a", "b"))
+        index.model = model = _CountingModel()
+
+        index.search("query")
+        generation = index.generation
+        index.add(_items("c")[0])
+        assert index.generation > generation
+
+        results = index.search("query")
+        assert {n for n, _ in results} == {"a", "b", "c"}
+        # ベクトルはキャッシュから再利用される
+        assert len(model.queries) == 1
+
+        index.remove("c")
+        assert {n for n, _ in index.search("query")} == {"a", "b"}
+
+
+class TestSearchMode:
+    """厳密検索と近似検索の切り替え"""
+
+    def test_invalid_mode(self):
+        with pytest.raises(ValueError, match="search_mode"):
+            EmbeddingIndex(search_mode="fast")
+
+    def test_auto_uses_exact_for_small_corpus(self, encoded):
+        index = EmbeddingIndex(search_mode="auto", ann_threshold=10)
+        index.build(_items("a", "b"))
+        assert index.ann is None
+
+    def test_ann_mode_persists_and_updates(self, tmp_path, encoded):
+        """近似インデックスはキャッシュの隣に保存され、add/removeで更新される"""
+        index = EmbeddingIndex(cache_dir=tmp_path, search_mode="ann")
+        index.build(_items("a", "b", "c"))
+        assert index.ann is not None
+        assert IndexCache(tmp_path, index.model_name).ann_path.exists()
+
+        index.model = _CountingModel()
+        index.add(_items("d")[0])
+        assert "d" in {n for n, _ in index.search("d", top_k=4)}
+        index.remove("d")
+        assert "d" not in {n for n, _ in index.search("d", top_k=4)}
+
+
+class TestSimilar:
+    """保存済みベクトルからの類似検索"""
+
+    def test_similar_needs_no_model(self, encoded):
+        """find_similar相当の処理でモデルをロードしない"""
+        index = EmbeddingIndex()
+        index.build(_items("a", "b", "c"))
+        encoded.clear()
+
+        results = index.similar("a", top_k=2)
+        assert len(results) == 2
+        assert "a" not in {n for n, _ in results}
+        assert index.model is None
+        assert encoded == []
+
+    def test_similar_tracks_mutations(self, encoded):
+        index = EmbeddingIndex()
+        index.build(_items("a", "b"))
+        assert [n for n, _ in index.similar("a")] == ["b"]
+        index.build_graph()
+        assert index.graph.ready
+
+        index.add(_items("c")[0])
+        assert {n for n, _ in index.similar("a")} == {"b", "c"}
+        index.remove("b")
+        assert [n for n, _ in index.similar("a")] == ["c"]
+        assert index.similar("b") == []
+
+    def test_graph_builds_in_background(self, encoded, monkeypatch):
+        """グラフの構築中も直接計算で応答し、検索をロックで止めない"""
+        index = EmbeddingIndex()
+        index.build(_items("a", "b", "c"))
+        index.model = _CountingModel()
+        started, release = threading.Event(), threading.Event()
+        original = SimilarityGraph.build
+
+        def slow_build(graph, store):
+            started.set()
+            release.wait(5)
+            original(graph, store)
+
+        monkeypatch.setattr(SimilarityGraph, "build", slow_build)
+
+        assert {n for n, _ in index.similar("a")} == {"b", "c"}
+        assert started.wait(5)
+        assert not index.graph.ready
+        assert len(index.search("q", top_k=3)) == 3
+        assert index.start_graph_build() is None
+
+        release.set()
+        index._graph_thread.join(5)
+        assert index.graph.ready
+        assert {n for n, _ in index.similar("a")} == {"b", "c"}
+
+    def test_graph_rebuilt_after_concurrent_mutation(self, encoded, monkeypatch):
+        """構築中に追加された知識もグラフに入る"""
+        index = EmbeddingIndex()
+        index.build(_items("a", "b"))
+        original = SimilarityGraph.build
+        calls = []
+
+        def build_then_add(graph, store):
+            calls.append(len(store))
+            if len(calls) == 1:
+                index.add(_items("c")[0])
+            original(graph, store)
+
+        monkeypatch.setattr(SimilarityGraph, "build", build_then_add)
+        index.build_graph()
+
+        assert calls == [2, 3]
+        assert {n for n, _ in index.graph.get("a", 5)} == {"b", "c"}
+
+
+class TestPartitions:
+    """プロジェクトごとのパーティション検索"""
+
+    PROJECT = "mcp-server-brain"
+    OTHER = "simple-ai-chat"
+
+    @pytest.fixture
+    def items(self, projects):
+        def make(name, project):
+            return Knowledge(name=name, description=name, project=project)
+
+        return [
+            make("p1", self.PROJECT),
+            make("p2", self.PROJECT),
+            make("p3", self.PROJECT),
+            make("g1", "global"),
+            make("g2", "global"),
+            make("o1", self.OTHER),
+            make("o2", self.OTHER),
+        ]
+
+    def test_scores_only_requested_partitions(self, encoded, items, monkeypatch):
+        index = EmbeddingIndex()
+        index.build(items)
+        index.model = _CountingModel()
+
+        def fail(_query):
+            raise AssertionError("full scan")
+
+        monkeypatch.setattr(index.store, "scores", fail)
+        results = index.search_partitions("q", [self.PROJECT, "global"], top_k=2)
+
+        assert len(results[self.PROJECT]) == 2
+        assert {n for n, _ in results[self.PROJECT]} <= {"p1", "p2", "p3"}
+        assert {n for n, _ in results["global"]} == {"g1", "g2"}
+
+    def test_partitions_track_mutations(self, encoded, items):
+        index = EmbeddingIndex()
+        index.build(items)
+        index.model = _CountingModel()
+
+        # プロジェクトを変えた更新は移動として扱う
+        index.update(Knowledge(name="o1", description="o1", project="global"))
+        index.remove("g2")
+
+        results = index.search_partitions("q", ["global", self.OTHER], top_k=5)
+        assert {n for n, _ in results["global"]} == {"g1", "o1"}
+        assert {n for n, _ in results[self.OTHER]} == {"o2"}
+        assert index.search_partitions("q", ["missing"]) == {"missing": []}
+
+    def test_scoped_search_applies_top_k_per_group(self, encoded, items):
+        """project指定時はプロジェクト → globalの順で、それぞれ上位k件"""
+        search = SemanticSearch()
+        search.build(items)
+        search.embedding_index.model = _CountingModel()
+
+        results = search.search("q", top_k=2, project=self.PROJECT)
+
+        assert [r.project for r in results] == [self.PROJECT] * 2 + ["global"] * 2
+        assert len(search.search("q", top_k=10)) == len(items)
+
+
+class TestFilters:
+    """メタデータ列による絞り込み検索"""
+
+    def test_filters_are_applied_before_top_k(self, encoded):
+        """絞り込みで外れた知識の分だけ結果が減ることはない"""
+        items = [
+            Knowledge(name=f"k{i}", description=f"k{i}", version=i % 3 + 1)
+            for i in range(12)
+        ]
+        index = EmbeddingIndex()
+        index.build(items)
+        index.model = _CountingModel()
+
+        results = index.search("q", top_k=4, filters=[min_version(3)])
+
+        assert len(results) == 4
+        assert all(int(n[1:]) % 3 == 2 for n, _ in results)
+
+    def test_used_within_tracks_mark_used(self, encoded, tmp_path):
+        usage = UsageJournal(tmp_path / "usage.jsonl")
+        usage.record("a", date(2025, 1, 1))
+        index = EmbeddingIndex(usage=usage)
+        index.build(_items("a", "b", "c"))
+        index.model = _CountingModel()
+        recent = [used_within(30, today=date(2025, 1, 10))]
+
+        assert [n for n, _ in index.search("q", filters=recent)] == ["a"]
+
+        index.mark_used("b", date(2025, 1, 5))
+        assert {n for n, _ in index.search("q", filters=recent)} == {"a", "b"}
+
+        # 追加した知識にも利用記録が反映される
+        usage.record("d", date(2025, 1, 9))
+        index.add(_items("d")[0])
+        assert {n for n, _ in index.search("q", filters=recent)} == {"a", "b", "d"}
+
+    def test_filters_with_partitions(self, encoded, projects):
+        project = "mcp-server-brain"
+        search = SemanticSearch()
+        search.build(
+            [
+                Knowledge(name="p1", description="p1", project=project),
+                Knowledge(name="p2", description="p2", project=project, version=2),
+                Knowledge(name="g1", description="g1", version=2),
+            ]
+        )
+        search.embedding_index.model = _CountingModel()
+
+        results = search.search("q", project=project, filters=[min_version(2)])
+
+        assert [r.name for r in results] == ["p2", "g1"]
+
+
+class TestHybrid:
+    """ベクトル検索とBM25の融合"""
+
+    def test_exact_identifier_wins_in_hybrid(self, encoded):
+        items = [Knowledge(name=f"k{i}", description=f"手順{i}") for i in range(20)]
+        items.append(
+            Knowledge(name="brain-dir", description="保存先", content="MCP_BRAIN_DIR")
+        )
+        search = SemanticSearch()
+        search.build(items)
+        search.embedding_index.model = _CountingModel()
+
+        hybrid = search.search("MCP_BRAIN_DIR", top_k=3, retrieval="hybrid")
+        assert hybrid[0].name == "brain-dir"
+        vector = search.search("MCP_BRAIN_DIR", top_k=21)
+        assert len(vector) == 21
+
+    def test_lexical_index_tracks_mutations(self, encoded):
+        search = SemanticSearch()
+        search.build(_items("a"))
+        search.add(Knowledge(name="b", description="ENV_TOKEN"))
+        assert "b" in search.lexical_index
+        assert search.resolve_name("B") == "b"
+        search.remove("b")
+        assert "b" not in search.lexical_index
+        assert "b" not in search.name_index
+
+    def test_invalid_retrieval(self):
+        with pytest.raises(ValueError, match="retrieval"):
+            SemanticSearch(retrieval="bm25")
+
+
+class TestBackgroundBuild:
+    """バックグラウンド構築（起動時の構築・無停止のモデル移行）"""
+
+    @pytest.fixture
+    def gate(self, monkeypatch):
+        """移行先モデル（new）のエンコードを止めておくゲート"""
+        event = threading.Event()
+
+        def fake_encode(self, texts):
+            if self.model_name == "new":
+                event.wait(5)
+            return np.stack([_fake_vector(self.model_name + t) for t in texts])
+
+        monkeypatch.setattr(EmbeddingIndex, "_encode_passages", fake_encode)
+        return event
+
+    def test_caches_are_namespaced_by_model(self, tmp_path, gate):
+        gate.set()
+        EmbeddingIndex("old", cache_dir=tmp_path).build(_items("a"))
+        EmbeddingIndex("org/new", cache_dir=tmp_path).build(_items("a"))
+
+        assert IndexCache.cached_models(tmp_path) == ["old", "org/new"]
+        assert (tmp_path / ".index" / "org--new" / "vectors.f32").exists()
+
+    def test_migration_serves_old_index_and_replays_changes(self, tmp_path, gate):
+        """構築中は旧インデックスで応答し、その間の変更も移行先に反映される"""
+        search = SemanticSearch(model_name="old", cache_dir=tmp_path)
+        search.build(_items("a", "b"))
+
+        thread = search.migrate("new")
+        status = search.index_status()
+        assert (status["model"], status["migrating_to"]) == ("old", "new")
+        assert status["state"] == "ready"
+        with pytest.raises(RuntimeError, match="in progress"):
+            search.migrate("other")
+
+        search.add(_items("c")[0])
+        search.remove("a")
+        assert search.model_name == "old"
+        assert [n for n, _ in search.embedding_index.similar("b", top_k=5)] == ["c"]
+
+        gate.set()
+        thread.join(5)
+
+        status = search.index_status()
+        assert (status["model"], status["migrating_to"]) == ("new", None)
+        assert [n for n, _ in search.embedding_index.similar("b", top_k=5)] == ["c"]
+        assert not IndexCache(tmp_path, "old").exists()
+        assert IndexCache(tmp_path, "new").exists()
+
+    def test_lexical_fallback_until_index_is_ready(self, tmp_path, gate):
+        """構築中は語彙検索で応答し、その間の追加も構築後に反映される"""
+        search = SemanticSearch(model_name="new", cache_dir=tmp_path)
+        thread = search.start_build(
+            [
+                Knowledge(name="deploy-staging", description="ステージングにデプロイ"),
+                Knowledge(name="create-pr", description="PRを作成したいとき"),
+            ]
+        )
+        assert search.index_status()["state"] == "building"
+        assert [k.name for k in search.search("デプロイ手順")] == ["deploy-staging"]
+
+        search.add(Knowledge(name="review-pr", description="PRをレビューする"))
+        assert [k.name for k in search.search("PRをレビュー")][0] == "review-pr"
+
+        gate.set()
+        thread.join(5)
+
+        assert search.index_status()["state"] == "ready"
+        assert "review-pr" in search.embedding_index.store
+
+    def test_load_in_background_keeps_changes_made_while_loading(self, tmp_path, gate):
+        """知識の読み込みも構築スレッドで行い、読み込み中の追加・削除を重ねる"""
+        loading = threading.Event()
+
+        def load():
+            loading.wait(5)
+            return _items("a", "b")
+
+        gate.set()
+        search = SemanticSearch(model_name="new", cache_dir=tmp_path)
+        thread = search.start_build(load)
+        assert search.index_status()["state"] == "building"
+
+        search.add(_items("c")[0])
+        search.remove("a")
+        loading.set()
+        thread.join(5)
+
+        assert search.index_status()["state"] == "ready"
+        assert set(search.knowledge_map) == {"b", "c"}
+        assert "c" in search.lexical_index
+        assert "a" not in search.lexical_index
+        assert "c" in search.embedding_index.store
+        assert "a" not in search.embedding_index.store
@@ -0,0 +1,230 @@
+"""エンコーダのバックエンドのテスト"""
+
+import json
+import sys
+import types
+
+import numpy as np
+import pytest
+
+from mcp_brain import encoder
+
+
+class FakeModel:
+    """読み込み引数を記録し、固定のベクトルを返すエンコーダ"""
+
+    loaded: list[tuple[str, dict]] = []
+
+    def __init__(self, name, **kwargs):
+        self.name = name
+        self.kwargs = kwargs
+        self.noise = 0.0
+        FakeModel.loaded.append((name, kwargs))
+
+    def save(self, path):
+        self.saved = path
+
+    def encode(self, texts, **_kwargs):
+        rng = np.random.default_rng(0)
+        base = np.stack([np.arange(1.0, 9.0) + i for i in range(len(texts))])
+        return base + self.noise * rng.normal(size=base.shape)
+
+
+@pytest.fixture
+def fake_models(monkeypatch, tmp_path):
+    FakeModel.loaded = []
+    monkeypatch.setattr(encoder, "_model_class", lambda: FakeModel)
+    monkeypatch.setattr(encoder, "onnx_dir", lambda _name: tmp_path)
+    return FakeModel.loaded
+
+
+def _write_report(path, *, passed):
+    (path / "onnx").mkdir(exist_ok=True)
+    (path / "onnx" / "model_qint8_avx2.onnx").write_bytes(b"x")
+    report = {
+        "file": "onnx/model_qint8_avx2.onnx",
+        "min_cosine": 0.999 if passed else 0.5,
+        "threshold": encoder.PARITY_THRESHOLD,
+        "passed": passed,
+    }
+    (path / encoder.PARITY_FILE).write_text(json.dumps(report))
+
+
+def test_check_parity():
+    """同じ出力なら1、ずれるほど小さくなる"""
+    reference, candidate = FakeModel("a"), FakeModel("b")
+    assert encoder.check_parity(reference, candidate) == pytest.approx(1.0)
+
+    candidate.noise = 5.0
+    assert encoder.check_parity(reference, candidate) < encoder.PARITY_THRESHOLD
+
+
+def test_invalid_backend():
+    with pytest.raises(ValueError, match="backend"):
+        encoder.load_encoder("m", backend="tensorrt")
+
+
+def test_torch_is_default(fake_models):
+    model = encoder.load_encoder("m")
+    assert fake_models == [("m", {})]
+    assert model.name == "m"
+
+
+def test_onnx_uses_saved_report(fake_models, monkeypatch, tmp_path):
+    """検査済みの量子化モデルはsentence-transformers（torch）を使わずに読み込む"""
+    _write_report(tmp_path, passed=True)
+    loaded = []
+    monkeypatch.setattr(
+        encoder.OnnxEncoder,
+        "load",
+        classmethod(lambda cls, path, name: loaded.append((path, name)) or "onnx"),
+    )
+
+    model = encoder.load_encoder("m", backend="onnx-int8")
+
+    assert model == "onnx"
+    assert loaded == [(tmp_path, "onnx/model_qint8_avx2.onnx")]
+    assert fake_models == []
+
+
+def test_onnx_falls_back_when_parity_failed(fake_models, tmp_path):
+    _write_report(tmp_path, passed=False)
+
+    model = encoder.load_encoder("m", backend="onnx-int8")
+
+    assert model.name == "m"
+    assert fake_models == [("m", {})]
+
+
+@pytest.fixture
+def fake_export(fake_models, monkeypatch, tmp_path):
+    """書き出しと量子化をスタブし、量子化モデルの出力のずれを指定できるようにする"""
+    exported = []
+
+    def export(model, config, path):
+        exported.append((model.kwargs, config))
+        (tmp_path / "onnx").mkdir(exist_ok=True)
+        (tmp_path / "onnx" / f"model_qint8_{config}.onnx").write_bytes(b"x")
+
+    quantized = FakeModel("quantized")
+    monkeypatch.setitem(
+        sys.modules,
+        "sentence_transformers",
+        types.SimpleNamespace(export_dynamic_quantized_onnx_model=export),
+    )
+    monkeypatch.setattr(encoder, "_quantization_config", lambda: "avx2")
+    monkeypatch.setattr(
+        encoder.OnnxEncoder, "load", classmethod(lambda cls, path, name: quantized)
+    )
+    return exported, quantized
+
+
+def test_onnx_export_falls_back_when_parity_check_fails(fake_export, tmp_path):
+    """量子化で出力がずれたらtorchで動き、結果を保存して次回は書き出さない"""
+    exported, quantized = fake_export
+    quantized.noise = 5.0
+
+    model = encoder.load_encoder("m", backend="onnx-int8")
+
+    assert model.name == "m"
+    assert exported == [({"backend": "onnx"}, "avx2")]
+    report = json.loads((tmp_path / encoder.PARITY_FILE).read_text())
+    assert report["passed"] is False
+    assert report["min_cosine"] < encoder.PARITY_THRESHOLD
+
+    assert encoder.load_encoder("m", backend="onnx-int8").name == "m"
+    assert len(exported) == 1
+
+
+def test_onnx_export_is_used_when_parity_check_passes(fake_export, tmp_path):
+    exported, quantized = fake_export
+
+    model = encoder.load_encoder("m", backend="onnx-int8")
+
+    assert model is quantized
+    assert len(exported) == 1
+    assert json.loads((tmp_path / encoder.PARITY_FILE).read_text())["passed"] is True
+
+
+def test_onnx_falls_back_when_export_fails(fake_models, monkeypatch):
+    """ONNX Runtimeがない環境ではtorchで動く"""
+
+    def fail_export(_model_name, _export_dir):
+        raise ImportError("onnxruntime is not installed")
+
+    monkeypatch.setattr(encoder, "_export", fail_export)
+
+    model = encoder.load_encoder("m", backend="onnx-int8")
+
+    assert model.name == "m"
+
+
+class FakeSession:
+    """最後の隠れ状態として、トークンIDを並べたベクトルを返すセッション"""
+
+    def __init__(self, input_names):
+        self.inputs = [type("Input", (), {"name": n})() for n in input_names]
+        self.feeds = []
+
+    def get_inputs(self):
+        return self.inputs
+
+    def run(self, _outputs, feeds):
+        self.feeds.append(feeds)
+        ids = feeds["input_ids"].astype(np.float32)
+        return [np.stack([ids, 2 * ids], axis=-1)]
+
+
+class FakeTokenizer:
+    """1文字1トークン、0でパディング"""
+
+    def encode_batch(self, texts):
+        width = max(len(t) for t in texts)
+        return [
+            type(
+                "Encoding",
+                (),
+                {
+                    "ids": [ord(c) - 96 for c in t] + [0] * (width - len(t)),
+                    "attention_mask": [1] * len(t) + [0] * (width - len(t)),
+                },
+            )()
+            for t in texts
+        ]
+
+
+@pytest.mark.parametrize(
+    ("pooling", "expected"),
+    [("mean", [[2, 4], [1, 2]]), ("cls", [[1, 2], [1, 2]]), ("max", [[3, 6], [1, 2]])],
+)
+def test_onnx_encoder_pooling(pooling, expected):
+    """パディングを除いてプーリングする"""
+    session = FakeSession(["input_ids", "attention_mask"])
+    model = encoder.OnnxEncoder(session, FakeTokenizer(), pooling, batch_size=1)
+
+    vectors = model.encode(["abc", "a"], convert_to_numpy=True)
+
+    assert vectors.tolist() == expected
+    assert len(session.feeds) == 2
+    assert set(session.feeds[0]) == {"input_ids", "attention_mask"}
+
+
+def test_onnx_encoder_normalize_and_token_types():
+    session = FakeSession(["input_ids", "attention_mask", "token_type_ids"])
+    model = encoder.OnnxEncoder(session, FakeTokenizer(), normalize=True)
+
+    vectors = model.encode(["ab", "c"])
+
+    assert np.allclose(np.linalg.norm(vectors, axis=1), 1.0)
+    assert session.feeds[0]["token_type_ids"].tolist() == [[0, 0], [0, 0]]
+
+
+def test_pooling_mode(tmp_path):
+    assert encoder._pooling_mode(tmp_path) == "mean"
+    (tmp_path / "1_Pooling").mkdir()
+    config = tmp_path / "1_Pooling" / "config.json"
+    config.write_text(json.dumps({"pooling_mode_cls_token": True}))
+    assert encoder._pooling_mode(tmp_path) == "cls"
+    config.write_text(json.dumps({"pooling_mode_lasttoken": True}))
+    with pytest.raises(ValueError, match="pooling"):
+        encoder._pooling_mode(tmp_path)
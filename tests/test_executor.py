@@ -0,0 +1,63 @@
+"""実行レーンのテスト"""
+
+import asyncio
+import threading
+
+from mcp_brain.executor import ToolExecutor
+
+
+def test_reads_continue_while_write_is_blocked() -> None:
+    """書き込みが止まっていても読み取りは完了する"""
+    executor = ToolExecutor(max_readers=2)
+    release = threading.Event()
+
+    async def scenario() -> list[str]:
+        write = asyncio.ensure_future(executor.run_write(release.wait, 5))
+        reads = await asyncio.gather(
+            executor.run_read(str.upper, "a"), executor.run_read(str.upper, "b")
+        )
+        assert not write.done()
+        release.set()
+        assert await write is True
+        return reads
+
+    try:
+        assert asyncio.run(scenario()) == ["A", "B"]
+    finally:
+        executor.shutdown()
+
+
+def test_writes_run_one_at_a_time_in_order() -> None:
+    """書き込みは単一スレッドで投入順に実行される"""
+    executor = ToolExecutor()
+    order: list[int] = []
+    threads: set[str] = set()
+
+    def write(i: int) -> None:
+        threads.add(threading.current_thread().name)
+        order.append(i)
+
+    async def scenario() -> None:
+        await asyncio.gather(*(executor.run_write(write, i) for i in range(10)))
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        executor.shutdown()
+
+    assert order == list(range(10))
+    assert len(threads) == 1
+
+
+def test_submit_write_does_not_wait_and_logs_failure(caplog) -> None:
+    """投げっぱなしの書き込みの例外はログに残る"""
+    executor = ToolExecutor()
+
+    def fail() -> None:
+        raise RuntimeError("boom")
+
+    future = executor.submit_write(fail)
+    executor.shutdown()
+
+    assert isinstance(future.exception(), RuntimeError)
+    assert "Background write failed" in caplog.text
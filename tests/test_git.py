@@ -25,6 +25,11 @@ class FakeIndex:
         self.commits.append(message)
 
 
+class FakePushInfoList(list):
+    def raise_if_error(self) -> None:
+        pass
+
+
 class FakeRemote:
     def __init__(
         self,
@@ -39,22 +44,28 @@ class FakeRemote:
         self.push_calls = 0
         self.pull_calls = 0
 
-    def push(self) -> None:
+    def push(self) -> FakePushInfoList:
         self.push_calls += 1
         if self.push_calls <= self._push_failures:
             raise GitCommandError("push", 1)
+        return FakePushInfoList()
 
-    def pull(self, *, rebase: bool) -> None:
+    def pull(self, *, rebase: bool, autostash: bool) -> None:
         self.pull_calls += 1
         if self._pull_raises:
             raise GitCommandError("pull", 1)
         assert rebase is True
+        assert autostash is True
 
 
 class FakeGit:
-    def __init__(self, *, ls_remote_raises: bool = False) -> None:
+    def __init__(
+        self, *, ls_remote_raises: bool = False, status: str = "", tracked: str = ""
+    ) -> None:
         self.calls: list[tuple[str, tuple[object, ...]]] = []
         self._ls_remote_raises = ls_remote_raises
+        self._status = status
+        self._tracked = tracked
 
     def ls_remote(self, *_args: object) -> None:
         self.calls.append(("ls_remote", _args))
@@ -73,6 +84,22 @@ class FakeGit:
     def cherry_pick(self, *_args: object) -> None:
         self.calls.append(("cherry_pick", _args))
 
+    def ls_files(self, *_args: object) -> str:
+        self.calls.append(("ls_files", _args))
+        path = str(_args[-1])
+        return "\n".join(
+            p
+            for p in self._tracked.splitlines()
+            if p == path or p.startswith(path + "/")
+        )
+
+    def status(self, *_args: object) -> str:
+        self.calls.append(("status", _args))
+        return self._status
+
+    def reset(self, *_args: object) -> None:
+        self.calls.append(("reset", _args))
+
 
 class FakeRepo:
     def __init__(
@@ -82,10 +109,11 @@ class FakeRepo:
         remote_raises: Exception | None = None,
         ls_remote_raises: bool = False,
         dirty: bool = False,
+        status: str = " M notes.md",
         remote: FakeRemote | None = None,
     ) -> None:
         self.git_dir = str(git_dir)
-        self.git = FakeGit(ls_remote_raises=ls_remote_raises)
+        self.git = FakeGit(ls_remote_raises=ls_remote_raises, status=status)
         self.index = FakeIndex()
         self._remote_raises = remote_raises
         self._dirty = dirty
@@ -170,10 +198,7 @@ def test_commit_and_push_commits_manual_changes_and_pushes_with_rebase(
 
     manager.commit_and_push("x", "create")
 
-    assert repo.index.added == [
-        ["knowledge/x.md"],
-        [".index_cache.pkl", ".index_hash"],
-    ]
+    assert repo.index.added == [["knowledge/x.md"]]
     assert repo.index.commits == ["manual: uncommitted changes", "create: x"]
     assert remote.pull_calls == 1
     assert remote.push_calls == 2
@@ -189,7 +214,7 @@ def test_commit_and_push_forget_removes_file(monkeypatch, tmp_path) -> None:
     manager.commit_and_push("x", "forget")
 
     assert repo.index.removed == [(["knowledge/x.md"], True)]
-    assert repo.index.added == [[".index_cache.pkl", ".index_hash"]]
+    assert repo.index.added == []
     assert repo.index.commits == ["forget: x"]
 
 
@@ -203,3 +228,124 @@ def test_push_with_rebase_raises_when_pull_fails(monkeypatch, tmp_path) -> None:
 
     with pytest.raises(gitmod.GitOperationError):
         manager._push_with_rebase()
+
+
+def test_commit_and_push_includes_index_cache_when_present(
+    monkeypatch, tmp_path
+) -> None:
+    git_dir = tmp_path / ".git"
+    git_dir.mkdir(parents=True)
+    (tmp_path / ".index" / "m").mkdir(parents=True)
+    (tmp_path / ".index" / "m" / "ann.npz").write_bytes(b"x")
+
+    repo = FakeRepo(git_dir)
+    monkeypatch.setattr(gitmod.GitManager, "_init_repo", lambda self: repo)
+    manager = gitmod.GitManager(tmp_path)
+
+    manager.commit_and_push("x", "update")
+
+    assert repo.index.added == [["knowledge/x.md"]]
+    assert ("add", ("-A", "--", ".index", gitmod.INDEX_CACHE_TMP)) in repo.git.calls
+
+
+def test_commit_changes_skips_manual_commit_for_own_changes(
+    monkeypatch, tmp_path
+) -> None:
+    git_dir = tmp_path / ".git"
+    git_dir.mkdir(parents=True)
+
+    repo = FakeRepo(
+        git_dir,
+        dirty=True,
+        status="?? knowledge/x.md\n M .index/m/meta.json\n D .index_hash",
+    )
+    manager = _manager_with_repo(monkeypatch, repo)
+
+    manager.commit_changes([("x", "create")])
+
+    assert repo.index.commits == ["create: x"]
+
+
+def test_commit_changes_excludes_own_changes_from_manual_commit(
+    monkeypatch, tmp_path
+) -> None:
+    git_dir = tmp_path / ".git"
+    git_dir.mkdir(parents=True)
+
+    repo = FakeRepo(git_dir, dirty=True, status="?? knowledge/x.md\n M notes.md")
+    manager = _manager_with_repo(monkeypatch, repo)
+
+    manager.commit_changes([("x", "create")])
+
+    resets = [args for name, args in repo.git.calls if name == "reset"]
+    assert resets
+    assert "knowledge/x.md" in resets[0]
+    assert repo.index.commits == ["manual: uncommitted changes", "create: x"]
+
+
+def test_commit_changes_batches_and_coalesces(monkeypatch, tmp_path) -> None:
+    git_dir = tmp_path / ".git"
+    git_dir.mkdir(parents=True)
+
+    repo = FakeRepo(git_dir)
+    manager = _manager_with_repo(monkeypatch, repo)
+
+    manager.commit_changes([("a", "create"), ("b", "create"), ("a", "forget")])
+
+    assert repo.index.removed == [(["knowledge/a.md"], True)]
+    assert ["knowledge/b.md"] in repo.index.added
+    assert len(repo.index.commits) == 1
+    assert repo.index.commits[0].splitlines() == [
+        "sync: 2 changes",
+        "",
+        "forget: a",
+        "create: b",
+    ]
+
+
+def test_commit_and_push_many_makes_one_commit_and_push(monkeypatch, tmp_path) -> None:
+    git_dir = tmp_path / ".git"
+    git_dir.mkdir(parents=True)
+
+    remote = FakeRemote()
+    repo = FakeRepo(git_dir, remote=remote)
+    manager = _manager_with_repo(monkeypatch, repo)
+
+    names = [f"k{i}" for i in range(200)]
+    manager.commit_and_push_many([(name, "forget") for name in names])
+
+    assert len(repo.index.removed) == 200
+    assert len(repo.index.commits) == 1
+    assert repo.index.commits[0].startswith("forget: 200 items\n\n")
+    assert remote.push_calls == 1
+
+
+def test_commit_stages_removal_of_migrated_legacy_cache(monkeypatch, tmp_path) -> None:
+    git_dir = tmp_path / ".git"
+    git_dir.mkdir(parents=True)
+
+    repo = FakeRepo(git_dir)
+    repo.git._tracked = ".index_cache.pkl"
+    manager = _manager_with_repo(monkeypatch, repo)
+
+    manager.commit_and_push("x", "update")
+
+    assert repo.index.removed == [([".index_cache.pkl"], False)]
+
+
+def test_commit_stages_index_cache_directory(monkeypatch, tmp_path) -> None:
+    """モデルごとのキャッシュはディレクトリ単位でステージング（削除も含む）"""
+    git_dir = tmp_path / ".git"
+    git_dir.mkdir(parents=True)
+
+    repo = FakeRepo(git_dir)
+    repo.git._tracked = ".index/old-model/vectors.f32"
+    manager = _manager_with_repo(monkeypatch, repo)
+
+    manager.commit_and_push("x", "update")
+
+    assert (
+        "add",
+        ("-A", "--", gitmod.INDEX_CACHE_DIR, gitmod.INDEX_CACHE_TMP),
+    ) in repo.git.calls
+    assert repo.index.removed == []
@@ -2,32 +2,12 @@
 
 import numpy as np
 
-from mcp_brain.index_cache import IndexCache, compute_content_hash
+from mcp_brain.index_cache import IndexCache
 
 
 class TestIndexCache:
     """インデックスキャッシュのテスト"""
 
-    def test_content_hash_empty(self, tmp_path):
-        """空ディレクトリのハッシュ"""
-        hash1 = compute_content_hash(tmp_path)
-        hash2 = compute_content_hash(tmp_path)
-        assert hash1 == hash2
-
-    def test_content_hash_changes(self, tmp_path):
-        """内容変更でハッシュが変わる"""
-        knowledge_dir = tmp_path / "test-knowledge"
-        knowledge_dir.mkdir()
-        (knowledge_dir / "KNOWLEDGE.md").write_text("test")
-
-        hash1 = compute_content_hash(tmp_path)
-
-        # 内容を変更
-        (knowledge_dir / "KNOWLEDGE.md").write_text("modified")
-        hash2 = compute_content_hash(tmp_path)
-
-        assert hash1 != hash2
-
     def test_cache_save_load(self, tmp_path):
         """キャッシュの保存と読み込み"""
         cache = IndexCache(tmp_path)
@@ -38,22 +18,132 @@ class TestIndexCache:
         }
 
         cache.save(embeddings)
-        loaded = cache.load()
+        loaded, _ = cache.load_entries()
 
-        assert loaded is not None
         assert set(loaded.keys()) == {"test1", "test2"}
         np.testing.assert_array_equal(loaded["test1"], embeddings["test1"])
 
-    def test_cache_invalid_after_change(self, tmp_path):
-        """内容変更後はキャッシュが無効"""
+    def test_load_entries_ignores_file_changes(self, tmp_path):
+        """再利用の可否は文書ごとのダイジェストで判断する（ファイルの変更は見ない）"""
         cache = IndexCache(tmp_path)
-        embeddings = {"test1": np.array([1.0, 2.0, 3.0])}
+        cache.save({"test1": np.array([1.0, 2.0])}, {"test1": "digest-1"})
+
+        (tmp_path / "new.md").write_text("changed")
+
+        entries = cache.load_entries()
+        assert entries is not None
+        embeddings, digests = entries
+        assert set(embeddings) == {"test1"}
+        assert digests == {"test1": "digest-1"}
+
+    def test_load_entries_legacy_format(self, tmp_path):
+        """旧形式（name -> vector の辞書）はダイジェストなしで読める"""
+        import pickle
+
+        cache = IndexCache(tmp_path)
+        with cache.legacy_path.open("wb") as f:
+            pickle.dump({"test1": np.array([1.0])}, f)
+
+        entries = cache.load_entries()
+        assert entries is not None
+        assert set(entries[0]) == {"test1"}
+        assert entries[1] == {}
+
+
+class TestBinaryFormat:
+    """memmap形式のスナップショット"""
+
+    def test_snapshot_is_memory_mapped(self, tmp_path):
+        """ベクトル行列はmemmapで開かれ、書き込みはファイルに反映されない"""
+        cache = IndexCache(tmp_path, model_name="m")
+        cache.save({"a": np.ones(4), "b": np.arange(4.0)}, {"a": "da", "b": "db"})
+
+        snapshot = cache.load_snapshot()
+        assert isinstance(snapshot.matrix, np.memmap)
+        assert snapshot.model == "m"
+        assert snapshot.names == ["a", "b"]
+        np.testing.assert_array_equal(snapshot.matrix[1], np.arange(4.0))
+
+        snapshot.matrix[0] = 0.0
+        np.testing.assert_array_equal(cache.load_snapshot().matrix[0], np.ones(4))
+
+    def test_other_model_is_ignored(self, tmp_path):
+        """別モデルで作成したキャッシュは読み込まない"""
+        IndexCache(tmp_path, model_name="old").save({"a": np.ones(4)}, {"a": "da"})
+        assert IndexCache(tmp_path, model_name="new").load_snapshot() is None
+        assert IndexCache(tmp_path, model_name="old").load_snapshot() is not None
+
+    def test_truncated_vectors_are_rejected(self, tmp_path):
+        """行列ファイルのサイズがメタデータと合わなければ無効"""
+        cache = IndexCache(tmp_path)
+        cache.save({"a": np.ones(4), "b": np.ones(4)}, {"a": "da", "b": "db"})
+        data = cache.vectors_path.read_bytes()
+        cache.vectors_path.write_bytes(data[:-4])
+        assert cache.load_entries() is None
+
+    def test_legacy_pickle_is_migrated(self, tmp_path):
+        """旧形式は読み込めて、保存時に新形式へ移行して削除される"""
+        import pickle
+
+        cache = IndexCache(tmp_path)
+        with cache.legacy_path.open("wb") as f:
+            pickle.dump({"a": np.ones(3)}, f)
+        (tmp_path / ".index_hash").write_text("hash")
+        assert IndexCache.cached_models(tmp_path) == [IndexCache.LEGACY_MODEL]
+
+        embeddings, _ = cache.load_entries()
         cache.save(embeddings)
+        assert not cache.legacy_path.exists()
+        assert not (tmp_path / ".index_hash").exists()
+        assert set(cache.load_entries()[0]) == {"a"}
+
+
+class TestIndexLog:
+    """差分ログの追記・再生・畳み込み"""
 
-        # ファイルを追加
-        knowledge_dir = tmp_path / "new-knowledge"
-        knowledge_dir.mkdir()
-        (knowledge_dir / "KNOWLEDGE.md").write_text("new content")
+    def test_append_is_replayed_on_load(self, tmp_path):
+        """追記した追加・削除は読み込み時に反映される"""
+        cache = IndexCache(tmp_path)
+        cache.save({"a": np.ones(3), "b": np.zeros(3)}, {"a": "da", "b": "db"})
+        snapshot = cache.vectors_path.read_bytes()
+
+        assert cache.append(upserts={"c": (np.full(3, 2.0), "dc")}, deletes=["a"])
+        assert cache.append(upserts={"b": (np.full(3, 5.0), "db2")})
+
+        # スナップショットは書き直さない
+        assert cache.vectors_path.read_bytes() == snapshot
+        embeddings, digests = cache.load_entries()
+        assert set(embeddings) == {"b", "c"}
+        np.testing.assert_array_equal(embeddings["b"], np.full(3, 5.0))
+        assert digests == {"b": "db2", "c": "dc"}
+
+    def test_append_without_snapshot(self, tmp_path):
+        """スナップショットがなければ追記しない（呼び出し側でsaveする）"""
+        cache = IndexCache(tmp_path)
+        assert not cache.append(upserts={"a": (np.ones(3), "da")})
+        assert not cache.log_path.exists()
+
+    def test_save_compacts_log(self, tmp_path, monkeypatch):
+        """saveでスナップショットに畳み込み、ログは空になる"""
+        monkeypatch.setattr(IndexCache, "COMPACT_MIN_BYTES", 100)
+        cache = IndexCache(tmp_path)
+        cache.save({"a": np.ones(3)}, {"a": "da"})
+        for i in range(5):
+            cache.append(upserts={f"k{i}": (np.ones(3), f"d{i}")})
+        assert cache.needs_compaction()
+
+        embeddings, digests = cache.load_entries()
+        cache.save(embeddings, digests)
+        assert cache.log_path.read_bytes() == b""
+        assert not cache.needs_compaction()
+        assert set(cache.load_entries()[0]) == {"a", *(f"k{i}" for i in range(5))}
+
+    def test_broken_log_line_is_skipped(self, tmp_path):
+        """書き込み途中で切れた行は読み飛ばす"""
+        cache = IndexCache(tmp_path)
+        cache.save({"a": np.ones(3)}, {"a": "da"})
+        cache.append(upserts={"b": (np.ones(3), "db")})
+        with cache.log_path.open("a") as f:
+            f.write('{"op": "put", "name": "c", "dig')
 
-        # load()がNoneを返す = キャッシュ無効
-        assert cache.load() is None
+        assert set(cache.load_entries()[0]) == {"a", "b"}
@@ -0,0 +1,91 @@
+"""文字n-gram転置インデックス（BM25）とRRFのテスト"""
+
+import time
+
+from mcp_brain.lexical import LexicalIndex, ngrams, reciprocal_rank_fusion
+from mcp_brain.models import Knowledge
+
+
+def _items():
+    return [
+        Knowledge(
+            name="set-brain-dir",
+            description="知識ディレクトリを変更したいとき",
+            content="MCP_BRAIN_DIR を設定して起動する",
+        ),
+        Knowledge(
+            name="deploy-staging",
+            description="ステージング環境にデプロイしたいとき",
+            content="scripts/deploy.sh staging を実行",
+        ),
+        Knowledge(
+            name="create-pr",
+            description="PRを作成したいとき",
+            content="gh pr create --fill",
+        ),
+    ]
+
+
+def test_ngrams():
+    assert ngrams("ＰＲ作成") == ["pr", "r作", "作成"]
+    assert ngrams("a bc") == ["a", "bc"]
+
+
+def test_exact_identifier_ranks_first():
+    index = LexicalIndex()
+    index.build(_items())
+
+    assert index.search("MCP_BRAIN_DIR")[0][0] == "set-brain-dir"
+    assert index.search("deploy.sh")[0][0] == "deploy-staging"
+    assert index.search("デプロイ手順")[0][0] == "deploy-staging"
+    assert index.search("zzz") == []
+
+
+def test_head_outweighs_content():
+    """名前・説明に含まれる語は本文より高く採点する"""
+    index = LexicalIndex()
+    index.build(
+        [
+            Knowledge(name="a", description="テスト", content="ビルド"),
+            Knowledge(name="b", description="ビルド", content="テスト"),
+        ]
+    )
+    assert [n for n, _ in index.search("ビルド")] == ["b", "a"]
+
+
+def test_incremental_updates():
+    index = LexicalIndex()
+    index.build(_items())
+
+    index.add(Knowledge(name="create-pr", description="レビュー依頼", content=""))
+    assert index.search("作成") == []
+    assert index.search("レビュー依頼")[0][0] == "create-pr"
+
+    index.remove_many(["create-pr", "missing"])
+    assert "create-pr" not in index
+    assert index.search("レビュー") == []
+    assert index.search("gh pr") == []
+
+
+def test_search_is_fast():
+    """全件に一致する語を含むクエリでも数千件なら数ミリ秒以内で返る"""
+    index = LexicalIndex()
+    index.build(
+        [
+            Knowledge(
+                name=f"k{i}",
+                description=f"手順{i % 97} の説明",
+                content=f"ENV_{i % 13} script-{i}.sh",
+            )
+            for i in range(3000)
+        ]
+    )
+    start = time.perf_counter()
+    for _ in range(20):
+        index.search("script-42.sh", top_k=10)
+    assert (time.perf_counter() - start) / 20 < 0.005
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "a"]])
+    assert [n for n, _ in fused] == ["a", "c", "b"]
@@ -0,0 +1,72 @@
+"""メタデータ列と絞り込み条件のテスト"""
+
+from datetime import date
+
+import numpy as np
+import pytest
+
+from mcp_brain.metadata import Filter, MetadataColumns, min_version, used_within
+from mcp_brain.models import Knowledge
+
+
+def _knowledge(name, **kwargs):
+    return Knowledge(name=name, description=name, **kwargs)
+
+
+@pytest.fixture
+def columns():
+    columns = MetadataColumns()
+    columns.set(0, _knowledge("a", version=1, created=date(2025, 1, 1)), None)
+    columns.set(
+        1,
+        _knowledge("b", version=3, last_used=date(2025, 6, 1)),
+        date(2025, 5, 1),
+    )
+    columns.set(2, _knowledge("c", version=5), date(2025, 7, 1))
+    return columns
+
+
+def test_invalid_filter():
+    with pytest.raises(ValueError, match="field"):
+        Filter("size", ">=", 1)
+    with pytest.raises(ValueError, match="operator"):
+        Filter("version", "~", 1)
+
+
+def test_version_mask(columns):
+    assert columns.mask([min_version(3)], 3).tolist() == [False, True, True]
+
+
+def test_last_used_takes_newer_date(columns):
+    """知識ファイルと利用記録の新しい方、未使用の行は条件に一致しない"""
+    mask = columns.mask([used_within(45, today=date(2025, 7, 10))], 3)
+    assert mask.tolist() == [False, True, True]
+    assert np.isnat(columns.last_used[0])
+    assert columns.last_used[1] == np.datetime64("2025-06-01")
+
+
+def test_touch_never_moves_backwards(columns):
+    columns.touch(0, date(2025, 8, 1))
+    columns.touch(0, date(2025, 1, 1))
+    assert columns.last_used[0] == np.datetime64("2025-08-01")
+
+
+def test_combined_filters(columns):
+    filters = [Filter("project", "==", "global"), Filter("version", "<", 5)]
+    assert columns.mask(filters, 3).tolist() == [True, True, False]
+    unknown = [Filter("project", "==", "missing")]
+    assert not columns.mask(unknown, 3).any()
+
+
+def test_mask_grows_to_size(columns):
+    """未書き込みの行（空き行はVectorStore側でも除外される）は一致しない"""
+    mask = columns.mask([min_version(1)], 100)
+    assert mask.shape == (100,)
+    assert mask.sum() == 3
+
+
+def test_matches():
+    f = min_version(2)
+    assert f.matches(2)
+    assert not f.matches(1)
+    assert not f.matches(None)
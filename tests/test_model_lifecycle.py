@@ -0,0 +1,101 @@
+"""モデルのライフサイクル管理のテスト"""
+
+import threading
+import time
+
+import pytest
+
+from mcp_brain.model_lifecycle import ModelLifecycle
+
+
+class Loader:
+    """読み込み回数を数えるローダー"""
+
+    def __init__(self, delay: float = 0.0, failures: int = 0) -> None:
+        self.calls = 0
+        self.delay = delay
+        self.failures = failures
+
+    def __call__(self):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.failures > 0:
+            self.failures -= 1
+            raise OSError("download failed")
+        return object()
+
+
+def _wait_until(predicate, timeout: float = 2.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_concurrent_use_loads_once():
+    loader = Loader(delay=0.05)
+    lifecycle = ModelLifecycle(loader, name="m")
+    models = []
+
+    def use():
+        with lifecycle.use() as model:
+            models.append(model)
+
+    threads = [threading.Thread(target=use) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert loader.calls == 1
+    assert len({id(m) for m in models}) == 1
+
+
+def test_warm_up_loads_in_background():
+    lifecycle = ModelLifecycle(Loader(), name="m")
+    lifecycle.warm_up().join(2)
+
+    stats = lifecycle.stats()
+    assert stats["loaded"] is True
+    assert stats["loads"] == 1
+    assert stats["last_load_seconds"] is not None
+
+
+def test_idle_model_is_unloaded_and_reloaded():
+    """idle_timeout秒使われなければ解放し、次の利用で読み込み直す"""
+    loader = Loader()
+    lifecycle = ModelLifecycle(loader, name="m", idle_timeout=0.05)
+    with lifecycle.use():
+        pass
+
+    assert _wait_until(lambda: lifecycle.model is None)
+    assert lifecycle.stats()["unloads"] == 1
+
+    with lifecycle.use():
+        pass
+    assert loader.calls == 2
+
+
+def test_model_in_use_is_not_unloaded():
+    lifecycle = ModelLifecycle(Loader(), name="m", idle_timeout=0.05)
+    with lifecycle.use():
+        time.sleep(0.15)
+        assert lifecycle.model is not None
+        assert lifecycle.unload() is False
+
+    assert _wait_until(lambda: lifecycle.model is None)
+
+
+def test_load_failure_is_retried():
+    loader = Loader(failures=1)
+    lifecycle = ModelLifecycle(loader, name="m")
+
+    with pytest.raises(OSError, match="download"), lifecycle.use():
+        pass
+    assert lifecycle.stats()["last_error"] == "download failed"
+
+    with lifecycle.use() as model:
+        assert model is not None
+    assert lifecycle.stats()["last_error"] is None
@@ -0,0 +1,82 @@
+"""プロジェクト名キャッシュのテスト"""
+
+import os
+
+import pytest
+
+from mcp_brain.models import ProjectRegistry
+
+
+@pytest.fixture
+def pj(tmp_path):
+    (tmp_path / "my" / "alpha").mkdir(parents=True)
+    (tmp_path / "work" / "beta").mkdir(parents=True)
+    (tmp_path / "work" / ".hidden").mkdir()
+    (tmp_path / "my" / "file.txt").write_text("x")
+    return tmp_path
+
+
+def _touch_back(path, seconds=10):
+    """mtimeを過去にずらす（同じ時刻内の変更でもmtimeの差が出るように）"""
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns - seconds * 10**9))
+
+
+def test_scans_projects(pj):
+    registry = ProjectRegistry(pj)
+    assert registry.names() == {"alpha", "beta"}
+    assert registry.scans == 1
+
+
+def test_missing_base_dir(tmp_path):
+    registry = ProjectRegistry(tmp_path / "missing")
+    assert registry.names() == frozenset()
+
+
+def test_cached_within_ttl(pj):
+    """TTL以内はディレクトリが変わっても走査しない"""
+    registry = ProjectRegistry(pj, ttl=60)
+    registry.names()
+    (pj / "my" / "gamma").mkdir()
+
+    assert "gamma" not in registry.names()
+    assert registry.scans == 1
+
+
+def test_unchanged_dirs_are_not_rescanned(pj):
+    """TTL切れでもmtimeが変わっていなければ走査しない"""
+    registry = ProjectRegistry(pj, ttl=0)
+    registry.names()
+    registry.names()
+    assert registry.scans == 1
+
+
+def test_mtime_change_invalidates(pj):
+    registry = ProjectRegistry(pj, ttl=0)
+    _touch_back(pj / "my")
+    registry.names()
+
+    (pj / "my" / "gamma").mkdir()
+
+    assert "gamma" in registry.names()
+    assert registry.scans == 2
+
+
+def test_check_bypasses_ttl(pj):
+    """未知の名前の検証ではTTL以内でもmtimeを確認する"""
+    registry = ProjectRegistry(pj, ttl=60)
+    _touch_back(pj / "work")
+    registry.names()
+
+    (pj / "work" / "delta").mkdir()
+
+    assert "delta" in registry.names(check=True)
+
+
+def test_refresh(pj):
+    registry = ProjectRegistry(pj, ttl=60)
+    registry.names()
+    (pj / "my" / "alpha").rmdir()
+
+    assert registry.refresh() == {"beta"}
+    assert registry.stats()["scans"] == 2
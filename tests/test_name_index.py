@@ -0,0 +1,85 @@
+"""知識名の解決（トライ + bigram索引）のテスト"""
+
+import pytest
+
+from mcp_brain.name_index import NameIndex, edit_distance, normalize_name
+
+NAMES = [
+    "create-pr",
+    "review-pr",
+    "deploy-staging",
+    "deploy-production",
+    "git-commit",
+    "git-rebase",
+]
+
+
+@pytest.fixture
+def index():
+    index = NameIndex()
+    index.build(NAMES)
+    return index
+
+
+def test_normalize_name():
+    assert normalize_name(" Create_PR ") == "create-pr"
+    assert normalize_name("deploy  staging") == "deploy-staging"
+
+
+def test_edit_distance():
+    assert edit_distance("crate-pr", "create-pr") == 1
+    assert edit_distance("kitten", "sitting") == 3
+    assert edit_distance("", "abc") == 3
+
+
+def test_complete(index):
+    assert index.complete("deploy") == ["deploy-staging", "deploy-production"]
+    assert index.complete("git-") == ["git-commit", "git-rebase"]
+    assert index.complete("zzz") == []
+
+
+def test_within_matches_brute_force(index):
+    for query in ["crate-pr", "git-comit", "deploy-stage", "x"]:
+        expected = sorted(
+            (n, edit_distance(query, n)) for n in NAMES if edit_distance(query, n) <= 2
+        )
+        assert sorted(index.within(query, 2)) == expected
+
+
+def test_suggest(index):
+    assert index.suggest("crate-pr")[0] == "create-pr"
+    assert index.suggest("create-pr-x") == ["create-pr"]
+    assert index.suggest("deploy") == ["deploy-staging", "deploy-production"]
+    assert index.suggest("") == []
+
+
+def test_resolve(index):
+    assert index.resolve("Create_PR") == "create-pr"
+    assert index.resolve("git-comit") == "git-commit"
+    assert index.resolve("deploy-prod") == "deploy-production"
+    # 2つの名前に同じ距離で近い・前方一致が複数ある場合は解決しない
+    assert index.resolve("git-") is None
+    assert index.resolve("deploy") is None
+    assert index.resolve("something-else") is None
+
+
+def test_add_and_remove(index):
+    index.add("create-issue")
+    assert index.complete("create") == ["create-pr", "create-issue"]
+
+    index.remove_many(["create-pr", "missing"])
+    assert "create-pr" not in index
+    assert index.complete("create") == ["create-issue"]
+    assert all(name != "create-pr" for name, _ in index.within("create-pr", 3))
+
+    # 削除後の再追加も見つかる
+    index.add("create-pr")
+    assert index.resolve("crate-pr") == "create-pr"
+
+
+def test_remove_all(index):
+    index.remove_many(NAMES[:-1])
+    index.build(NAMES)
+    index.remove_many(NAMES)
+    assert len(index) == 0
+    assert index.suggest("git-rebase") == []
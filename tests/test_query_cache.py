@@ -0,0 +1,35 @@
+"""クエリキャッシュのテスト"""
+
+from mcp_brain.query_cache import LRUCache, normalize_query
+
+
+def test_normalize_query_collapses_whitespace_and_width() -> None:
+    assert normalize_query("  ＰＲ　を   作成 ") == "PR を 作成"
+
+
+def test_lru_evicts_least_recently_used() -> None:
+    cache = LRUCache(maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # aが最新になる
+    cache.put("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_lru_counts_hits_and_misses() -> None:
+    cache = LRUCache(maxsize=4)
+    cache.get("x")
+    cache.put("x", 1)
+    cache.get("x")
+    cache.get("x")
+
+    assert cache.stats() == {"hits": 2, "misses": 1, "size": 1, "maxsize": 4}
+
+
+def test_lru_zero_size_disables_cache() -> None:
+    cache = LRUCache(maxsize=0)
+    cache.put("a", 1)
+    assert cache.get("a") is None
@@ -1,5 +1,9 @@
 """MCPサーバーのテスト"""
 
+from datetime import date, timedelta
+
+import pytest
+
 from mcp_brain.models import Knowledge, KnowledgeSummary
 from mcp_brain.storage import KnowledgeStorage
 
@@ -85,6 +89,52 @@ class TestKnowledgeStorage:
         assert loaded.allowed_tools == "Bash"
 
 
+class TestKnowledgeCatalog:
+    """ストレージのメモリ上カタログのテスト"""
+
+    def test_unchanged_files_are_not_reparsed(self, tmp_path, monkeypatch):
+        """変更のないファイルは2回目以降パースしない"""
+        storage = KnowledgeStorage(tmp_path / "knowledge")
+        storage.save(Knowledge(name="a", description="A"))
+        storage.save(Knowledge(name="b", description="B"))
+
+        parsed: list[str] = []
+        original = KnowledgeStorage._parse_knowledge_file
+
+        def counting_parse(self, name, text):
+            parsed.append(name)
+            return original(self, name, text)
+
+        monkeypatch.setattr(KnowledgeStorage, "_parse_knowledge_file", counting_parse)
+        storage.list_all()
+        storage.load_all()
+        storage.load("a")
+        storage.get_stale()
+        assert sorted(parsed) == ["a", "b"]
+
+    def test_external_edit_is_detected(self, tmp_path):
+        """外部で書き換えられたファイル（mtime・サイズの変化）は読み直す"""
+        storage = KnowledgeStorage(tmp_path / "knowledge")
+        storage.save(Knowledge(name="a", description="before"))
+        assert storage.load("a").description == "before"
+
+        path = tmp_path / "knowledge" / "a.md"
+        path.write_text(path.read_text().replace("before", "after edit"))
+        assert storage.load("a").description == "after edit"
+
+        path.unlink()
+        assert storage.list_all() == []
+        assert storage.load("a") is None
+
+    def test_loaded_knowledge_is_a_copy(self, tmp_path):
+        """読み込んだ知識を書き換えてもカタログは変わらない"""
+        storage = KnowledgeStorage(tmp_path / "knowledge")
+        storage.save(Knowledge(name="a", description="A"))
+
+        storage.load("a").description = "changed"
+        assert storage.load("a").description == "A"
+
+
 class TestModels:
     """モデルのテスト"""
 
@@ -152,40 +202,6 @@ class TestProjectValidation:
             Knowledge(name="test", description="test", project="")
 
 
-class TestProjectSorting:
-    """プロジェクトソートのテスト"""
-
-    def test_project_sorting_logic(self):
-        """プロジェクト一致 → global → その他の順でソートされる"""
-        # KnowledgeSummaryは直接作成可能（バリデーションなし）
-        results = [
-            KnowledgeSummary(name="k1", description="other", project="jarvis"),
-            KnowledgeSummary(name="k2", description="global", project="global"),
-            KnowledgeSummary(
-                name="k3", description="matched", project="mcp-server-brain"
-            ),
-            KnowledgeSummary(name="k4", description="global2", project="global"),
-            KnowledgeSummary(
-                name="k5", description="matched2", project="mcp-server-brain"
-            ),
-        ]
-
-        project = "mcp-server-brain"
-
-        # ソートロジック（server.py と同じ）
-        matched = [r for r in results if r.project == project]
-        global_ = [r for r in results if r.project == "global"]
-        others = [r for r in results if r.project not in (project, "global")]
-        sorted_results = matched + global_ + others
-
-        # 検証: mcp-server-brain が先、次に global、最後に other
-        assert sorted_results[0].name == "k3"
-        assert sorted_results[1].name == "k5"
-        assert sorted_results[2].name == "k2"
-        assert sorted_results[3].name == "k4"
-        assert sorted_results[4].name == "k1"
-
-
 class TestProjectStorage:
     """プロジェクトフィールドのストレージテスト"""
 
@@ -226,3 +242,155 @@ created: 2025-01-01
         loaded = storage.load("old-knowledge")
         assert loaded is not None
         assert loaded.project == "global"
+
+
+class TestExpandRelated:
+    """関連知識の幅優先展開のテスト"""
+
+    class FakeSearch:
+        """固定の類似グラフを返す検索エンジン"""
+
+        def __init__(self, graph: dict[str, list[str]]) -> None:
+            self.graph = graph
+            self.calls: list[list[str]] = []
+
+        def find_similar_many(self, names, top_k=5):
+            self.calls.append(list(names))
+            return {
+                n: [
+                    (KnowledgeSummary(name=m, description=m), 0.5)
+                    for m in self.graph.get(n, [])[:top_k]
+                ]
+                for n in names
+            }
+
+    def _summaries(self, *names):
+        return [KnowledgeSummary(name=n, description=n) for n in names]
+
+    def test_one_batch_per_hop(self):
+        """各ホップの類似検索は1回にまとめられる"""
+        from mcp_brain.server import _expand_related
+
+        search = self.FakeSearch({"a": ["x", "root"], "b": ["x", "y"], "x": ["z"]})
+        related = _expand_related(search, self._summaries("a", "b"), 3, {"root"})
+
+        assert search.calls == [["a", "b"], ["x", "y"]]
+        assert [r["name"] for r in related] == ["a", "b"]
+        # 訪問済みは重複して展開しない
+        assert [r["name"] for r in related[0]["related"]] == ["x"]
+        assert [r["name"] for r in related[1]["related"]] == ["y"]
+        assert related[0]["related"][0]["related"][0]["name"] == "z"
+        assert related[0]["related"][0]["related"][0]["related"] == []
+
+    def test_hops_limits_depth(self):
+        """hops=1では1階層目のみ（類似検索なし）"""
+        from mcp_brain.server import _expand_related
+
+        search = self.FakeSearch({"a": ["x"]})
+        related = _expand_related(search, self._summaries("a"), 1, set())
+
+        assert related == [{"name": "a", "description": "a", "related": []}]
+        assert search.calls == []
+        assert _expand_related(search, self._summaries("a"), 0, set()) == []
+
+
+class TestServingModel:
+    """起動時に応答に使うモデルの選択"""
+
+    def test_uses_cached_model_until_migrated(self, tmp_path):
+        """設定したモデルのキャッシュがなければ既存キャッシュのモデルで応答する"""
+        import numpy as np
+
+        from mcp_brain.index_cache import IndexCache
+        from mcp_brain.server import _serving_model
+
+        assert _serving_model(tmp_path, "new") == "new"
+
+        IndexCache(tmp_path, "old").save({"a": np.ones(4)}, {"a": "da"})
+        assert _serving_model(tmp_path, "new") == "old"
+
+        IndexCache(tmp_path, "new").save({"a": np.ones(4)}, {"a": "da"})
+        assert _serving_model(tmp_path, "new") == "new"
+
+
+class TestNameResolution:
+    """存在しない知識名の「もしかして」と自動解決"""
+
+    @pytest.fixture
+    def server(self, tmp_path, monkeypatch):
+        from mcp_brain import server
+        from mcp_brain.search import SemanticSearch
+
+        storage = KnowledgeStorage(tmp_path / "knowledge")
+        storage.save(Knowledge(name="create-pr", description="PRを作成"))
+        storage.save(Knowledge(name="review-pr", description="PRをレビュー"))
+        search = SemanticSearch()
+        search.name_index.build(["create-pr", "review-pr"])
+        monkeypatch.setattr(server, "storage", storage)
+        monkeypatch.setattr(server, "search_engine", search)
+        return server
+
+    def test_not_found_suggests_names(self, server):
+        with pytest.raises(ValueError, match=r"Did you mean: create-pr\?"):
+            server._load_or_suggest("crate-pr", resolve=True)
+
+    def test_no_suggestion_for_unrelated_name(self, server):
+        with pytest.raises(ValueError, match=r"not found$"):
+            server._load_or_suggest("something-else")
+
+    def test_auto_resolve_is_opt_in(self, server, monkeypatch):
+        monkeypatch.setattr(server, "auto_resolve_names", True)
+
+        assert server._load_or_suggest("crate-pr", resolve=True).name == "create-pr"
+        # forgetは自動解決しない
+        with pytest.raises(ValueError, match="Did you mean"):
+            server._load_or_suggest("crate-pr")
+
+
+class TestStaleCheck:
+    """起動後の忘却チェック（ダイアログ待ちは接続を止めない）"""
+
+    @pytest.fixture
+    def server(self, tmp_path, monkeypatch):
+        from mcp_brain import server
+        from mcp_brain.executor import ToolExecutor
+        from mcp_brain.search import SemanticSearch
+        from mcp_brain.sync import GitSyncWorker
+        from mcp_brain.usage import UsageJournal
+
+        storage = KnowledgeStorage(tmp_path / "knowledge")
+        old = date.today() - timedelta(days=60)
+        for name in ("old-a", "old-b", "fresh"):
+            created = date.today() if name == "fresh" else old
+            storage.save(Knowledge(name=name, description=name, created=created))
+        monkeypatch.setattr(server, "storage", storage)
+        monkeypatch.setattr(server, "search_engine", SemanticSearch())
+        monkeypatch.setattr(server, "usage_journal", UsageJournal(tmp_path / "u.jsonl"))
+        monkeypatch.setattr(server, "git_sync", GitSyncWorker(git=None))
+        monkeypatch.setattr(server, "executor", ToolExecutor())
+        return server
+
+    def test_deletes_through_sync_queue(self, server, monkeypatch):
+        shown: list[list[str]] = []
+
+        def dialog(names: list[str]) -> bool:
+            shown.append(names)
+            # ダイアログを待つ間に使われた知識は削除しない
+            server.usage_journal.record("old-b")
+            return True
+
+        monkeypatch.setattr(server, "show_stale_dialog", dialog)
+        server._stale_check()
+        server.executor.shutdown()
+
+        assert shown == [["old-a", "old-b"]]
+        assert {k.name for k in server.storage.list_all()} == {"fresh", "old-b"}
+        assert server.git_sync._pending == {"old-a": "forget"}
+
+    def test_keep_when_declined(self, server, monkeypatch):
+        monkeypatch.setattr(server, "show_stale_dialog", lambda _names: False)
+        server._stale_check()
+        server.executor.shutdown()
+
+        assert len(server.storage.list_all()) == 3
+        assert server.git_sync._pending == {}
@@ -0,0 +1,63 @@
+"""k近傍グラフのテスト"""
+
+import numpy as np
+
+from mcp_brain.similarity_graph import SimilarityGraph
+from mcp_brain.vector_store import VectorStore
+
+
+def _names(neighbors):
+    return [n for n, _ in neighbors]
+
+
+def _assert_matches_full_build(graph, store):
+    """差分更新の結果が全体再構築と一致する"""
+    expected = SimilarityGraph(k=graph.k)
+    expected.build(store)
+    assert set(graph.neighbors) == set(expected.neighbors)
+    for name, neighbors in expected.neighbors.items():
+        assert _names(graph.neighbors[name]) == _names(neighbors), name
+
+
+class TestSimilarityGraph:
+    """SimilarityGraphのテスト"""
+
+    def _store(self, n=50, seed=0):
+        rng = np.random.default_rng(seed)
+        store = VectorStore()
+        store.reset({f"k{i}": rng.normal(size=8) for i in range(n)})
+        return store
+
+    def test_build_excludes_self(self):
+        store = self._store()
+        graph = SimilarityGraph(k=5)
+        graph.build(store)
+
+        for name, neighbors in graph.neighbors.items():
+            assert len(neighbors) == 5
+            assert name not in _names(neighbors)
+        expected = [n for n, _ in store.top_k(store.get("k0"), 6) if n != "k0"]
+        assert _names(graph.get("k0", 5)) == expected[:5]
+
+    def test_incremental_updates_match_full_build(self):
+        rng = np.random.default_rng(1)
+        store = self._store()
+        graph = SimilarityGraph(k=5, block_size=16)
+        graph.build(store)
+
+        for i in range(20):
+            store.upsert(f"new{i}", rng.normal(size=8))
+            graph.upsert(store, f"new{i}")
+        for name in ["k1", "k2", "new3"]:
+            store.remove(name)
+            graph.remove(store, name)
+        # 既存文書の更新
+        store.upsert("k10", rng.normal(size=8))
+        graph.upsert(store, "k10")
+
+        _assert_matches_full_build(graph, store)
+
+    def test_get_beyond_k_returns_none(self):
+        graph = SimilarityGraph(k=3)
+        graph.build(self._store(n=10))
+        assert graph.get("k0", 4) is None
@@ -0,0 +1,41 @@
+"""起動時間の計測と遅延importのテスト"""
+
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from mcp_brain.startup import StartupProfile
+
+SRC_DIR = Path(__file__).resolve().parents[1] / "src"
+
+
+def test_phases_are_recorded():
+    profile = StartupProfile(time.perf_counter())
+    with profile.phase("index"):
+        pass
+    profile.record("git", 0.5)
+    profile.record("git", 0.25)
+    profile.mark_ready()
+
+    report = profile.report()
+    assert report["ready"] is not None
+    assert report["phases"]["git"] == 0.75
+    assert set(report["phases"]) == {"index", "git"}
+
+
+def test_server_import_does_not_load_model_libraries():
+    """サーバーの読み込み時点ではsentence-transformers/torchを読み込まない"""
+    code = (
+        "import sys, mcp_brain.server\n"
+        "from mcp_brain.startup import HEAVY_MODULES\n"
+        "print(','.join(m for m in HEAVY_MODULES if m in sys.modules))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+        env={"PYTHONPATH": str(SRC_DIR), "HOME": str(Path.home())},
+    )
+    assert result.stdout.strip() == ""
@@ -0,0 +1,306 @@
+"""Git同期キューのテスト"""
+
+import threading
+import time
+from pathlib import Path
+
+import pytest
+from git import Repo
+
+from mcp_brain.git import USAGE_CHANGE, USAGE_DIR, GitManager, GitOperationError
+from mcp_brain.index_cache import CACHE_WRITE_LOCK
+from mcp_brain.sync import GitSyncWorker
+
+
+class FakeGit:
+    def __init__(self, *, push_failures: int = 0) -> None:
+        self.commits: list[list[tuple[str, str]]] = []
+        self.busy: list[set[str]] = []
+        self.pushes = 0
+        self._push_failures = push_failures
+        self.block = threading.Event()
+        self.block.set()
+
+    def commit_changes(self, changes, busy=None) -> None:  # noqa: ANN001
+        self.block.wait(5)
+        self.busy.append(set(busy()) if busy else set())
+        self.commits.append(list(changes))
+
+    def push(self) -> None:
+        if self._push_failures > 0:
+            self._push_failures -= 1
+            raise GitOperationError("push rejected")
+        self.pushes += 1
+
+
+@pytest.fixture
+def fake_git() -> FakeGit:
+    return FakeGit()
+
+
+def test_changes_are_coalesced_into_one_commit(fake_git) -> None:
+    """デバウンス中の変更は1コミットにまとまり、同名は最後の操作になる"""
+    worker = GitSyncWorker(fake_git, debounce=0.2)
+    worker.start()
+    try:
+        worker.enqueue("a", "create")
+        worker.enqueue("b", "create")
+        worker.enqueue("a", "update")
+        assert worker.status()["pending"] == 2
+        assert worker.flush(timeout=5)
+    finally:
+        worker.stop()
+
+    assert fake_git.commits == [[("b", "create"), ("a", "update")]]
+    assert fake_git.pushes == 1
+    status = worker.status()
+    assert status["pending"] == 0
+    assert status["last_sync"] is not None
+    assert status["last_error"] is None
+
+
+def test_enqueue_returns_while_commit_is_running(fake_git) -> None:
+    """コミット中でも登録はすぐ返り、次のバッチに入る"""
+    fake_git.block.clear()
+    worker = GitSyncWorker(fake_git, debounce=0)
+    worker.start()
+    try:
+        worker.enqueue("a", "create")
+        worker.enqueue("b", "create")
+        fake_git.block.set()
+        assert worker.flush(timeout=5)
+    finally:
+        worker.stop()
+
+    assert [c for batch in fake_git.commits for c in batch] == [
+        ("a", "create"),
+        ("b", "create"),
+    ]
+
+
+def test_push_failure_is_retried_with_backoff() -> None:
+    """push失敗は記録され、バックオフ後に再試行される"""
+    git = FakeGit(push_failures=2)
+    worker = GitSyncWorker(git, debounce=0, base_backoff=0.01)
+    worker.start()
+    try:
+        worker.enqueue("a", "create")
+        assert worker.flush(timeout=5)
+    finally:
+        worker.stop()
+
+    assert len(git.commits) == 1
+    assert git.pushes == 1
+    assert worker.status()["consecutive_failures"] == 0
+
+
+def test_stop_syncs_remaining_changes(fake_git) -> None:
+    """停止時にデバウンス中の変更も同期する"""
+    worker = GitSyncWorker(fake_git, debounce=60)
+    worker.start()
+    worker.enqueue("a", "forget")
+    worker.stop()
+
+    assert fake_git.commits == [[("a", "forget")]]
+    assert fake_git.pushes == 1
+
+
+def test_track_registers_change_on_success(fake_git) -> None:
+    """trackを正常に抜けたら登録し、書き込み中・コミット待ちは同期から外す"""
+    worker = GitSyncWorker(fake_git, debounce=60)
+    with worker.track("a", "create"):
+        assert worker._busy() == {"a"}
+        assert worker.status()["pending"] == 0
+    assert worker.status()["pending"] == 1
+
+    with pytest.raises(OSError, match="disk full"), worker.track("b", "create"):
+        raise OSError("disk full")
+    assert worker._busy() == {"a"}
+
+
+@pytest.fixture
+def git_repo(tmp_path) -> Path:
+    """origin（bare）にpush済みの知識リポジトリ"""
+    origin = tmp_path / "origin.git"
+    Repo.init(origin, bare=True)
+    path = tmp_path / "brain"
+    repo = Repo.init(path)
+    with repo.config_writer() as config:
+        config.set_value("user", "name", "test")
+        config.set_value("user", "email", "test@example.com")
+    repo.create_remote("origin", str(origin))
+    (path / "knowledge").mkdir()
+    (path / "README.md").write_text("brain")
+    repo.index.add(["README.md"])
+    repo.index.commit("init")
+    repo.git.push("-u", "origin", "HEAD")
+    return path
+
+
+def _push_from_other_clone(git_repo: Path, path: str, text: str) -> None:
+    """別の端末（clone）からoriginへ先にpushしておく（ローカルとは分岐する）"""
+    other = Repo.clone_from(git_repo.parent / "origin.git", git_repo.parent / "other")
+    with other.config_writer() as config:
+        config.set_value("user", "name", "other")
+        config.set_value("user", "email", "other@example.com")
+    (Path(other.working_dir) / path).parent.mkdir(parents=True, exist_ok=True)
+    (Path(other.working_dir) / path).write_text(text)
+    other.index.add([path])
+    other.index.commit(f"other: {path}")
+    other.git.push("origin", "HEAD")
+
+
+def test_rejected_push_is_rebased_and_retried(git_repo) -> None:
+    """non-fast-forwardで拒否されたpushは、pull --rebase してからpushし直す"""
+    _push_from_other_clone(git_repo, "knowledge/theirs.md", "theirs")
+    manager = GitManager(git_repo)
+    (git_repo / "knowledge" / "mine.md").write_text("mine")
+    worker = GitSyncWorker(manager, debounce=0)
+    worker.start()
+    try:
+        worker.enqueue("mine", "create")
+        assert worker.flush(timeout=10)
+    finally:
+        worker.stop()
+
+    assert worker.status()["unpushed"] is False
+    branch = manager.repo.active_branch.name
+    assert manager.repo.git.rev_list("--count", f"origin/{branch}..HEAD") == "0"
+    assert (git_repo / "knowledge" / "theirs.md").exists()
+
+
+def test_rebase_keeps_uncommitted_usage_journal(git_repo) -> None:
+    """利用記録が未コミットでも（getのたびに追記される）pull --rebaseできる"""
+    manager = GitManager(git_repo)
+    journal = git_repo / USAGE_DIR / "host-a.jsonl"
+    journal.parent.mkdir(parents=True)
+    journal.write_text('{"n": "a", "d": "2025-01-01", "c": 1}\n')
+    manager.commit_changes([(USAGE_CHANGE, "usage")])
+    manager.push()
+
+    _push_from_other_clone(git_repo, "knowledge/theirs.md", "theirs")
+    (git_repo / "knowledge" / "mine.md").write_text("mine")
+    manager.commit_changes([("mine", "create")])
+    dirty = journal.read_text() + '{"n": "a", "d": "2025-01-02", "c": 1}\n'
+    journal.write_text(dirty)
+
+    manager.push()
+
+    branch = manager.repo.active_branch.name
+    assert manager.repo.git.rev_list("--count", f"origin/{branch}..HEAD") == "0"
+    assert (git_repo / "knowledge" / "theirs.md").exists()
+    assert journal.read_text() == dirty
+
+
+def test_rejected_push_is_reported_and_retried(git_repo) -> None:
+    """rebaseでも解決できない拒否は失敗として状態に残し、再試行する"""
+    _push_from_other_clone(git_repo, "knowledge/same.md", "theirs")
+    manager = GitManager(git_repo)
+    (git_repo / "knowledge" / "same.md").write_text("mine")
+    worker = GitSyncWorker(manager, debounce=0, base_backoff=60)
+    worker.start()
+    try:
+        worker.enqueue("same", "create")
+        deadline = time.monotonic() + 10
+        while not worker.status()["consecutive_failures"]:
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
+        status = worker.status()
+    finally:
+        worker.stop(timeout=1)
+
+    assert status["unpushed"] is True
+    assert status["consecutive_failures"] >= 1
+    assert "Push failed" in status["last_error"]
+
+
+def test_create_during_sync_is_not_committed_as_manual(git_repo, monkeypatch) -> None:
+    """同期中に書き込まれた知識は手動変更ではなく、自分のコミットに入る"""
+    manager = GitManager(git_repo)
+    worker = GitSyncWorker(manager, debounce=0)
+    written, release = threading.Event(), threading.Event()
+
+    def second_create() -> None:
+        with worker.track("second-one", "create"):
+            (git_repo / "knowledge" / "second-one.md").write_text("second")
+            written.set()
+            # エンコードなどで登録が遅れる
+            release.wait(5)
+
+    second = threading.Thread(target=second_create)
+    original = manager._commit_manual_changes
+
+    def racing(*args, **kwargs) -> None:  # noqa: ANN002, ANN003
+        if not second.is_alive() and not written.is_set():
+            second.start()
+            written.wait(5)
+        original(*args, **kwargs)
+
+    monkeypatch.setattr(manager, "_commit_manual_changes", racing)
+    (git_repo / "notes.md").write_text("manual edit")
+    worker.start()
+    try:
+        with worker.track("first-one", "create"):
+            (git_repo / "knowledge" / "first-one.md").write_text("first")
+        assert worker.flush(timeout=10)
+        release.set()
+        second.join(5)
+        assert worker.flush(timeout=10)
+    finally:
+        worker.stop()
+
+    commits = {
+        c.message.splitlines()[0]: sorted(c.stats.files)
+        for c in manager.repo.iter_commits()
+    }
+    assert commits == {
+        "init": ["README.md"],
+        "manual: uncommitted changes": ["notes.md"],
+        "create: first-one": ["knowledge/first-one.md"],
+        "create: second-one": ["knowledge/second-one.md"],
+    }
+
+
+def test_usage_change_commits_only_when_journal_changed(git_repo) -> None:
+    """利用記録だけの同期は、ジャーナルが変わったときだけコミットする"""
+    manager = GitManager(git_repo)
+    journal = git_repo / USAGE_DIR / "host-a.jsonl"
+    journal.parent.mkdir(parents=True)
+    journal.write_text('{"n": "a", "d": "2025-01-01", "c": 1}\n')
+
+    manager.commit_changes([(USAGE_CHANGE, "usage")])
+    manager.commit_changes([(USAGE_CHANGE, "usage")])
+
+    messages = [c.message for c in manager.repo.iter_commits()]
+    assert messages == ["usage: update usage records", "init"]
+    assert f"{USAGE_DIR}/host-a.jsonl" in manager.repo.head.commit.stats.files
+
+
+def test_index_cache_staging_skips_temp_files_and_waits_for_writes(git_repo) -> None:
+    """.index の一時ファイルはコミットせず、ステージングは書き込みの完了を待つ"""
+    manager = GitManager(git_repo)
+    cache = git_repo / ".index" / "m"
+    cache.mkdir(parents=True)
+    (cache / "meta.json").write_text("{}")
+    (cache / "vectors.tmp").write_bytes(b"partial")
+    (git_repo / "knowledge" / "a.md").write_text("a")
+
+    committed = threading.Event()
+
+    def commit() -> None:
+        manager.commit_changes([("a", "create")])
+        committed.set()
+
+    with CACHE_WRITE_LOCK:
+        thread = threading.Thread(target=commit)
+        thread.start()
+        assert not committed.wait(0.5)
+        # 書き込み中に追記された行もまとめてコミットされる
+        (cache / "log.jsonl").write_text('{"op": "del", "name": "x"}\n')
+    thread.join(5)
+
+    assert sorted(manager.repo.head.commit.stats.files) == [
+        ".index/m/log.jsonl",
+        ".index/m/meta.json",
+        "knowledge/a.md",
+    ]
@@ -0,0 +1,116 @@
+"""利用記録ジャーナルのテスト"""
+
+from datetime import date, timedelta
+
+from mcp_brain.models import Knowledge
+from mcp_brain.storage import KnowledgeStorage
+from mcp_brain.usage import UsageJournal
+
+
+def test_record_and_replay(tmp_path) -> None:
+    """追記した記録は再起動後に再生される"""
+    path = tmp_path / "usage.jsonl"
+    journal = UsageJournal(path)
+    journal.record("a", date(2025, 1, 1))
+    journal.record("a", date(2025, 1, 3))
+    journal.record("a", date(2025, 1, 2))
+    journal.record("b", date(2025, 1, 1))
+    journal.forget(["b"])
+
+    replayed = UsageJournal(path)
+    assert replayed.last_used("a") == date(2025, 1, 3)
+    assert replayed.count("a") == 3
+    assert replayed.last_used("b") is None
+    assert len(path.read_text().splitlines()) == 5
+
+
+def test_compaction_keeps_records(tmp_path) -> None:
+    """しきい値を超えるとスナップショットに書き直される"""
+    path = tmp_path / "usage.jsonl"
+    journal = UsageJournal(path, compact_threshold=10)
+    for i in range(25):
+        journal.record(f"k{i % 3}", date(2025, 1, 1) + timedelta(days=i))
+
+    assert len(path.read_text().splitlines()) <= 10
+    replayed = UsageJournal(path)
+    assert {n: replayed.count(n) for n in ("k0", "k1", "k2")} == {
+        "k0": 9,
+        "k1": 8,
+        "k2": 8,
+    }
+    assert replayed.last_used("k0") == date(2025, 1, 25)
+
+
+def test_broken_line_is_skipped(tmp_path) -> None:
+    """壊れた行（書き込み途中の終了など）は読み飛ばす"""
+    path = tmp_path / "usage.jsonl"
+    path.write_text('{"n": "a", "d": "2025-01-01", "c": 2}\n{"n": "b", "d"\n')
+    journal = UsageJournal(path)
+    assert journal.count("a") == 2
+    assert journal.last_used("b") is None
+
+
+def test_get_stale_uses_journal_without_touching_files(tmp_path) -> None:
+    """利用記録があれば古い知識とみなさず、知識ファイルは書き換えない"""
+    storage = KnowledgeStorage(tmp_path / "knowledge")
+    old = date.today() - timedelta(days=60)
+    for name in ("used", "unused"):
+        storage.save(Knowledge(name=name, description=name, created=old))
+    before = (tmp_path / "knowledge" / "used.md").read_text()
+
+    journal = UsageJournal(tmp_path / "usage.jsonl")
+    journal.record("used")
+
+    stale = storage.get_stale(threshold_days=30, usage=journal)
+    assert [k.name for k in stale] == ["unused"]
+    assert (tmp_path / "knowledge" / "used.md").read_text() == before
+
+
+def test_merges_other_machines(tmp_path) -> None:
+    """他の端末のジャーナルもマージし、書き込むのは自分のファイルだけ"""
+    usage_dir = tmp_path / "usage"
+    UsageJournal(usage_dir / "host-b.jsonl").record("a", date(2025, 1, 5))
+    peer = UsageJournal(usage_dir / "host-c.jsonl")
+    peer.record("a", date(2025, 1, 2))
+    peer.record("b", date(2025, 1, 1))
+    before = (usage_dir / "host-b.jsonl").read_text()
+
+    journal = UsageJournal(usage_dir / "host-a.jsonl", peers_dir=usage_dir)
+    journal.record("a", date(2025, 1, 3))
+    assert journal.last_used("a") == date(2025, 1, 5)
+    assert journal.count("a") == 3
+    assert journal.last_used("b") == date(2025, 1, 1)
+    assert (usage_dir / "host-b.jsonl").read_text() == before
+
+
+def test_removal_hides_older_records_of_other_machines(tmp_path) -> None:
+    """削除日より前の他端末の記録は無視し、削除後の利用は残す"""
+    usage_dir = tmp_path / "usage"
+    peer = UsageJournal(usage_dir / "host-b.jsonl")
+    peer.record("a", date(2025, 1, 1))
+    peer.record("b", date(2025, 1, 1))
+    peer.record("b", date(2025, 3, 1))
+
+    journal = UsageJournal(usage_dir / "host-a.jsonl", peers_dir=usage_dir)
+    journal.record("a", date(2025, 1, 1))
+    journal.forget(["a", "b"], day=date(2025, 2, 1))
+    assert journal.last_used("a") is None
+
+    # 別の端末から見ても、削除日より後の利用だけが残る
+    other = UsageJournal(usage_dir / "host-c.jsonl", peers_dir=usage_dir)
+    assert other.last_used("a") is None
+    assert other.last_used("b") == date(2025, 3, 1)
+
+
+def test_compaction_keeps_removals(tmp_path) -> None:
+    """コンパクション後も削除行が残り、他端末の古い記録を打ち消す"""
+    usage_dir = tmp_path / "usage"
+    UsageJournal(usage_dir / "host-b.jsonl").record("a", date(2025, 1, 1))
+    journal = UsageJournal(usage_dir / "host-a.jsonl", peers_dir=usage_dir)
+    journal.forget(["a"], day=date(2025, 2, 1))
+    journal.record("b", date(2025, 2, 1))
+    journal.compact()
+
+    other = UsageJournal(usage_dir / "host-c.jsonl", peers_dir=usage_dir)
+    assert other.last_used("a") is None
+    assert other.count("b") == 1
@@ -0,0 +1,126 @@
+"""ベクトル行列ストアのテスト"""
+
+import numpy as np
+import pytest
+
+from mcp_brain.vector_store import VectorStore
+
+
+def _brute_force(vectors, query, top_k):
+    """参照実装: ループでコサイン類似度を計算"""
+    results = []
+    for name, v in vectors.items():
+        score = float(np.dot(query, v) / (np.linalg.norm(query) * np.linalg.norm(v)))
+        results.append((name, score))
+    results.sort(key=lambda x: x[1], reverse=True)
+    return results[:top_k]
+
+
+class TestVectorStore:
+    """VectorStoreのテスト"""
+
+    @pytest.fixture
+    def vectors(self):
+        rng = np.random.default_rng(0)
+        return {f"k{i}": rng.normal(size=16).astype(np.float32) for i in range(100)}
+
+    def test_top_k_matches_brute_force(self, vectors):
+        """ループ実装と同じ順位・スコアになる"""
+        store = VectorStore()
+        store.reset(vectors)
+        query = np.random.default_rng(1).normal(size=16)
+
+        results = store.top_k(query, 10)
+        expected = _brute_force(vectors, query, 10)
+
+        assert [n for n, _ in results] == [n for n, _ in expected]
+        np.testing.assert_allclose(
+            [s for _, s in results], [s for _, s in expected], rtol=1e-5
+        )
+
+    def test_upsert_and_remove(self, vectors):
+        """追加・上書き・削除が検索結果に反映される"""
+        store = VectorStore()
+        for name, v in vectors.items():
+            store.upsert(name, v)
+        assert len(store) == 100
+
+        query = vectors["k5"]
+        assert store.top_k(query, 1)[0][0] == "k5"
+
+        store.remove("k5")
+        assert "k5" not in store
+        assert all(n != "k5" for n, _ in store.top_k(query, 100))
+
+        # 空き行が再利用される
+        store.upsert("new", query)
+        assert store.row_of("new") is not None
+        assert store.top_k(query, 1)[0][0] == "new"
+        assert len(store) == 100
+
+    def test_top_k_larger_than_size(self, vectors):
+        """top_kが件数より大きくても有効件数だけ返す"""
+        store = VectorStore()
+        store.reset(dict(list(vectors.items())[:3]))
+        store.remove("k0")
+        assert len(store.top_k(vectors["k1"], 10)) == 2
+
+    def test_mask(self, vectors):
+        """マスク外の行は返さない"""
+        store = VectorStore()
+        store.reset(vectors)
+        mask = np.zeros(store.matrix.shape[0], dtype=bool)
+        mask[store.row_of("k3")] = True
+        assert [n for n, _ in store.top_k(vectors["k9"], 5, mask=mask)] == ["k3"]
+
+    def test_top_k_rows(self, vectors):
+        """指定した行だけの上位k件は全件検索をその行に絞った結果と一致"""
+        store = VectorStore()
+        store.reset(vectors)
+        rows = np.array([store.row_of(n) for n in ("k1", "k4", "k7", "k8")])
+        mask = np.zeros(store.matrix.shape[0], dtype=bool)
+        mask[rows] = True
+
+        expected = store.top_k(vectors["k4"], 2, mask=mask)
+        assert store.top_k_rows(vectors["k4"], rows, 2) == pytest.approx(expected)
+        assert store.top_k_rows(vectors["k4"], rows[:0], 2) == []
+
+    def test_attach_uses_matrix_without_copy(self, vectors):
+        """attachした行列はコピーせずに使い、空き行は再利用される"""
+        store = VectorStore()
+        store.reset(vectors)
+        matrix = store.matrix[:3].copy()
+
+        attached = VectorStore()
+        attached.attach(matrix, ["k0", None, "k2"])
+        assert attached.matrix is matrix
+        assert len(attached) == 2
+        assert attached.top_k(vectors["k2"], 1)[0][0] == "k2"
+
+        assert attached.upsert("new", vectors["k5"]) == 1
+
+    def test_copy_keeps_rows(self, vectors):
+        """複製は行番号が同じで、元のストアの変更の影響を受けない"""
+        store = VectorStore()
+        store.reset(vectors)
+        store.remove("k3")
+
+        copied = store.copy()
+        store.upsert("k0", vectors["k1"])
+        store.upsert("new", vectors["k2"])
+
+        assert copied.row_of("k10") == store.row_of("k10")
+        assert "k3" not in copied
+        assert "new" not in copied
+        assert copied.top_k(vectors["k0"], 1)[0][0] == "k0"
+
+    def test_dimension_mismatch(self):
+        """次元の異なるベクトルはエラー"""
+        store = VectorStore()
+        store.upsert("a", np.ones(4))
+        with pytest.raises(ValueError, match="dimension mismatch"):
+            store.upsert("b", np.ones(8))
+
+    def test_empty(self):
+        """空ストアは空を返す"""
+        assert VectorStore().top_k(np.ones(4), 5) == []